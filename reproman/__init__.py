@@ -37,15 +37,9 @@ atexit.register(lgr.log, 5, "Exiting")
 
 from .version import __version__
 
-try:
-    import etelemetry
-
-    etelemetry.check_available_version("repronim/reproman", __version__, lgr=lgr)
-except Exception as exc:
-    lgr.debug(
-        "Failed to check for a more recent version available with etelemetry: %s",
-        exc,
-    )
+# OPT: The check for a more recent version (see
+# reproman.support.version_check) is started by the command line interface
+# rather than here, so that importing reproman never waits on the network.
 
 
 def test(package="reproman", **kwargs):
@@ -8,36 +8,51 @@
 """Python ReproMan API exposing user-oriented commands (also available via CLI)"""
 
 
-def _generate_func_api():
-    """Auto detect all available interfaces and generate a function-based
-    API from them
-    """
+def _get_interface_specs():
+    """Map the API names of all available interfaces to their specification"""
+    from .interface.base import get_api_name
+    from .interface.base import get_interface_groups
+
+    return {
+        get_api_name(intfspec): intfspec
+        for grp_name, grp_descr, interfaces in get_interface_groups()
+        for intfspec in interfaces
+    }
+
+
+def _generate_func(intfspec):
+    """Generate the function-based API of an interface"""
     from importlib import import_module
     from .interface.base import update_docstring_with_parameters
-    from .interface.base import get_interface_groups
-    from .interface.base import get_api_name
     from .interface.base import alter_interface_docs_for_api
 
-    for grp_name, grp_descr, interfaces in get_interface_groups():
-        for intfspec in interfaces:
-            # turn the interface spec into an instance
-            mod = import_module(intfspec[0], package="reproman")
-            intf = getattr(mod, intfspec[1])
-            spec = getattr(intf, "_params_", dict())
-
-            # FIXME no longer using an interface class instance
-            # convert the parameter SPEC into a docstring for the function
-            update_docstring_with_parameters(
-                intf.__call__,
-                spec,
-                prefix=alter_interface_docs_for_api(intf.__doc__),
-                suffix=alter_interface_docs_for_api(intf.__call__.__doc__),
-            )
-            globals()[get_api_name(intfspec)] = intf.__call__
-
-
-# Invoke above helpers
-_generate_func_api()
-
-# Be nice and clean up the namespace properly
-del _generate_func_api
+    # turn the interface spec into an instance
+    mod = import_module(intfspec[0], package="reproman")
+    intf = getattr(mod, intfspec[1])
+    spec = getattr(intf, "_params_", dict())
+
+    # FIXME no longer using an interface class instance
+    # convert the parameter SPEC into a docstring for the function
+    update_docstring_with_parameters(
+        intf.__call__,
+        spec,
+        prefix=alter_interface_docs_for_api(intf.__doc__),
+        suffix=alter_interface_docs_for_api(intf.__call__.__doc__),
+    )
+    return intf.__call__
+
+
+# OPT: Interface modules are imported when their function is first accessed
+# rather than along with this module.
+def __getattr__(name):
+    intfspec = _get_interface_specs().get(name)
+    if intfspec is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    func = globals()[name] = _generate_func(intfspec)
+    return func
+
+
+def __dir__():
+    # Hide the helpers above.
+    names = [n for n in globals() if not n.startswith("_") or n.endswith("__")]
+    return sorted(set(names).union(_get_interface_specs()))
@@ -15,10 +15,13 @@ import subprocess
 import sys
 import logging
 import os
+import queue
 import shutil
 import shlex
 import atexit
 import functools
+import threading
+from collections import deque
 
 from os.path import abspath, isabs
 
@@ -37,6 +40,47 @@ lgr = logging.getLogger("reproman.cmd")
 
 _TEMP_std = sys.stdout, sys.stderr
 
+# Maximal number of bytes read from a pipe at once, and length of the pieces
+# longer lines are handled in
+_READ_SIZE = 65536
+
+
+class _OutputBuffer(object):
+    """Collects chunks of output, keeping only the last `max_size` bytes
+
+    Chunks are joined only once, when the value is requested.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.ndropped = 0
+        self._chunks = deque()
+        self._size = 0
+
+    def append(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        if self.max_size is not None:
+            # Keep enough chunks to cover the last `max_size` bytes.
+            while len(self._chunks) > 1 and self._size - len(self._chunks[0]) >= self.max_size:
+                dropped = self._chunks.popleft()
+                self._size -= len(dropped)
+                self.ndropped += len(dropped)
+
+    def getvalue(self):
+        value = b"".join(self._chunks)
+        if self.max_size is not None and len(value) > self.max_size:
+            self.ndropped += len(value) - self.max_size
+            value = value[len(value) - self.max_size :]
+        if self.ndropped:
+            # Don't start in the middle of a UTF-8 encoded character.
+            start = 0
+            while start < min(3, len(value)) and value[start] & 0xC0 == 0x80:
+                start += 1
+            self.ndropped += start
+            value = value[start:]
+        return value
+
 
 class Runner(object):
     """Provides a wrapper for calling functions and commands.
@@ -132,33 +176,93 @@ class Runner(object):
             )
 
     def _get_output_online(
-        self, proc, log_stdout, log_stderr, expect_stderr=False, expect_fail=False
+        self,
+        proc,
+        log_stdout,
+        log_stderr,
+        expect_stderr=False,
+        expect_fail=False,
+        stdout_callback=None,
+        stderr_callback=None,
+        max_output_size=None,
     ):
-        stdout, stderr = bytes(), bytes()
-        while proc.poll() is None:
-            if log_stdout:
-                line = proc.stdout.readline()
-                if line:
-                    stdout += line
-                    self._log_out(line.decode())
-                    # TODO: what level to log at? was: level=5
-                    # Changes on that should be properly adapted in
-                    # test.cmd.test_runner_log_stdout()
-            else:
-                pass
-
-            if log_stderr:
-                line = proc.stderr.readline()
-                if line:
-                    stderr += line
-                    self._log_err(line.decode(), expect_stderr or expect_fail)
-                    # TODO: what's the proper log level here?
-                    # Changes on that should be properly adapted in
-                    # test.cmd.test_runner_log_stderr()
+        # Each pipe is read by its own thread, so a pipe filling up while we
+        # wait for the other one cannot block the process.  Chunks are passed
+        # back to handle their lines (log, call callbacks) in the calling
+        # thread.  They are read up to a fixed size rather than as whole
+        # lines, so that a long line is not held in memory whole.
+        chunks = queue.Queue()
+
+        def read(name, pipe):
+            try:
+                for chunk in iter(functools.partial(pipe.read1, _READ_SIZE), b""):
+                    chunks.put((name, chunk))
+            finally:
+                pipe.close()
+                chunks.put((name, None))
+
+        pipes = {}
+        if log_stdout:
+            pipes["stdout"] = proc.stdout
+        if log_stderr:
+            pipes["stderr"] = proc.stderr
+        readers = [
+            threading.Thread(target=read, args=item, name="reproman-read-" + item[0], daemon=True)
+            for item in pipes.items()
+        ]
+        for reader in readers:
+            reader.start()
+
+        outputs = {
+            "stdout": _OutputBuffer(max_output_size),
+            "stderr": _OutputBuffer(max_output_size),
+        }
+        # The incomplete last line of each pipe
+        partial = {name: b"" for name in pipes}
+        nopen = len(readers)
+        while nopen:
+            name, chunk = chunks.get()
+            if chunk is None:
+                nopen -= 1
+                lines = [partial[name]] if partial[name] else []
             else:
-                pass
-
-        return stdout, stderr
+                outputs[name].append(chunk)
+                lines = (partial[name] + chunk).split(b"\n")
+                partial[name] = lines.pop()
+                lines = [line + b"\n" for line in lines]
+                if len(partial[name]) > _READ_SIZE:
+                    # Pass a long line on in pieces.
+                    lines.append(partial[name])
+                    partial[name] = b""
+            for line in lines:
+                line = line.decode(errors="replace")
+                # TODO: what level to log at? was: level=5
+                # Changes on that should be properly adapted in
+                # test.cmd.test_runner_log_stdout() and test_runner_log_stderr()
+                if name == "stdout":
+                    self._log_out(line)
+                    if stdout_callback:
+                        stdout_callback(line)
+                else:
+                    self._log_err(line, expect_stderr or expect_fail)
+                    if stderr_callback:
+                        stderr_callback(line)
+        for reader in readers:
+            reader.join()
+        proc.wait()
+
+        out = []
+        for name in "stdout", "stderr":
+            value = outputs[name].getvalue()
+            if outputs[name].ndropped:
+                lgr.debug(
+                    "Kept only the last %d bytes of %s (%d bytes dropped)",
+                    len(value),
+                    name,
+                    outputs[name].ndropped,
+                )
+            out.append(value)
+        return tuple(out)
 
     def run(
         self,
@@ -171,6 +275,9 @@ class Runner(object):
         cwd=None,
         env=None,
         shell=None,
+        stdout_callback=None,
+        stderr_callback=None,
+        max_output_size=None,
     ):
         """Runs the command `cmd` using shell.
 
@@ -224,6 +331,17 @@ class Runner(object):
             Run command in a shell.  If not specified, then it runs in a shell
             only if command is specified as a string (not a list)
 
+        stdout_callback, stderr_callback: callable, optional
+            Called with each line of stdout (stderr) as it comes in, if it is
+            logged.  Lines longer than 64 KiB are passed in pieces.  Implies
+            `log_online`.
+
+        max_output_size: int, optional
+            Keep only the last `max_output_size` bytes of stdout and stderr
+            (each) to return, instead of all the output.  The kept output
+            starts at a character boundary (with UTF-8), so it may be a few
+            bytes shorter.  Used only with `log_online`.
+
         Returns
         -------
         (stdout, stderr)
@@ -236,6 +354,9 @@ class Runner(object):
            in CommandError's `stdout` and `stderr` fields respectively.
         """
 
+        if stdout_callback or stderr_callback:
+            log_online = True
+
         outputstream = subprocess.PIPE if log_stdout else sys.stdout
         errstream = subprocess.PIPE if log_stderr else sys.stderr
 
@@ -284,6 +405,9 @@ class Runner(object):
                     log_stderr,
                     expect_stderr=expect_stderr,
                     expect_fail=expect_fail,
+                    stdout_callback=stdout_callback,
+                    stderr_callback=stderr_callback,
+                    max_output_size=max_output_size,
                 )
             else:
                 out = proc.communicate()
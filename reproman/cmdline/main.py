@@ -16,6 +16,7 @@ lgr = logging.getLogger("reproman.cmdline")
 lgr.log(5, "Importing cmdline.main")
 
 import argparse
+import os
 import sys
 import textwrap
 from importlib import import_module
@@ -52,12 +53,42 @@ THE SOFTWARE.
 """
 
 
-# TODO:  OPT look into making setup_parser smarter to become faster
-# Now it seems to take up to 200ms to do all the parser setup
-# even though it might not be necessary to know about all the commands etc.
-# I wondered if it could somehow decide on what commands to worry about etc
-# by going through sys.args first
-def setup_parser(formatter_class=argparse.RawDescriptionHelpFormatter, return_subparsers=False):
+# Options of the main parser which take a value
+_OPTS_WITH_VALUE = ("-C", "-c", "--config", "-l", "--log-level")
+
+
+def _get_requested_command(args, commands):
+    """Return the command requested in `args` if it is one of `commands`.
+
+    None is returned if there is no such command, or if the main parser
+    could need to know about all commands (e.g., to show its help).
+    """
+    args = iter(args)
+    for arg in args:
+        if arg in _OPTS_WITH_VALUE:
+            next(args, None)
+        elif arg.startswith(("-h", "--help", "@")):
+            return None
+        elif not arg.startswith("-"):
+            return arg if arg in commands else None
+    return None
+
+
+def setup_parser(
+    formatter_class=argparse.RawDescriptionHelpFormatter, return_subparsers=False, cmdlineargs=None
+):
+    """Set up the parser of the command line.
+
+    Parameters
+    ----------
+    formatter_class : argparse formatter class, optional
+    return_subparsers : bool, optional
+        Return a dict mapping command names to their parser (and "reproman"
+        to the main parser) instead of the main parser.
+    cmdlineargs : list of str, optional
+        Command line arguments to be parsed.  If they request a command, it
+        is the only one set up, which saves importing all the interfaces.
+    """
 
     lgr.log(5, "Starting to setup_parser")
     # delay since it can be a heavy import
@@ -143,11 +174,20 @@ def setup_parser(formatter_class=argparse.RawDescriptionHelpFormatter, return_su
     # API from them
     grp_short_descriptions = []
     interface_groups = get_interface_groups()
+    command = None
+    # Shell completion needs all the commands.
+    if cmdlineargs is not None and not return_subparsers and "_ARGCOMPLETE" not in os.environ:
+        command = _get_requested_command(
+            cmdlineargs,
+            [get_cmdline_command_name(s) for _, _, specs in interface_groups for s in specs],
+        )
     for grp_name, grp_descr, _interfaces in interface_groups:
         # for all subcommand modules it can find
         cmd_short_descriptions = []
 
         for _intfspec in _interfaces:
+            if command is not None and get_cmdline_command_name(_intfspec) != command:
+                continue
             # turn the interface spec into an instance
             lgr.log(5, "Importing module %s " % _intfspec[0])
             _mod = import_module(_intfspec[0], package="reproman")
@@ -249,7 +289,7 @@ def setup_parser(formatter_class=argparse.RawDescriptionHelpFormatter, return_su
 def main(args=None):
     lgr.log(5, "Starting main(%r)", args)
     # PYTHON_ARGCOMPLETE_OK
-    parser = setup_parser()
+    parser = setup_parser(cmdlineargs=sys.argv[1:] if args is None else args)
     try:
         import argcomplete
 
@@ -275,6 +315,10 @@ def main(args=None):
         lgr.info("No command given, returning")
         return
 
+    from reproman.support.version_check import check_available_version
+
+    check_available_version(reproman.__version__)
+
     ret = None
     if cmdlineargs.common_debug or cmdlineargs.common_idebug:
         # so we could see/stop clearly at the point of failure
@@ -17,6 +17,7 @@ from importlib import import_module
 
 from reproman.utils import attrib
 from reproman.resource.session import get_local_session
+from reproman.resource.session import PathStatCache
 
 import logging
 
@@ -192,7 +193,10 @@ class SpecObject(object):
 def _register_with_representer(cls):
     # TODO: check if we could/should just inherit from  yaml.YAMLObject
     # or could may be craft our own metaclass
-    yaml.SafeDumper.add_representer(cls, SpecObject.yaml_representer)
+    # Also register with the libyaml dumper, if available, which
+    # reproman.formats.utils.safe_dump uses.
+    for dumper in {yaml.SafeDumper, getattr(yaml, "CSafeDumper", yaml.SafeDumper)}:
+        dumper.add_representer(cls, SpecObject.yaml_representer)
 
 
 @attr.s
@@ -314,11 +318,18 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
     # Default to being able to handle directories
     HANDLES_DIRS = True
 
-    def __init__(self, session=None):
+    def __init__(self, session=None, stat_cache=None, cache=None):
         # will be (re)used to run external commands, and let's hardcode LC_ALL
         # codepage just in case since we might want to comprehend error
         # messages
         self._session = session or get_local_session()
+        # status of paths might be shared across tracers (e.g. within a
+        # single retrace) to avoid querying the session for them repeatedly
+        self._stat_cache = stat_cache or PathStatCache(self._session)
+        # persistent cache of query results (TracerCache), if any
+        self._cache = cache
+        # results of existence checks, see _prefetch_exists
+        self._exists_cache = {}
         # to ease _init within derived classes which should not be parametrized
         # more anyways
         self._init()
@@ -326,6 +337,41 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
     def _init(self):
         pass
 
+    def _prefetch_exists(self, paths):
+        """Check whether `paths` exist with a single `Session.batch` call
+
+        The results are used by `_exists`.
+        """
+        missing = [p for p in dict.fromkeys(paths) if p not in self._exists_cache]
+        if not missing:
+            return
+        results = self._session.batch([{"op": "exists", "path": p} for p in missing])
+        for path, (result, error) in zip(missing, results):
+            if error is None:
+                self._exists_cache[path] = result
+
+    def _exists(self, path):
+        """Return whether `path` exists, checking it if not prefetched"""
+        if path not in self._exists_cache:
+            self._exists_cache[path] = self._session.exists(path)
+        return self._exists_cache[path]
+
+    def _get_db_fingerprint(self, paths):
+        """Return a fingerprint of the state of a package database
+
+        The fingerprint is based on size and mtime of the `paths` (files
+        or directories) making up the database.  None is returned if the
+        persistent cache is not used or none of the paths could be
+        checked.
+        """
+        if self._cache is None:
+            return None
+        self._stat_cache.prefetch(paths)
+        stats = [self._stat_cache.stat(p) for p in paths]
+        if not any(stats) or any(st and st.mtime is None for st in stats):
+            return None
+        return ";".join("%s:%s:%s" % (st.path, st.size, st.mtime) for st in stats if st)
+
     @abc.abstractmethod
     def identify_distributions(self, files):
         return
@@ -374,6 +420,7 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
         # TODO: probably that _get_packagefields should create packagespecs
         # internally and just return them.  But we should make them hashable
         file_to_package_dict = self._get_packagefields_for_files(files)
+        self._stat_cache.prefetch(f for f in files if file_to_package_dict.get(f))
         for f in files:
             # Stores the file
             if f not in file_to_package_dict:
@@ -396,7 +443,7 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
                         if pkg:
                             found_packages[pkgfields_hashable] = pkg
                             # we store only non-directories within 'files'
-                            if not self._session.isdir(f):
+                            if not self._stat_cache.isdir(f):
                                 pkg.files.append(f_pkg)
                             nb_pkg_files += 1
                         else:
@@ -0,0 +1,140 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Persistent cache of the results of queries done by tracers"""
+
+import json
+import os
+import os.path as op
+import sqlite3
+import threading
+
+from reproman import cfg
+
+import logging
+
+lgr = logging.getLogger("reproman.distributions.cache")
+
+
+class TracerCache(object):
+    """Cache of tracer query results for a resource, stored in SQLite.
+
+    Results are stored as JSON under a namespace (e.g. "deb-file") and a key
+    (e.g. a file path).  Each namespace is associated with a fingerprint of
+    the package database the results came from (e.g. mtime and size of
+    /var/lib/dpkg/status).  Results stored under another fingerprint are
+    not returned and get discarded when new results are stored.
+
+    The cache can be shared by tracers running in different threads.
+
+    Parameters
+    ----------
+    resource_id : str
+        ID of the resource the results are about.
+    path : str, optional
+        Path to the database.  Defaults to "tracers.sqlite" under the user
+        cache directory.
+    """
+
+    # SQLite's default limit on the number of parameters in a statement
+    _MAX_PARAMS = 999
+
+    def __init__(self, resource_id, path=None):
+        self.resource_id = resource_id
+        self._path = path or op.join(cfg.dirs.user_cache_dir, "tracers.sqlite")
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return "%s(%r, path=%r)" % (self.__class__.__name__, self.resource_id, self._path)
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            dirname = op.dirname(self._path)
+            if dirname and not op.exists(dirname):
+                os.makedirs(dirname)
+            self._conn = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "resource TEXT, namespace TEXT, fingerprint TEXT, key TEXT, value TEXT, "
+                    "PRIMARY KEY (resource, namespace, key))"
+                )
+        return self._conn
+
+    def get(self, namespace, fingerprint, keys):
+        """Return a dict with cached results for those of `keys` which have them"""
+        keys = list(keys)
+        found = {}
+        step = self._MAX_PARAMS - 3
+        with self._lock:
+            for i in range(0, len(keys), step):
+                batch = keys[i : i + step]
+                rows = self._db.execute(
+                    "SELECT key, value FROM results "
+                    "WHERE resource = ? AND namespace = ? AND fingerprint = ? "
+                    "AND key IN (%s)" % ", ".join("?" * len(batch)),
+                    [self.resource_id, namespace, fingerprint] + batch,
+                )
+                found.update((k, json.loads(v)) for k, v in rows)
+        lgr.debug("Found %d of %d %s results in %s", len(found), len(keys), namespace, self)
+        return found
+
+    def set(self, namespace, fingerprint, results):
+        """Store `results`, a dict mapping keys to JSON-serializable values"""
+        with self._lock, self._db as db:
+            # Results for an outdated fingerprint would never be used again
+            db.execute(
+                "DELETE FROM results WHERE resource = ? AND namespace = ? AND fingerprint != ?",
+                (self.resource_id, namespace, fingerprint),
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    (self.resource_id, namespace, fingerprint, k, json.dumps(v))
+                    for k, v in results.items()
+                ),
+            )
+
+    def clear(self):
+        """Remove all cached results for the resource"""
+        with self._lock, self._db as db:
+            db.execute("DELETE FROM results WHERE resource = ?", (self.resource_id,))
+        lgr.debug("Cleared %s", self)
+
+
+def query_cached(cache, namespace, fingerprint, keys, query):
+    """Run `query` only for the keys without results in `cache`
+
+    Parameters
+    ----------
+    cache : TracerCache or None
+        If None, `query` is called for all keys.
+    namespace, fingerprint : str
+        See `TracerCache`.  If `fingerprint` is None (i.e. the state of the
+        package database is unknown), the cache is not used.
+    keys : iterable
+    query : callable
+        Given a list of keys, should return a dict mapping (some of) them
+        to results.  Keys without a result are remembered as having None.
+
+    Returns
+    -------
+    dict mapping keys to results
+    """
+    keys = list(keys)
+    if cache is None or fingerprint is None:
+        return query(keys)
+    results = cache.get(namespace, fingerprint, keys)
+    missing = [k for k in keys if k not in results]
+    if missing:
+        new_results = dict.fromkeys(missing)
+        new_results.update(query(missing))
+        cache.set(namespace, fingerprint, new_results)
+        results.update(new_results)
+    return results
@@ -297,44 +297,88 @@ class CondaTracer(DistributionTracer):
     def _create_package(self, *fields):
         raise NotImplementedError("TODO")
 
-    def _get_conda_meta_files(self, conda_path):
+    # Outputs all conda-meta/*.json of an environment in a single call, each
+    # terminated by a NUL (which cannot occur within JSON)
+    _CAT_CONDA_META_SCRIPT = (
+        'for f in "$1"/conda-meta/*.json; do test -f "$f" && cat "$f"; printf "\\0"; done'
+    )
+
+    def _stream_command(self, command):
+        """Yield the output of `command` in chunks, as bytes"""
         try:
-            out, _ = self._session.execute_command("ls %s/conda-meta/*.json" % conda_path)
-            return iter(out.splitlines())
-        except Exception as exc:  # Empty conda environment (unusual situation)
+            yield from self._session.stream_command(command)
+        except NotImplementedError:
+            out, _ = self._session.execute_command(command)
+            yield out.encode("utf-8")
+
+    def _get_conda_meta_records(self, conda_path):
+        """Yield content of the conda-meta JSON files of an environment
+
+        The output is parsed as it comes, so that only the record at hand is
+        held in memory (unless the session can't stream the output).
+        """
+        command = ["sh", "-c", self._CAT_CONDA_META_SCRIPT, "sh", conda_path]
+        parts = []
+        try:
+            for chunk in self._stream_command(command):
+                start = 0
+                end = chunk.find(b"\0")
+                while end >= 0:
+                    parts.append(chunk[start:end])
+                    record = b"".join(parts).decode("utf-8", errors="replace")
+                    parts = []
+                    if record.strip():
+                        yield record
+                    start = end + 1
+                    end = chunk.find(b"\0", start)
+                parts.append(chunk[start:])
+        except Exception as exc:
             lgr.warning(
                 "Could not retrieve conda-meta files in path %s: %s", conda_path, exc_str(exc)
             )
-            return iter(())
 
     def _get_conda_package_details(self, conda_path):
+        """Return details of packages installed in a conda environment
+
+        Returns
+        -------
+        A tuple of two dicts, where the first maps a package name to its
+        details, and the second maps package files, relative to
+        `conda_path`, to the package name.
+        """
         packages = {}
         file_to_package_map = {}
-        for meta_file in self._get_conda_meta_files(conda_path):
+        for record in self._get_conda_meta_records(conda_path):
             try:
-                out, err = self._session.execute_command("cat %s" % meta_file)
-                details = json.loads(out)
-                #                print meta_file
-                #                print(json.dumps(details, indent=4))
-                if "name" in details:
-                    lgr.debug("Found conda package %s", details["name"])
-                    # Packages are recorded in the conda environment as
-                    # name=version=build
-                    conda_package_name = "%s=%s=%s" % (
-                        details["name"],
-                        details["version"],
-                        details["build"],
-                    )
-                    packages[conda_package_name] = details
-                    # Now map the package files to the package
-                    for f in details["files"]:
-                        full_path = os.path.normpath(os.path.join(conda_path, f))
-                        file_to_package_map[full_path] = conda_package_name
-            except Exception as exc:
+                details = json.loads(record)
+            except ValueError as exc:
                 lgr.warning(
                     "Could not retrieve conda info in path %s: %s", conda_path, exc_str(exc)
                 )
-
+                continue
+            if "name" not in details:
+                continue
+            lgr.debug("Found conda package %s", details["name"])
+            # Packages are recorded in the conda environment as
+            # name=version=build
+            conda_package_name = "%s=%s=%s" % (
+                details["name"],
+                details["version"],
+                details["build"],
+            )
+            # Per-file records are not needed past building the map
+            details.pop("paths_data", None)
+            files = details.pop("files", [])
+            packages[conda_package_name] = details
+            # conda records normalized relative paths, so they can be matched
+            # against paths under conda_path as they are
+            for f in files:
+                if f.startswith("./") or "/." in f or "//" in f:
+                    f = os.path.normpath(f)
+                file_to_package_map[f] = conda_package_name
+
+        if not packages:
+            lgr.warning("Could not find any conda packages in path %s", conda_path)
         return packages, file_to_package_map
 
     def _get_conda_pip_package_details(self, env_export, conda_path):
@@ -351,17 +395,27 @@ class CondaTracer(DistributionTracer):
                 break
 
         pip = conda_path + "/bin/pip"
-        if not self._session.exists(pip):
+        if not self._exists(pip):
             return {}, {}
 
-        pkgs_editable = set(piputils.get_pip_packages(self._session, pip, restriction="editable"))
+        # The listing the persistent cache is keyed on is run along with this
+        # one.
+        lists = piputils.get_pip_lists(
+            self._session, pip, ["editable"] + ([None] if self._cache is not None else [])
+        )
+        pkgs_editable = set(piputils.parse_pip_list(lists["editable"]))
         pip_pkgs.update(pkgs_editable)
 
         if not pip_pkgs:
             return {}, {}
 
         packages, file_to_package_map = piputils.get_package_details(
-            self._session, pip, pip_pkgs, editable_packages=pkgs_editable
+            self._session,
+            pip,
+            pip_pkgs,
+            editable_packages=pkgs_editable,
+            cache=self._cache,
+            lists=lists,
         )
         for entry in packages.values():
             entry["installer"] = "pip"
@@ -401,11 +455,44 @@ class CondaTracer(DistributionTracer):
             lgr.warning("Could not retrieve conda info in path %s: %s", conda_path, exc_str(exc))
         return details
 
+    def _get_site_packages_paths(self, conda_path):
+        """Return site-packages directories of a conda environment"""
+        ((names, _),) = self._session.batch([{"op": "list", "path": conda_path + "/lib"}])
+        return [
+            "{}/lib/{}/site-packages".format(conda_path, name)
+            for name in names or []
+            if name.startswith("python")
+        ]
+
+    def _query_cached(self, namespace, conda_path, query, with_pip=False):
+        """Return result of `query()` about a conda environment at `conda_path`
+
+        The result is taken from the persistent cache if it is there and
+        conda-meta/ of the environment did not change since.  If `with_pip`,
+        the site-packages/ directories, which change whenever pip installs
+        or removes a package, have to be unchanged too.  Empty results
+        (e.g. due to a failed query) are not cached.
+        """
+        if self._cache is None:
+            return query()
+        db_paths = [conda_path + "/conda-meta"]
+        if with_pip:
+            db_paths.extend(self._get_site_packages_paths(conda_path))
+        fingerprint = self._get_db_fingerprint(db_paths)
+        if fingerprint is not None:
+            found = self._cache.get(namespace, fingerprint, [conda_path])
+            if conda_path in found:
+                return found[conda_path]
+        result = query()
+        if fingerprint is not None and any(result):
+            self._cache.set(namespace, fingerprint, {conda_path: result})
+        return result
+
     def _is_conda_env_path(self, path):
-        return self._session.exists("%s/conda-meta" % path)
+        return self._exists("%s/conda-meta" % path)
 
     def _is_conda_dist_path(self, path):
-        return self._session.exists(path + "/envs") and self._is_conda_env_path(path)
+        return self._exists(path + "/envs") and self._is_conda_env_path(path)
 
     def identify_distributions(self, paths):
         conda_paths = set()
@@ -416,13 +503,19 @@ class CondaTracer(DistributionTracer):
         found_package_count = 0
         total_file_count = len(unknown_files)
 
-        # First, loop through all the files and identify conda paths
+        # First, loop through all the files and identify conda paths, checking
+        # the directories that could be one at once
+        self._prefetch_exists(p + "/conda-meta" for p in self._get_conda_env_path.candidates(paths))
         for path in paths:
             conda_path = self._get_conda_env_path(path)
             if conda_path:
                 if conda_path not in conda_paths:
                     conda_paths.add(conda_path)
 
+        self._prefetch_exists(
+            p + "/envs" for p in self._get_conda_dist_path.candidates(conda_paths)
+        )
+
         # Loop through conda_paths, find packages and create the
         # environments
         for idx, conda_path in enumerate(conda_paths):
@@ -438,14 +531,20 @@ class CondaTracer(DistributionTracer):
                 lgr.warning("Could not find root path for conda environment %s" % conda_path)
                 continue
             # Retrieve the environment details
-            env_export = self._get_conda_env_export(root_path, conda_path)
-            (conda_package_details, file_to_pkg) = self._get_conda_package_details(conda_path)
+            env_export = self._query_cached(
+                "conda-export",
+                conda_path,
+                lambda: self._get_conda_env_export(root_path, conda_path),
+                with_pip=True,
+            )
+            (conda_package_details, file_to_pkg) = self._query_cached(
+                "conda-meta", conda_path, lambda: self._get_conda_package_details(conda_path)
+            )
             (conda_pip_package_details, file_to_pip_pkg) = self._get_conda_pip_package_details(
                 env_export, conda_path
             )
             # Join our conda and pip packages
             conda_package_details.update(conda_pip_package_details)
-            file_to_pkg.update(file_to_pip_pkg)
 
             # Initialize a map from packages to files that defaults to []
             pkg_to_found_files = defaultdict(list)
@@ -454,16 +553,18 @@ class CondaTracer(DistributionTracer):
             path_prefix = conda_path + os.path.sep
             # Loop through unknown files, assigning them to packages if found
             for path in set(unknown_files):  # Clone the set
-                if path in file_to_pkg:
+                # Make relative paths if it is begins with the conda path
+                if path.startswith(path_prefix):
+                    rel_path = path[len(path_prefix) :]
+                    pkg = file_to_pip_pkg.get(path) or file_to_pkg.get(rel_path)
+                else:
+                    rel_path = path
+                    pkg = file_to_pip_pkg.get(path)
+                if pkg:
                     # The file was found so remove from unknown file set
                     unknown_files.remove(path)
-                    # Make relative paths if it is begins with the conda path
-                    if path.startswith(path_prefix):
-                        rel_path = path[len(path_prefix) :]
-                    else:
-                        rel_path = path
                     # And add to the package
-                    pkg_to_found_files[file_to_pkg[path]].append(rel_path)
+                    pkg_to_found_files[pkg].append(rel_path)
 
             packages = []
             # Create the packages in the environment
@@ -530,7 +631,9 @@ class CondaTracer(DistributionTracer):
         # Loop through conda_roots and create the distributions
         for idx, root_path in enumerate(conda_roots):
             # Retrieve distribution details
-            conda_info = self._get_conda_info(root_path)
+            conda_info = self._query_cached(
+                "conda-info", root_path, lambda: self._get_conda_info(root_path)
+            )
 
             # Give the distribution a name
             if (len(conda_roots)) > 1:
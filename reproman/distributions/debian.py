@@ -6,8 +6,13 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Support for Debian(-based) distribution(s)."""
+import glob
+import io
 import os
+import os.path as op
 import re
+import tarfile
+import time
 
 import itertools
 from datetime import datetime
@@ -19,6 +24,7 @@ from collections import defaultdict
 
 import pytz
 
+from reproman import cfg
 from reproman import utils
 from reproman.utils import attrib
 
@@ -33,10 +39,13 @@ from reproman.support.distributions.debian import (
     get_apt_release_file_names,
     get_spec_from_release_file,
     parse_dpkgquery_line,
+    get_apt_packages_file_name,
+    read_dpkg_database,
 )
 
 # Pick a conservative max command-line
 from reproman.utils import (
+    ChunksReader,
     get_cmd_batch_len,
     execute_command_batch,
     cmd_err_filter,
@@ -44,9 +53,11 @@ from reproman.utils import (
 )
 
 from reproman.distributions.base import DistributionTracer
+from reproman.distributions.cache import query_cached
 
 lgr = logging.getLogger("reproman.distributions.debian")
 
+from ..dochelpers import exc_str
 from ..dochelpers import single_or_plural
 from .base import SpecObject
 from .base import Package
@@ -54,6 +65,21 @@ from .base import Distribution
 from .base import TypedList
 from .base import _register_with_representer
 from ..support.exceptions import CommandError
+from ..resource.shell import ShellSession
+
+# Files of the dpkg database (relative to the root) read when querying it
+# directly, status first
+_DPKG_DB_FILES = (
+    "var/lib/dpkg/status",
+    "var/lib/dpkg/info/*.list",
+    "var/lib/apt/lists/*_Packages",
+)
+
+# Pack the dpkg database files of a remote session into a tarball ($1)
+_TAR_DPKG_DB_SCRIPT = (
+    'cd / && for f in %s; do test -f "$f" && echo "$f"; done | tar -cf - -T -'
+    % " ".join(_DPKG_DB_FILES)
+)
 
 #
 # Models
@@ -301,6 +327,11 @@ class DebTracer(DistributionTracer):
     # The Debian tracer is not designed to handle directories
     HANDLES_DIRS = False
 
+    # Files whose state tells whether results of dpkg and apt queries, as
+    # stored in the persistent cache, are still valid
+    _DPKG_DB_PATHS = ["/var/lib/dpkg/status"]
+    _APT_DB_PATHS = _DPKG_DB_PATHS + ["/var/lib/apt/lists"]
+
     # TODO: (Low Priority) handle cases from dpkg-divert
     def _init(self):
         # TODO: we might want a generic helper for collections of things
@@ -309,6 +340,11 @@ class DebTracer(DistributionTracer):
         self._apt_source_names = set()
         self._all_apt_sources = {}
         self._source_line_to_name_map = {}
+        # Read the dpkg database and APT lists directly instead of running
+        # dpkg-query, dpkg -s, apt-cache show/policy and stat for the files
+        # and packages
+        self._read_dpkg_db = cfg.getboolean("debian", "read dpkg db", default=False)
+        self._dpkg_db = None
 
     def identify_distributions(self, files):
         if not files:
@@ -351,6 +387,17 @@ class DebTracer(DistributionTracer):
         yield dist, remaining_files
 
     def _get_packagefields_for_files(self, files):
+        return query_cached(
+            self._cache,
+            "deb-file",
+            self._get_db_fingerprint(self._DPKG_DB_PATHS),
+            files,
+            self._query_packagefields_for_files,
+        )
+
+    def _query_packagefields_for_files(self, files):
+        if self._use_dpkg_db():
+            return self._query_packagefields_from_dpkg_db(files)
         # Call dpkg query in batches
         exec_gen = execute_command_batch(
             self._session,
@@ -381,6 +428,62 @@ class DebTracer(DistributionTracer):
                 file_to_package_dict[found_name] = pkg
         return file_to_package_dict
 
+    def _query_packagefields_from_dpkg_db(self, files):
+        dpkg_db = self._get_dpkg_db()
+        file_to_package_dict = {}
+        for f in files:
+            pkgs = dpkg_db.get_packages_for_file(f)
+            if not pkgs:
+                continue
+            # Go through the dpkg-query output parser so that files listed by
+            # multiple packages are handled the same way
+            outdict = self._parse_dpkgquery_line("%s: %s" % (", ".join(pkgs), f))
+            if not outdict:
+                continue
+            outdict.pop("path")
+            lgr.debug("Identified file %r to belong to package %s", f, outdict)
+            file_to_package_dict[f] = outdict
+        return file_to_package_dict
+
+    def _use_dpkg_db(self):
+        """Return whether to query the dpkg database read by the tracer
+
+        If reading it fails, dpkg and apt are queried instead.
+        """
+        if self._read_dpkg_db and self._get_dpkg_db() is None:
+            self._read_dpkg_db = False
+        return self._read_dpkg_db
+
+    def _get_dpkg_db(self):
+        """Return the DpkgDatabase of the session, reading it if needed
+
+        None is returned if it could not be read.
+        """
+        if self._dpkg_db is None:
+            begin = time.time()
+            try:
+                if isinstance(self._session, ShellSession):
+                    self._dpkg_db = read_dpkg_database(_iter_dpkg_db_files("/"))
+                else:
+                    self._dpkg_db = self._fetch_dpkg_db()
+            except (CommandError, OSError, tarfile.TarError, NotImplementedError) as exc:
+                lgr.warning("Could not read dpkg database, querying dpkg instead: %s", exc_str(exc))
+                return None
+            lgr.debug("Reading dpkg database took %f seconds", time.time() - begin)
+        return self._dpkg_db
+
+    def _fetch_dpkg_db(self):
+        # Transfer all the files at once, as an archive streamed from the
+        # resource, rather than reading them one by one
+        chunks = self._session.stream_command(["sh", "-c", _TAR_DPKG_DB_SCRIPT])
+        try:
+            with tarfile.open(fileobj=ChunksReader(chunks), mode="r|") as tf:
+                return read_dpkg_database(_iter_tar_files(tf))
+        finally:
+            # This raises CommandError if tar failed.
+            for _ in chunks:
+                pass
+
     def _get_apt_source_name(self, src):
         # Create a unique name for the origin
         name_fmt = "apt_%s_%s_%s_%%d" % (src.origin or "", src.archive or "", src.component or "")
@@ -399,7 +502,42 @@ class DebTracer(DistributionTracer):
             self._find_all_sources()
 
         # Store the package details as dicts so that we can easily add to them
-        pkg_dicts = [attr.asdict(pkg) for pkg in packages]
+        pkg_dicts = {self._get_pkg_query_key(p): attr.asdict(p) for p in packages}
+
+        def query(keys):
+            return dict(zip(keys, self._query_details_for_packages([pkg_dicts[k] for k in keys])))
+
+        details = query_cached(
+            self._cache,
+            "deb-pkg",
+            self._get_db_fingerprint(self._APT_DB_PATHS),
+            pkg_dicts,
+            query,
+        )
+
+        new_packages = []
+        for key, p in pkg_dicts.items():
+            p.update(details.get(key) or {})
+            # Name the sources from the version table
+            self._name_pkg_versions_sources(p)
+            new_pkg = DEBPackage(**p)
+            new_packages.append(new_pkg)
+
+        return new_packages
+
+    @staticmethod
+    def _get_pkg_query_key(pkg):
+        return pkg.name if not pkg.architecture else "%s:%s" % (pkg.name, pkg.architecture)
+
+    def _query_details_for_packages(self, pkg_dicts):
+        """Query details for packages given as dicts of DEBPackage fields
+
+        Returns a list with details for each of the packages, with versions
+        still listing the source lines rather than names.
+        """
+        if self._use_dpkg_db():
+            self._get_pkgs_details_from_dpkg_db(pkg_dicts)
+            return [{f: v for f, v in p.items() if f != "files"} for p in pkg_dicts]
 
         # Use dpkg -s <pkg> to get arch and version
         self._get_pkgs_arch_and_version(pkg_dicts)
@@ -413,12 +551,40 @@ class DebTracer(DistributionTracer):
         # Get install date from the modify time of the dpkg info file
         self._get_pkgs_install_date(pkg_dicts)
 
-        new_packages = []
-        for p in pkg_dicts:
-            new_pkg = DEBPackage(**p)
-            new_packages.append(new_pkg)
+        return [{f: v for f, v in p.items() if f != "files"} for p in pkg_dicts]
 
-        return new_packages
+    def _get_pkgs_details_from_dpkg_db(self, pkg_dicts):
+        # Provide the same details as the dpkg and apt-cache queries do
+        dpkg_db = self._get_dpkg_db()
+        list_to_source = {get_apt_packages_file_name(s): s for s in self._all_apt_sources}
+        status_source = "/var/lib/dpkg/status"
+        for p in pkg_dicts:
+            # dpkg -s
+            r = dpkg_db.get_installed(p["name"], p["architecture"])
+            if not r:
+                lgr.warning("Was unable to find %s in the dpkg status" % p["name"])
+                continue
+            p["architecture"] = r["architecture"]
+            p["version"] = r["version"]
+            available = dpkg_db.get_available(p["name"], p["architecture"])
+            # apt-cache show, which falls back to the dpkg status record
+            shown = next((a for a, _ in available if a["version"] == p["version"]), r)
+            for f in ("source_name", "source_version", "size", "md5", "sha1", "sha256"):
+                if f in shown:
+                    p[f] = shown[f]
+            # apt-cache policy
+            versions = {}
+            for a, list_name in available:
+                sources = versions.setdefault(a["version"], [])
+                if list_name in list_to_source:
+                    sources.append(list_to_source[list_name])
+            if status_source in self._all_apt_sources:
+                versions.setdefault(p["version"], []).append(status_source)
+            p["versions"] = versions
+            # stat of the .list file
+            mtime = dpkg_db.get_list_mtime(p["name"])
+            if mtime is not None:
+                p["install_date"] = str(pytz.utc.localize(datetime.utcfromtimestamp(int(mtime))))
 
     def _create_package(self, name, architecture=None):
 
@@ -429,17 +595,29 @@ class DebTracer(DistributionTracer):
         )
 
     def _find_all_sources(self):
+        sources = query_cached(
+            self._cache,
+            "deb-sources",
+            self._get_db_fingerprint(self._APT_DB_PATHS),
+            ["all"],
+            lambda _: {"all": self._query_all_sources()},
+        )["all"]
+        for src_name, src in sources.items():
+            self._all_apt_sources[src_name] = APTSource(**src)
+
+    def _query_all_sources(self):
         # Use apt-cache policy to get all sources
         out, _ = self._session.execute_command(["apt-cache", "policy"])
         out = utils.to_unicode(out, "utf-8")
 
+        sources = {}
         src_info = parse_apt_cache_policy_source_info(out)
         for src_name in src_info:
             src_vals = src_info[src_name]
             date = self._get_date_from_release_file(
                 src_vals.get("archive_uri"), src_vals.get("uri_suite")
             )
-            self._all_apt_sources[src_name] = APTSource(
+            sources[src_name] = dict(
                 name=src_name,
                 component=src_vals.get("component"),
                 codename=src_vals.get("codename"),
@@ -451,6 +629,7 @@ class DebTracer(DistributionTracer):
                 date=date,
                 archive_uri=src_vals.get("archive_uri"),
             )
+        return sources
 
     def _get_pkgs_arch_and_version(self, pkg_dicts):
         # Convert package names to name:arch format
@@ -557,30 +736,37 @@ class DebTracer(DistributionTracer):
             if not ver:
                 lgr.warning("Was unable to get version table for %s" % p["name"])
                 continue
-            # Now construct the version table
-            ver_dict = {}
-            for v in ver.get("versions"):
-                key = v["version"]
-                ver_dict[key] = []
-                for s in v.get("sources"):
-                    s = s["source"]
-                    # If we haven't named the source yet, name it
-                    if s not in self._source_line_to_name_map:
-                        # Make sure we can find the source
-                        if s not in self._all_apt_sources:
-                            lgr.warning("Cannot find source %s" % s)
-                            continue
-                        # Grab and name the source
-                        source = self._all_apt_sources[s]
-                        src_name = self._get_apt_source_name(source)
-                        source.name = src_name
-                        # Now add the source to our used sources
-                        self._apt_sources[src_name] = source
-                        # add the name for easy future lookup
-                        self._source_line_to_name_map[s] = src_name
-                    # Look up and add the short name for the source
-                    ver_dict[key].append(self._source_line_to_name_map[s])
-            p["versions"] = ver_dict
+            # Now construct the version table, listing the source lines for
+            # now.  Those get named by _name_pkg_versions_sources.
+            p["versions"] = {
+                v["version"]: [s["source"] for s in v.get("sources")] for v in ver.get("versions")
+            }
+
+    def _name_pkg_versions_sources(self, p):
+        """Replace source lines in the version table of a package with names"""
+        if not p.get("versions"):
+            return
+        ver_dict = {}
+        for key, sources in p["versions"].items():
+            ver_dict[key] = []
+            for s in sources:
+                # If we haven't named the source yet, name it
+                if s not in self._source_line_to_name_map:
+                    # Make sure we can find the source
+                    if s not in self._all_apt_sources:
+                        lgr.warning("Cannot find source %s" % s)
+                        continue
+                    # Grab and name the source
+                    source = self._all_apt_sources[s]
+                    src_name = self._get_apt_source_name(source)
+                    source.name = src_name
+                    # Now add the source to our used sources
+                    self._apt_sources[src_name] = source
+                    # add the name for easy future lookup
+                    self._source_line_to_name_map[s] = src_name
+                # Look up and add the short name for the source
+                ver_dict[key].append(self._source_line_to_name_map[s])
+        p["versions"] = ver_dict
 
     def _get_date_from_release_file(self, archive_uri, uri_suite):
         date = None
@@ -601,7 +787,30 @@ class DebTracer(DistributionTracer):
     def _parse_dpkgquery_line(self, line):
         res = parse_dpkgquery_line(line)
         if res and res.pop("pkgs_rest"):
-            if self._session.isdir(res["path"]):
+            if self._stat_cache.isdir(res["path"]):
                 return None
             lgr.warning("dpkg-query line has multiple packages (%s)", line)
         return res
+
+
+def _iter_dpkg_db_files(root):
+    """Yield (path, mtime, file) for the dpkg database files under `root`"""
+    for pattern in _DPKG_DB_FILES:
+        for path in sorted(glob.glob(op.join(root, pattern))):
+            try:
+                mtime = os.stat(path).st_mtime
+                f = io.open(path, encoding="utf-8", errors="replace")
+            except (IOError, OSError) as exc:
+                lgr.debug("Cannot read %s: %s", path, exc)
+                continue
+            with f:
+                yield path, mtime, f
+
+
+def _iter_tar_files(tf):
+    """Yield (path, mtime, lines) for the files in the tarfile `tf`"""
+    for member in tf:
+        if member.isfile():
+            # Not a TextIOWrapper, which doesn't support a streamed archive.
+            f = (line.decode("utf-8", errors="replace") for line in tf.extractfile(member))
+            yield member.name, member.mtime, f
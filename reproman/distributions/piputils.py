@@ -6,11 +6,15 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Utilities for working with pip."""
+import hashlib
 import itertools
 import json
 import os
 import re
 
+from reproman.distributions.cache import query_cached
+from reproman.support.exceptions import CommandError
+from reproman.utils import command_as_string
 from reproman.utils import execute_command_batch
 
 
@@ -52,7 +56,67 @@ def _pip_batched_show(session, which_pip, pkgs):
         yield pkg, info
 
 
-def pip_show(session, which_pip, pkgs):
+def get_pip_lists(session, which_pip, restrictions):
+    """Run `pip list` with each of `restrictions` in a single batch.
+
+    Parameters
+    ----------
+    session : Session instance
+        Session in which to execute the commands.
+    which_pip : str
+        Name of the pip executable.
+    restrictions : list of {None, 'local', 'editable'}
+        See `get_pip_packages`.
+
+    Returns
+    -------
+    A dict mapping each restriction to the JSON output of `pip list`.
+
+    Raises
+    ------
+    CommandError if a command failed.
+    """
+    commands = []
+    for restriction in restrictions:
+        cmd = [which_pip, "list", "--format=json"]
+        if restriction in ["local", "editable"]:
+            cmd.append("--{}".format(restriction))
+        commands.append(cmd)
+    results = session.batch([{"op": "run", "args": cmd} for cmd in commands])
+    lists = {}
+    for restriction, cmd, (result, error) in zip(restrictions, commands, results):
+        if error is not None:
+            raise CommandError(cmd=command_as_string(cmd), msg=error)
+        out, err, status = result
+        if status:
+            raise CommandError(
+                cmd=command_as_string(cmd),
+                msg="Failed to run {!r}: {}".format(cmd, err),
+                code=status,
+                stdout=out,
+                stderr=err,
+            )
+        lists[restriction] = out
+    return lists
+
+
+def parse_pip_list(out):
+    """Yield names of the packages in the JSON output of `pip list`"""
+    return (p["name"] for p in json.loads(out))
+
+
+def _get_pip_fingerprint(out):
+    """Return a digest of the installed packages and their versions
+
+    Parameters
+    ----------
+    out : str
+        Output of unrestricted `pip list`.
+    """
+    return hashlib.md5(out.encode("utf-8")).hexdigest()
+
+
+def pip_show(session, which_pip, pkgs, cache=None, fingerprint=None):
     """Gather package details from `pip show`.
 
     Parameters
@@ -63,6 +127,12 @@ def pip_show(session, which_pip, pkgs):
         Name of the pip executable.
     pkgs : sequence
         Collection of packages pass to the command.
+    cache : TracerCache, optional
+        Persistent cache for the details, which is valid for as long as the
+        output of `pip list` does not change.
+    fingerprint : str, optional
+        Digest of the output of `pip list` for the cache.  If not given, it
+        is queried.
 
     Returns
     -------
@@ -72,13 +142,28 @@ def pip_show(session, which_pip, pkgs):
     packages = {}
     file_to_pkg = {}
 
-    show_entries = _pip_batched_show(session, which_pip, pkgs)
-
-    for pkg, info in show_entries:
-        details = {"name": info["Name"], "version": info["Version"], "location": info["Location"]}
+    def query(pkgs):
+        entries = {}
+        for pkg, info in _pip_batched_show(session, which_pip, pkgs):
+            details = {
+                "name": info["Name"],
+                "version": info["Version"],
+                "location": info["Location"],
+            }
+            entries[pkg] = {"details": details, "files": info["Files"]}
+        return entries
+
+    if cache is not None and fingerprint is None:
+        fingerprint = _get_pip_fingerprint(get_pip_lists(session, which_pip, [None])[None])
+    show_entries = query_cached(cache, "pip:" + which_pip, fingerprint, pkgs, query)
+
+    for pkg, entry in show_entries.items():
+        if not entry:
+            continue
+        details = entry["details"]
         packages[pkg] = details
-        for path in info["Files"]:
-            full_path = os.path.normpath(os.path.join(info["Location"], path))
+        for path in entry["files"]:
+            full_path = os.path.normpath(os.path.join(details["location"], path))
             file_to_pkg[full_path] = pkg
     return packages, file_to_pkg
 
@@ -106,14 +191,12 @@ def get_pip_packages(session, which_pip, restriction=None):
     # is based on how they show editable packages.  'list' outputs
     # a source directory of the package, whereas 'freeze' outputs
     # a URL like "-e git+https://github.com/[...]".
-    cmd = [which_pip, "list", "--format=json"]
-    if restriction in ["local", "editable"]:
-        cmd.append("--{}".format(restriction))
-    out, _ = session.execute_command(cmd)
-    return (p["name"] for p in json.loads(out))
+    return parse_pip_list(get_pip_lists(session, which_pip, [restriction])[restriction])
 
 
-def get_package_details(session, which_pip, packages=None, editable_packages=None):
+def get_package_details(
+    session, which_pip, packages=None, editable_packages=None, cache=None, lists=None
+):
     """Get package details from `pip show` and `pip list`.
 
     This is similar to `pip_show`, but it uses `pip list` to get information
@@ -131,17 +214,35 @@ def get_package_details(session, which_pip, packages=None, editable_packages=Non
     editable_packages : collection of str
         If a package name is in this collection, mark it as editable. Passing
         this saves a call to `which_pip`.
+    cache : TracerCache, optional
+        Persistent cache for results of `pip show`.
+    lists : dict, optional
+        Outputs of `get_pip_lists` to use instead of running those listings
+        again.
 
     Returns
     -------
     A tuple of two dicts, where the first maps a package name to its
     details and the second maps package files to the package name.
     """
+    lists = dict(lists or {})
+    # The listings still needed, including the one the cache is keyed on,
+    # are run at once.
+    needed = []
+    if (packages is None or cache is not None) and None not in lists:
+        needed.append(None)
+    if editable_packages is None and "editable" not in lists:
+        needed.append("editable")
+    if needed:
+        lists.update(get_pip_lists(session, which_pip, needed))
     if packages is None:
-        packages = list(get_pip_packages(session, which_pip))
+        packages = list(parse_pip_list(lists[None]))
     if editable_packages is None:
-        editable_packages = set(get_pip_packages(session, which_pip, restriction="editable"))
-    details, file_to_pkg = pip_show(session, which_pip, packages)
+        editable_packages = set(parse_pip_list(lists["editable"]))
+    fingerprint = None if cache is None else _get_pip_fingerprint(lists[None])
+    details, file_to_pkg = pip_show(
+        session, which_pip, packages, cache=cache, fingerprint=fingerprint
+    )
 
     for pkg in details:
         details[pkg]["editable"] = pkg in editable_packages
@@ -14,6 +14,7 @@ import logging
 import re
 
 from reproman.distributions.base import DistributionTracer
+from reproman.distributions.cache import query_cached
 
 lgr = logging.getLogger("reproman.distributions.redhat")
 
@@ -24,6 +25,8 @@ from .base import TypedList
 from .base import _register_with_representer
 from ..support.exceptions import CommandError
 from ..utils import attrib
+from ..utils import execute_command_batch
+from ..utils import get_cmd_batch_len
 
 
 @attr.s(cmp=True)
@@ -229,6 +232,38 @@ class RPMTracer(DistributionTracer):
 
         yield dist, remaining_files
 
+    # Files whose state tells whether results of rpm queries, as stored in
+    # the persistent cache, are still valid.  Which ones exist depends on
+    # the version of rpm.
+    _RPM_DB_PATHS = [
+        "/var/lib/rpm/Packages",
+        "/var/lib/rpm/rpmdb.sqlite",
+        "/usr/lib/sysimage/rpm/rpmdb.sqlite",
+    ]
+
+    # Fields of RPMPackage to query via "rpm -q --queryformat".  pkgid matches
+    # the default output of "rpm -q".
+    _QUERY_TAGS = (
+        ("pkgid", "%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}"),
+        ("name", "%{NAME}"),
+        ("version", "%{VERSION}"),
+        ("release", "%{RELEASE}"),
+        ("architecture", "%{ARCH}"),
+        ("install_date", "%{INSTALLTIME:date}"),
+        ("group", "%{GROUP}"),
+        ("size", "%{SIZE}"),
+        ("license", "%{LICENSE}"),
+        ("signature", "%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|"),
+        ("source_rpm", "%{SOURCERPM}"),
+        ("build_date", "%{BUILDTIME:date}"),
+        ("build_host", "%{BUILDHOST}"),
+        ("packager", "%{PACKAGER}"),
+        ("vendor", "%{VENDOR}"),
+        ("url", "%{URL}"),
+    )
+    # Marks lines of "rpm -qf" output which name an owning package
+    _OWNER_MARKER = "@owner@ "
+
     def _get_packagefields_for_files(self, files):
         """
         Query the system for detail information for each package found.
@@ -242,48 +277,108 @@ class RPMTracer(DistributionTracer):
         -------
         dictionary : key = package id, value = dict of package details
         """
+        # "rpm -qf" errors out on files which do not exist, and then we could
+        # not match its output to the queried files
+        files = list(files)
+        self._stat_cache.prefetch(files)
+        files = [f for f in files if self._stat_cache.stat(f)]
+        if not files:
+            return {}
+
+        fingerprint = self._get_db_fingerprint(self._RPM_DB_PATHS)
+        file_to_pkgids = query_cached(
+            self._cache,
+            "rpm-file",
+            fingerprint,
+            files,
+            lambda fs: dict(self._get_pkgids_for_files(fs)),
+        )
 
-        file_to_package_dict = {}
-
-        # Get a list of the attrs in the RPMPackage class to filter
-        # out non-relavant values retrieved from the system.
-        package_fields = [p.name for p in attr.fields(RPMPackage)]
-
-        for file in files:
-            try:
-                # Get the package identifier that the file is a member.
-                pkgid, err = self._session.execute_command(["rpm", "-qf", file])
-            except CommandError:
+        file_to_pkgid = {}
+        for file, pkgids in file_to_pkgids.items():
+            if not pkgids:
                 continue
-            if err:
-                continue
-
-            pkgids = pkgid.splitlines()
             if len(pkgids) > 1:
                 msg = "Multiple packages found for file {}: {}. Selecting {}"
                 lgr.info(msg.format(file, ", ".join(pkgids), pkgids[0]))
-            pkgid = pkgids[0].strip()
-
-            # Get the package information from the system.
-            package_info, _ = self._session.execute_command(["rpm", "-qi", pkgid])
-            if package_info:
-                # Store the relevant fields of the package in the dict.
-                # The labels of the fields returned by the system are mapped
-                # to the attr fields in the RPMPacakge class.
-                pkg = {"pkgid": pkgid}
-                for line in package_info.splitlines():
-                    matches = re.match(r"(.*?):(.*)\s{2,}(.*):(.*)", line)
-                    if not matches:
-                        matches = re.match(r"(.*?):(.*)", line)
-                    if matches:
-                        for i in range(1, len(matches.groups()), 2):
-                            key = matches.group(i).strip().lower().replace(" ", "_")
-                            if key in package_fields:
-                                pkg[key] = matches.group(i + 1).strip()
-                lgr.debug("Identified file %r to belong to package %s", pkgid, pkg)
+            file_to_pkgid[file] = pkgids[0]
+
+        # Query details for each of the packages only once
+        pkgs = query_cached(
+            self._cache,
+            "rpm-pkg",
+            fingerprint,
+            set(file_to_pkgid.values()),
+            self._get_details_for_pkgids,
+        )
+
+        file_to_package_dict = {}
+        for file, pkgid in file_to_pkgid.items():
+            pkg = pkgs.get(pkgid)
+            if pkg:
+                lgr.debug("Identified file %r to belong to package %s", file, pkg)
                 file_to_package_dict[file] = pkg
         return file_to_package_dict
 
+    def _get_pkgids_for_files(self, files):
+        """Yield (file, list of pkgids) for files, querying them in batches
+
+        "rpm -qf" outputs a line for each package owning a file, or a single
+        "not owned" line.  Unless a batch yields exactly one line per file, we
+        cannot tell which package goes with which file, so such batches get
+        split in halves until they can be matched up.
+        """
+        command = [
+            "sh",
+            "-c",
+            'rpm -qf --queryformat "%s%s\\n" -- "$@" 2>/dev/null; exit 0'
+            % (self._OWNER_MARKER, self._QUERY_TAGS[0][1]),
+            "sh",
+        ]
+        num_args = get_cmd_batch_len(files, sum(map(len, command)) + len(command))
+        batches = [files[i : i + num_args] for i in range(0, len(files), num_args)]
+        while batches:
+            batch = batches.pop(0)
+            out, _ = self._session.execute_command(command + batch)
+            results = []
+            for line in out.splitlines():
+                if line.startswith(self._OWNER_MARKER):
+                    results.append([line[len(self._OWNER_MARKER) :].strip()])
+                elif line.endswith(" is not owned by any package"):
+                    results.append([])
+            if len(results) == len(batch):
+                for res in zip(batch, results):
+                    yield res
+            elif len(batch) == 1:
+                yield batch[0], [pkgid for r in results for pkgid in r]
+            else:
+                half = len(batch) // 2
+                batches[:0] = [batch[:half], batch[half:]]
+
+    def _get_details_for_pkgids(self, pkgids):
+        """Return a dict mapping each of pkgids to a dict of RPMPackage fields"""
+        if not pkgids:
+            return {}
+        # Fields are separated by tabs and records by newlines, which are
+        # not expected to occur within the values
+        queryformat = "\\t".join(tag for _, tag in self._QUERY_TAGS) + "\\n"
+        pkgs = {}
+        for out, _, _ in execute_command_batch(
+            self._session, ["rpm", "-q", "--queryformat", queryformat], sorted(pkgids)
+        ):
+            for line in out.splitlines():
+                values = line.split("\t")
+                if len(values) != len(self._QUERY_TAGS):
+                    lgr.debug("Skipping rpm -q output line %r", line)
+                    continue
+                pkg = {
+                    field: value
+                    for (field, _), value in zip(self._QUERY_TAGS, values)
+                    if value != "(none)"
+                }
+                pkgs[pkg["pkgid"]] = pkg
+        return pkgs
+
     def _create_package(self, name, **kwargs):
         return RPMPackage(name=name, **kwargs)
 
@@ -295,6 +390,16 @@ class RPMTracer(DistributionTracer):
         -------
         sources : list(RPMSource)
         """
+        sources = query_cached(
+            self._cache,
+            "rpm-sources",
+            self._get_db_fingerprint(self._RPM_DB_PATHS + ["/etc/yum.repos.d"]),
+            ["all"],
+            lambda _: {"all": [attr.asdict(s) for s in self._query_all_sources()]},
+        )["all"]
+        return [RPMSource(**s) for s in sources]
+
+    def _query_all_sources(self):
         attr_fields = {f.name for f in attr.fields(RPMSource)}
         sources = []
         # Get all repo info from the system and store information for each
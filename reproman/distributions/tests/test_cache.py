@@ -0,0 +1,79 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import os.path as op
+
+import pytest
+
+from reproman.distributions.cache import query_cached
+from reproman.distributions.cache import TracerCache
+
+
+@pytest.fixture
+def cache_path(tmpdir):
+    return op.join(str(tmpdir), "sub", "tracers.sqlite")
+
+
+def test_tracer_cache(cache_path):
+    cache = TracerCache("res1", path=cache_path)
+    assert cache.get("ns", "fp1", ["a", "b"]) == {}
+    cache.set("ns", "fp1", {"a": {"name": "pkg"}, "b": None})
+    assert cache.get("ns", "fp1", ["a", "b", "c"]) == {"a": {"name": "pkg"}, "b": None}
+    # Other fingerprints, namespaces, and resources do not see the results
+    assert cache.get("ns", "fp2", ["a"]) == {}
+    assert cache.get("other", "fp1", ["a"]) == {}
+    other_cache = TracerCache("res2", path=cache_path)
+    assert other_cache.get("ns", "fp1", ["a"]) == {}
+    other_cache.set("ns", "fp1", {"a": 1})
+
+    # Results are persistent
+    cache = TracerCache("res1", path=cache_path)
+    assert cache.get("ns", "fp1", ["a"]) == {"a": {"name": "pkg"}}
+
+    # New fingerprint discards the outdated results
+    cache.set("ns", "fp2", {"c": 3})
+    assert cache.get("ns", "fp1", ["a"]) == {}
+    assert cache.get("ns", "fp2", ["a", "c"]) == {"c": 3}
+
+    cache.clear()
+    assert cache.get("ns", "fp2", ["c"]) == {}
+    assert other_cache.get("ns", "fp1", ["a"]) == {"a": 1}
+
+
+def test_tracer_cache_many_keys(cache_path):
+    cache = TracerCache("res", path=cache_path)
+    items = {str(i): i for i in range(3000)}
+    cache.set("ns", "fp", items)
+    assert cache.get("ns", "fp", list(items)) == items
+
+
+def test_query_cached(cache_path):
+    queried = []
+
+    def query(keys):
+        queried.append(keys)
+        return {k: k.upper() for k in keys if k != "unknown"}
+
+    assert query_cached(None, "ns", "fp", ["a"], query) == {"a": "A"}
+    cache = TracerCache("res", path=cache_path)
+    assert query_cached(cache, "ns", None, ["a"], query) == {"a": "A"}
+    assert len(queried) == 2
+
+    assert query_cached(cache, "ns", "fp", ["a", "unknown"], query) == {
+        "a": "A",
+        "unknown": None,
+    }
+    assert queried[-1] == ["a", "unknown"]
+    # Only the new key is queried, and the negative result is remembered
+    assert query_cached(cache, "ns", "fp", ["a", "b", "unknown"], query) == {
+        "a": "A",
+        "b": "B",
+        "unknown": None,
+    }
+    assert queried[-1] == ["b"]
+    assert len(queried) == 4
@@ -328,6 +328,94 @@ def test_get_conda_env_export_exceptions():
         assert "unknown" in log_warning.val
 
 
+def test_get_conda_package_details(tmpdir):
+    import json
+    from reproman.tests.utils import create_tree
+
+    conda_path = str(tmpdir)
+
+    def meta(name, files):
+        return json.dumps(
+            {"name": name, "version": "1.0", "build": "0", "files": files, "paths_data": {}},
+            indent=2,
+        )
+
+    create_tree(
+        conda_path,
+        {
+            "conda-meta": {
+                "history": "",
+                "a-1.0-0.json": meta("a", ["bin/a", "lib/a.py"]),
+                "b-1.0-0.json": meta("b", ["./bin/b"]),
+                "broken.json": "{",
+            }
+        },
+    )
+    tracer = CondaTracer()
+    with mock.patch.object(
+        tracer._session, "stream_command", wraps=tracer._session.stream_command
+    ) as stream_command:
+        packages, file_to_pkg = tracer._get_conda_package_details(conda_path)
+    # All meta files come in a single call
+    assert stream_command.call_count == 1
+    assert sorted(packages) == ["a=1.0=0", "b=1.0=0"]
+    assert "files" not in packages["a=1.0=0"]
+    assert file_to_pkg == {"bin/a": "a=1.0=0", "lib/a.py": "a=1.0=0", "bin/b": "b=1.0=0"}
+
+
+def test_get_conda_meta_records_incremental():
+    consumed = []
+
+    def stream_command(command):
+        for chunk in [b'{"name": ', b'"a"}\0{"na', b'me": "b"}\0\0', b'{"name": "c"}\0']:
+            consumed.append(chunk)
+            yield chunk
+
+    session = mock.MagicMock()
+    session.stream_command.side_effect = stream_command
+    records = CondaTracer(session=session)._get_conda_meta_records("/conda")
+    # Each record is yielded once it is complete, before the rest of the
+    # output is read.
+    assert next(records) == '{"name": "a"}'
+    assert len(consumed) == 2
+    assert next(records) == '{"name": "b"}'
+    assert len(consumed) == 3
+    assert list(records) == ['{"name": "c"}']
+    session.execute_command.assert_not_called()
+
+    # Without streaming, the output is read at once.
+    session.stream_command.side_effect = NotImplementedError
+    session.execute_command.return_value = ('{"name": "a"}\0', "")
+    assert list(CondaTracer(session=session)._get_conda_meta_records("/conda")) == ['{"name": "a"}']
+
+
+def test_query_cached_pip_install(tmpdir):
+    from reproman.distributions.cache import TracerCache
+    from reproman.tests.utils import create_tree
+
+    conda_path = str(tmpdir.join("env"))
+    site_packages = os.path.join(conda_path, "lib", "python3.8", "site-packages")
+    create_tree(conda_path, {"conda-meta": {"history": ""}})
+    os.makedirs(site_packages)
+    os.utime(site_packages, (0, 0))
+    tracer = CondaTracer(cache=TracerCache("res", path=str(tmpdir.join("cache.sqlite"))))
+
+    def query():
+        query.count += 1
+        return {"count": query.count}
+
+    query.count = 0
+    assert tracer._query_cached("meta", conda_path, query) == {"count": 1}
+    assert tracer._query_cached("export", conda_path, query, with_pip=True) == {"count": 2}
+    assert tracer._query_cached("meta", conda_path, query) == {"count": 1}
+    assert tracer._query_cached("export", conda_path, query, with_pip=True) == {"count": 2}
+    # A package installed with pip invalidates only the queries covering pip.
+    os.mkdir(os.path.join(site_packages, "rpaths-0.13.dist-info"))
+    tracer = CondaTracer(cache=tracer._cache)
+    assert tracer._query_cached("meta", conda_path, query) == {"count": 1}
+    assert tracer._query_cached("export", conda_path, query, with_pip=True) == {"count": 3}
+
+
 conda_yaml = os.path.join(os.path.dirname(__file__), "files", "conda.yaml")
 
 
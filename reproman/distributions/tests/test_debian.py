@@ -23,7 +23,9 @@ import pytest
 
 from unittest import mock
 
+from reproman.utils import execute_command_batch
 from reproman.utils import swallow_logs
+from reproman.support.exceptions import CommandError
 from reproman.tests.skip import mark
 from reproman.tests.utils import (
     COMMON_SYSTEM_PATH,
@@ -155,6 +157,57 @@ def test_utf8_file():
         assert True
 
 
+@mark.skipif_no_apt_cache
+@pytest.mark.parametrize("fetch", [False, True], ids=["local", "fetched"])
+def test_read_dpkg_db(fetch):
+    files = [COMMON_SYSTEM_PATH, "/usr/bin", "/is/not/there"]
+
+    def trace(read_dpkg_db):
+        tracer = DebTracer()
+        tracer._read_dpkg_db = read_dpkg_db
+        if fetch:
+            # Go through the tarball transfer used for remote sessions
+            tracer._dpkg_db = tracer._fetch_dpkg_db()
+        with mock.patch(
+            "reproman.distributions.debian.execute_command_batch",
+            wraps=execute_command_batch,
+        ) as exec_batch:
+            dists = list(tracer.identify_distributions(files))
+        return dists, exec_batch.call_count
+
+    [(expected_dist, expected_unknown_files)], _ = trace(False)
+    [(dist, unknown_files)], nbatch = trace(True)
+    # No dpkg-query, dpkg or apt-cache calls for the packages
+    assert nbatch == 0
+    assert [attr.asdict(p) for p in dist.packages] == [
+        attr.asdict(p) for p in expected_dist.packages
+    ]
+    assert dist.apt_sources == expected_dist.apt_sources
+    assert unknown_files == expected_unknown_files
+
+
+def test_read_dpkg_db_fallback():
+    def stream_command(command):
+        yield b""
+        raise CommandError(cmd="tar", msg="tar: not found", code=127)
+
+    session = mock.MagicMock()
+    session.stream_command.side_effect = stream_command
+    tracer = DebTracer(session=session)
+    tracer._read_dpkg_db = True
+    with (
+        swallow_logs(new_level=logging.WARNING) as log,
+        mock.patch(
+            "reproman.distributions.debian.execute_command_batch", return_value=[]
+        ) as exec_batch,
+    ):
+        assert tracer._query_packagefields_for_files(["/bin/sh"]) == {}
+        assert "Could not read dpkg database" in log.out
+    # dpkg-query is used instead.
+    assert exec_batch.call_count == 1
+    assert not tracer._read_dpkg_db
+
+
 def test_get_packagefields_for_files():
     manager = DebTracer()
     # TODO: mock! and bring back afni and fail2ban
@@ -9,7 +9,10 @@
 
 from unittest import mock
 
+import pytest
+
 from reproman.distributions import piputils
+from reproman.support.exceptions import CommandError
 from reproman.tests.utils import assert_is_subset_recur
 
 
@@ -112,3 +115,28 @@ Cannot locate installed-files.txt"""
     info_nofiles = piputils.parse_pip_show(out_no_files)
     assert set(info_nofiles.keys()) == fields
     assert info_nofiles["Files"] == []
+
+
+def test_get_package_details_batches_lists():
+    session = mock.MagicMock()
+    listings = {
+        (): '[{"name": "a", "version": "1"}, {"name": "b", "version": "2"}]',
+        ("--editable",): '[{"name": "b", "version": "2"}]',
+    }
+    session.batch.side_effect = lambda ops: [
+        ((listings[tuple(op["args"][3:])], "", 0), None) for op in ops
+    ]
+    cache = mock.MagicMock()
+    with mock.patch.object(piputils, "pip_show", return_value=({"a": {}, "b": {}}, {})) as pip_show:
+        details, _ = piputils.get_package_details(session, "pip", cache=cache)
+    # The listings, including the one the cache is keyed on, are run in a
+    # single batch.
+    assert session.batch.call_count == 1
+    session.execute_command.assert_not_called()
+    assert details == {"a": {"editable": False}, "b": {"editable": True}}
+    assert pip_show.call_args[0][2] == ["a", "b"]
+    assert pip_show.call_args[1]["fingerprint"] == piputils._get_pip_fingerprint(listings[()])
+
+    session.batch.side_effect = lambda ops: [(("", "boom", 1), None) for op in ops]
+    with pytest.raises(CommandError):
+        piputils.get_pip_lists(session, "pip", ["local"])
@@ -238,3 +238,81 @@ def test_package_is_identical_to(setup_packages):
     assert not p1.compare(p1aa, mode="identical_to")
     assert not p1ai.compare(p1aa, mode="identical_to")
     assert not p1.compare(p1v11ai, mode="identical_to")
+
+
+class FakeRPMSession(object):
+    """Answers rpm queries from a fake package database, counting them"""
+
+    def __init__(self, owners):
+        self.owners = owners  # file -> list of pkgids
+        self.commands = []
+
+    def stat_batch(self, paths):
+        from ...resource.session import PathStat
+
+        return {
+            p: PathStat(path=p, type="file", size=1, mtime=1.0) if p != "/missing" else None
+            for p in paths
+        }
+
+    def execute_command(self, command):
+        self.commands.append(command)
+        lines = []
+        if command[0] == "sh":  # rpm -qf
+            for f in command[4:]:
+                if f in self.owners:
+                    lines += ["@owner@ " + p for p in self.owners[f]]
+                else:
+                    lines.append("file %s is not owned by any package" % f)
+        else:  # rpm -q --queryformat
+            for pkgid in command[4:]:
+                name, version, release_arch = pkgid.split("-")
+                release, arch = release_arch.split(".")
+                values = [pkgid, name, version, release, arch] + ["(none)"] * 11
+                values[RPMTracer._QUERY_TAGS.index(("group", "%{GROUP}"))] = "Base"
+                lines.append("\t".join(values))
+        return "".join(line + "\n" for line in lines), ""
+
+
+def test_tracer_batches_rpm_queries():
+    owners = {"/bin/f%d" % i: ["pkg%d-1.0-1.x86_64" % (i % 3)] for i in range(100)}
+    # A file owned by multiple packages makes output of the batch ambiguous
+    owners["/bin/shared"] = ["pkg1-1.0-1.x86_64", "pkg2-1.0-1.x86_64"]
+    files = sorted(owners) + ["/unowned", "/missing"]
+    session = FakeRPMSession(owners)
+    tracer = RPMTracer(session)
+    with swallow_logs(new_level=logging.INFO) as log:
+        packages = tracer._get_packagefields_for_files(files)
+        assert "Multiple packages found for file /bin/shared" in log.out
+
+    assert set(packages) == set(owners)
+    assert packages["/bin/f4"]["pkgid"] == "pkg1-1.0-1.x86_64"
+    assert packages["/bin/f4"]["group"] == "Base"
+    assert "url" not in packages["/bin/f4"]
+    assert packages["/bin/shared"]["name"] == "pkg1"
+    # rpm is never asked about a missing file, and details for each package
+    # are queried once, all in the same call
+    qf_calls = [c for c in session.commands if c[0] == "sh"]
+    assert all("/missing" not in c for c in qf_calls)
+    details_calls = [c for c in session.commands if c[0] == "rpm"]
+    assert len(details_calls) == 1
+    assert sorted(details_calls[0][4:]) == ["pkg%d-1.0-1.x86_64" % i for i in range(3)]
+    # The ambiguous batch is bisected down to the shared file, which takes
+    # a handful of calls but not one per file
+    assert len(qf_calls) < 20
+
+
+def test_tracer_uses_cache(tmpdir):
+    from ...distributions.cache import TracerCache
+
+    owners = {"/bin/f1": ["pkg1-1.0-1.x86_64"], "/bin/f2": ["pkg2-1.0-1.x86_64"]}
+    cache = TracerCache("res", path=str(tmpdir.join("cache.sqlite")))
+    session = FakeRPMSession(owners)
+    packages = RPMTracer(session, cache=cache)._get_packagefields_for_files(sorted(owners))
+    assert len(session.commands) == 2
+
+    session = FakeRPMSession(owners)
+    assert RPMTracer(session, cache=cache)._get_packagefields_for_files(["/bin/f1"]) == {
+        "/bin/f1": packages["/bin/f1"]
+    }
+    assert session.commands == []
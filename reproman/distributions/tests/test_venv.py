@@ -9,6 +9,7 @@
 import os
 import os.path as op
 import sys
+from unittest import mock
 
 from appdirs import AppDirs
 import attr
@@ -269,3 +270,21 @@ def test_venv_install_noop():
     with swallow_logs(new_level=logging.INFO) as log:
         dist.install_packages()
         assert "No local, non-editable packages found" in log.out
+
+
+def test_venv_probes_batched():
+    session = mock.MagicMock()
+    session.batch.side_effect = lambda ops: [(False, None) for _ in ops]
+    tracer = VenvTracer(session=session)
+    assert not list(tracer.identify_distributions(["/a/b/c", "/a/b/d", "/e"]))
+    # Candidate directories are checked for bin/activate in one batch.
+    (((ops,), _),) = session.batch.call_args_list
+    assert sorted(op["path"] for op in ops) == [
+        "/a/b/bin/activate",
+        "/a/b/c/bin/activate",
+        "/a/b/d/bin/activate",
+        "/a/bin/activate",
+        "/e/bin/activate",
+    ]
+    session.execute_command.assert_not_called()
+    session.exists.assert_not_called()
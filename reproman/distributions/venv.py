@@ -104,17 +104,24 @@ class VenvTracer(DistributionTracer):
         raise NotImplementedError
 
     def _get_package_details(self, venv_path):
+        """Return package details, file to package map and local packages"""
         pip = venv_path + "/bin/pip"
         try:
-            packages, file_to_pkg = piputils.get_package_details(self._session, pip)
+            # All listings are run at once.
+            lists = piputils.get_pip_lists(self._session, pip, [None, "editable", "local"])
+            packages, file_to_pkg = piputils.get_package_details(
+                self._session, pip, cache=self._cache, lists=lists
+            )
         except Exception as exc:
             lgr.warning(
                 "Could not determine pip package details for %s: %s", venv_path, exc_str(exc)
             )
-            return {}, {}
-        return packages, file_to_pkg
+            return {}, {}, set()
+        return packages, file_to_pkg, set(piputils.parse_pip_list(lists["local"]))
 
     def _is_venv_directory(self, path):
+        if not self._exists("{}/bin/activate".format(path)):
+            return False
         try:
             self._session.execute_command(
                 ["grep", "-q", "VIRTUAL_ENV", "{}/bin/activate".format(path)]
@@ -131,17 +138,14 @@ class VenvTracer(DistributionTracer):
         unknown_files = set(files)
         found_package_count = 0
 
+        # Check the directories that could be an environment at once.
+        self._prefetch_exists(p + "/bin/activate" for p in self._path_root.candidates(files))
         venv_paths = map(self._get_venv_path, files)
         venv_paths = set(filter(None, venv_paths))
 
         venvs = []
         for venv_path in venv_paths:
-            package_details, file_to_pkg = self._get_package_details(venv_path)
-            local_pkgs = set(
-                piputils.get_pip_packages(
-                    self._session, venv_path + "/bin/pip", restriction="local"
-                )
-            )
+            package_details, file_to_pkg, local_pkgs = self._get_package_details(venv_path)
             pkg_to_found_files = defaultdict(list)
             for path in set(unknown_files):  # Clone the set
                 # The supplied path may be relative or absolute, but
@@ -195,11 +199,12 @@ class VenvTracer(DistributionTracer):
             )
 
         if venvs:
+            venv_version, venv_exe_path = self._venv_info()
             yield (
                 VenvDistribution(
                     name="venv",
-                    venv_version=self._venv_version(),
-                    path=self._venv_exe_path(),
+                    venv_version=venv_version,
+                    path=venv_exe_path,
                     environments=venvs,
                 ),
                 unknown_files,
@@ -220,18 +225,15 @@ class VenvTracer(DistributionTracer):
     # which virtualenv created it, so we just go with its current
     # version and location.
 
-    def _venv_version(self):
-        try:
-            out, _ = self._session.execute_command(["virtualenv", "--version"])
-        except Exception as exc:
-            lgr.debug("Could not determine virtualenv version: %s", exc_str(exc))
-            return
-        return out.strip()
-
-    def _venv_exe_path(self):
-        try:
-            out, _ = self._session.execute_command(["which", "virtualenv"])
-        except Exception as exc:
-            lgr.debug("Could not determine virtualenv path: %s", exc_str(exc))
-            return
-        return out.strip()
+    def _venv_info(self):
+        """Return the version and path of virtualenv, queried at once"""
+        info = []
+        queries = [("version", ["virtualenv", "--version"]), ("path", ["which", "virtualenv"])]
+        results = self._session.batch([{"op": "run", "args": cmd} for _, cmd in queries])
+        for (what, _), (result, error) in zip(queries, results):
+            if error is None and not result[2]:
+                info.append(result[0].strip())
+            else:
+                lgr.debug("Could not determine virtualenv %s: %s", what, error or result[1])
+                info.append(None)
+        return info
@@ -24,6 +24,10 @@ from reproman.distributions.base import Factory
 from reproman.distributions.base import SpecObject
 from reproman.utils import instantiate_attr_object
 from .base import Provenance
+from .utils import SafeDumper
+from .utils import add_representer
+from .utils import load_yaml_file
+from .utils import safe_load
 from .utils import write_config
 from .. import utils
 from ..distributions import Distribution
@@ -55,14 +59,13 @@ class RepromanProvenance(Provenance):
         # either order should matter.  Now in some places then internally
         # sorting alphabetically for consistency
         if "\n" in source:
-            return yaml.safe_load(source)
+            return safe_load(source)
 
-        with open(source, "r") as stream:
-            try:
-                return yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                lgr.error("Failed to load %s: %s", source, exc_str(exc))
-                raise  # TODO -- we might want a dedicated exception here
+        try:
+            return load_yaml_file(source)
+        except yaml.YAMLError as exc:
+            lgr.error("Failed to load %s: %s", source, exc_str(exc))
+            raise  # TODO -- we might want a dedicated exception here
 
     # def get_operating_system(self):
     #     """
@@ -264,8 +267,8 @@ class RepromanProvenance(Provenance):
 
         # Allow yaml to handle OrderedDict
         # From http://stackoverflow.com/questions/31605131
-        if collections.OrderedDict not in yaml.SafeDumper.yaml_representers:
-            yaml.SafeDumper.add_representer(
+        if collections.OrderedDict not in SafeDumper.yaml_representers:
+            add_representer(
                 collections.OrderedDict,
                 lambda self, data: self.represent_mapping("tag:yaml.org,2002:map", data.items()),
             )
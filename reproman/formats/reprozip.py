@@ -11,10 +11,8 @@ Plugin support for provenance YAML files produced by ReproZip utility.
 See: https://vida-nyu.github.io/reprozip/
 """
 
-import io
-import yaml
-
 from .base import Provenance
+from .utils import load_yaml_file
 
 import logging
 
@@ -26,10 +24,9 @@ class ReprozipProvenance(Provenance):
 
     @classmethod
     def _load(cls, source):
-        with io.open(source, encoding="utf-8") as stream:
-            config = yaml.safe_load(stream)
-            # TODO: Check version of ReproZip file and warn if unknown
-            return config
+        config = load_yaml_file(source)
+        # TODO: Check version of ReproZip file and warn if unknown
+        return config
 
     # Might come handy to define 'base' whenever we get there
     # def get_os(self):
@@ -6,10 +6,17 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import io
 import logging
+import os
+import stat
+from unittest.mock import patch
 
+import reproman
 from reproman.utils import swallow_logs
 from reproman.formats import Provenance
+from reproman.formats import utils as futils
+from reproman.formats.reproman import RepromanProvenance
 
 
 def test_get_distributions(demo1_spec):
@@ -21,3 +28,54 @@ def test_get_distributions(demo1_spec):
         distributions = provenance.get_distributions()
         assert len(distributions) == 2
         # a bit of testing is done within test_reproman.py since it is reproman specific example?
+
+
+def test_load_yaml_file_cache(tmpdir):
+    path = tmpdir.join("spec.yml")
+    path.write("a: [1, 2]\n")
+    cache_path = str(tmpdir.join("cache", "spec.pickle"))
+    with (
+        patch.object(reproman.cfg, "getboolean", return_value=True),
+        patch.object(futils, "_get_cache_path", return_value=cache_path),
+        patch.object(futils, "safe_load", wraps=futils.safe_load) as safe_load,
+    ):
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2]}
+        assert os.path.exists(cache_path)
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2]}
+        assert safe_load.call_count == 1
+        # A modified file is parsed again.
+        path.write("a: [1, 2, 3]\n")
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2, 3]}
+        assert safe_load.call_count == 2
+        # So is one modified without a change of size and mtime.
+        st = os.stat(str(path))
+        path.write("a: [1, 2, 4]\n")
+        os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2, 4]}
+        assert safe_load.call_count == 3
+
+        # The cache directory is private, and not used if others can write to
+        # it.
+        cache_dir = os.path.dirname(cache_path)
+        assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+        os.chmod(cache_dir, 0o777)
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2, 4]}
+        assert safe_load.call_count == 4
+        assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+        assert futils.load_yaml_file(str(path)) == {"a": [1, 2, 4]}
+        assert safe_load.call_count == 4
+
+
+def test_write_like_pure_python(demo1_spec):
+    import yaml
+
+    spec = Provenance.factory(demo1_spec, "reproman").get_environment()
+    outputs = []
+    for dumper in [futils.SafeDumper, yaml.SafeDumper]:
+        output = io.StringIO()
+        with patch.object(futils, "SafeDumper", dumper):
+            RepromanProvenance.write(output, spec)
+        # Skip the header, which has the time of writing.
+        outputs.append(output.getvalue().split("\n", 2)[2])
+    assert outputs[0] == outputs[1]
+    assert RepromanProvenance(outputs[0]).get_environment() == spec
@@ -9,10 +9,113 @@
 
 from __future__ import absolute_import
 
+import hashlib
+import io
+import logging
+import os
+import os.path as op
+import pickle
+import stat
+
 import yaml
 
 from reproman.utils import safe_write
 
+lgr = logging.getLogger("reproman.formats.utils")
+
+# OPT: Use the loader and dumper of libyaml, much faster than the pure Python
+# ones, when PyYAML was built with it.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def safe_load(stream):
+    """Like yaml.safe_load, but with libyaml if available"""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_dump(data, stream=None, **kwds):
+    """Like yaml.safe_dump, but with libyaml if available"""
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwds)
+
+
+def add_representer(data_type, representer):
+    """Register `representer` for `data_type` with the safe dumpers"""
+    for dumper in {yaml.SafeDumper, SafeDumper}:
+        dumper.add_representer(data_type, representer)
+
+
+def _get_cache_path(path):
+    from reproman import cfg
+
+    key = hashlib.md5(op.abspath(path).encode("utf-8", "surrogateescape")).hexdigest()
+    return op.join(cfg.dirs.user_cache_dir, "specs", key + ".pickle")
+
+
+def _check_cache_dir(dirname):
+    """Raise OSError unless `dirname` is only writable by the current user.
+
+    Anyone able to write to it could make us unpickle arbitrary data.
+    """
+    st = os.lstat(dirname)
+    getuid = getattr(os, "getuid", None)
+    if not stat.S_ISDIR(st.st_mode) or (getuid and st.st_uid != getuid()):
+        raise OSError("{} is not a directory owned by the current user".format(dirname))
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise OSError("{} is writable by other users".format(dirname))
+
+
+def load_yaml_file(path):
+    """Load the YAML file at `path`.
+
+    If the "cache" option of the [specs] configuration section is set, the
+    loaded data is also stored in the cache directory, and reused as long as
+    the size, modification time, and content digest of the file do not
+    change.  It saves parsing large specifications again and again (e.g., by
+    "reproman diff").
+    """
+    from reproman import cfg
+
+    use_cache = cfg.getboolean("specs", "cache", default=False)
+    if not use_cache:
+        with io.open(path, encoding="utf-8") as stream:
+            return safe_load(stream)
+
+    with open(path, "rb") as fh:
+        st = os.fstat(fh.fileno())
+        content = fh.read()
+    key = (st.st_size, st.st_mtime_ns, hashlib.sha256(content).hexdigest())
+    cache_path = _get_cache_path(path)
+    cache_dir = op.dirname(cache_path)
+    try:
+        _check_cache_dir(cache_dir)
+        with open(cache_path, "rb") as fh:
+            cached_key, data = pickle.load(fh)
+        if cached_key == key:
+            lgr.debug("Loaded %s from cache %s", path, cache_path)
+            return data
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        lgr.debug("Ignoring cache %s of %s: %s", cache_path, path, exc)
+
+    data = safe_load(content.decode("utf-8"))
+
+    tmp_path = "{}.{}".format(cache_path, os.getpid())
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        # Also restrict a directory created by an older version.
+        os.chmod(cache_dir, 0o700)
+        _check_cache_dir(cache_dir)
+        with open(tmp_path, "wb") as fh:
+            pickle.dump((key, data), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as exc:
+        lgr.debug("Failed to cache %s: %s", path, exc)
+        if op.exists(tmp_path):
+            os.unlink(tmp_path)
+    return data
+
 
 def write_config_key(stream, envconfig, key, intro_comment=""):
     """Writes the YAML representation of a single key
@@ -42,5 +145,5 @@ def write_config_key(stream, envconfig, key, intro_comment=""):
 def write_config(stream, rec):
     """TODO"""
     return safe_write(
-        stream, yaml.safe_dump(rec, encoding="utf-8", allow_unicode=True, default_flow_style=False)
+        stream, safe_dump(rec, encoding="utf-8", allow_unicode=True, default_flow_style=False)
     )
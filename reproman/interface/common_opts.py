@@ -11,7 +11,7 @@ __docformat__ = "restructuredtext"
 
 from reproman.support.param import Parameter
 from reproman.support.constraints import EnsureChoice
-from reproman.support.constraints import EnsureInt, EnsureNone, EnsureStr
+from reproman.support.constraints import EnsureFloat, EnsureInt, EnsureNone, EnsureStr
 
 
 trace_opt = Parameter(
@@ -51,3 +51,13 @@ resref_type_opt = Parameter(
     disambiguate.""",
     constraints=EnsureChoice("auto", "name", "id"),
 )
+
+resource_timeout_opt = Parameter(
+    args=("--timeout",),
+    metavar="SECONDS",
+    doc="""Give up on a resource that has not responded within this many
+    seconds.  Defaults to the 'timeout' option of the 'resources'
+    configuration section, or 60.  Resources are queried concurrently, up to
+    the number set by the 'max workers' option of that section (default: 8).""",
+    constraints=EnsureFloat() | EnsureNone(),
+)
@@ -8,13 +8,17 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Operate on `reproman run` jobs."""
 
+from contextlib import contextmanager
 from functools import partial
 import operator
 import logging
+import os.path as op
 import yaml
 
+from reproman import cfg
 from reproman.dochelpers import exc_str
 from reproman.interface.base import Interface
+from reproman.interface.common_opts import resource_timeout_opt
 from reproman.support.jobs.local_registry import LocalRegistry
 from reproman.support.jobs.orchestrators import ORCHESTRATORS
 from reproman.resource import get_manager
@@ -22,7 +26,7 @@ from reproman.support.param import Parameter
 from reproman.support.constraints import EnsureChoice
 from reproman.support.exceptions import OrchestratorError
 from reproman.support.exceptions import ResourceNotFoundError
-from reproman.utils import chpwd
+from reproman.utils import iter_concurrently
 
 lgr = logging.getLogger("reproman.interface.jobs")
 
@@ -43,6 +47,9 @@ def match(query_id, jobids):
     Three types of matches are considered, in this order: full match or partial
     match. If there is a full match, partial matches are not considered.
 
+    Note that `reproman jobs` resolves IDs against the registered jobs with
+    `LocalRegistry.match`.
+
     Parameters
     ----------
     query_id : str
@@ -69,39 +76,143 @@ def match(query_id, jobids):
 
 
 def _resurrect_orc(job):
+    # Note: This is called from multiple threads, so it must not change the
+    # working directory.
     resource = get_manager().get_resource(job["resource_id"], "id")
-    try:
-        # Create chpwd separately so that this try-except block doesn't cover
-        # the context manager suite below.
-        cd = chpwd(job["local_directory"])
-    except FileNotFoundError:
+    if not op.isdir(job["local_directory"]):
         raise OrchestratorError(
             "local directory for job {} no longer exists: {}".format(
                 job["_jobid"], job["local_directory"]
             )
         )
 
-    with cd:
-        orchestrator_class = ORCHESTRATORS[job["orchestrator"]]
-        orc = orchestrator_class(resource, job["submitter"], job, resurrection=True)
-        orc.submitter.submission_id = job.get("_submission_id")
+    orchestrator_class = ORCHESTRATORS[job["orchestrator"]]
+    orc = orchestrator_class(resource, job["submitter"], job, resurrection=True)
+    orc.submitter.submission_id = job.get("_submission_id")
     return orc
 
 
+@contextmanager
+def _report_job_errors(job):
+    try:
+        yield
+    except OrchestratorError as exc:
+        lgr.error("job %s failed: %s", job["_jobid"], exc_str(exc))
+    except ResourceNotFoundError:
+        lgr.error(
+            "Resource %s (%s) no longer exists",
+            job["resource_id"],
+            job["resource_name"],
+        )
+
+
+def _query_status(job, orc=None, subjobs=False):
+    """Query the status of `job`.
+
+    Parameters
+    ----------
+    orc : Orchestrator, optional
+        Orchestrator of the job.  If not given, it is resurrected.
+    subjobs : bool, optional
+        Whether to count the subjobs in each state too.
+
+    Returns
+    -------
+    A dict with the status according to the orchestrator ("orchestrator") and
+    the submitter ("queried" and "queried_normalized").
+    """
+    orc = orc or _resurrect_orc(job)
+    queried_normalized, queried = orc.submitter.status
+    status = {
+        "orchestrator": orc.status,
+        "queried": queried,
+        "queried_normalized": queried_normalized,
+    }
+    if subjobs:
+        status["subjobs"] = orc.get_status_counts()
+    return status
+
+
+def _query_resource_jobs(jobs, subjobs=False):
+    """Query the status of `jobs`, which are on the same resource.
+
+    Returns
+    -------
+    A list of (job, status, exception) tuples.
+    """
+    orcs = {}
+    results = []
+    # Set up all the orchestrators before querying the status of any job so
+    # that the status of the jobs is queried at once (see StatusPoller).
+    for job in jobs:
+        try:
+            orcs[job["_jobid"]] = _resurrect_orc(job)
+        except (OrchestratorError, ResourceNotFoundError) as exc:
+            results.append((job, None, exc))
+    for job in jobs:
+        if job["_jobid"] in orcs:
+            try:
+                status = _query_status(job, orcs[job["_jobid"]], subjobs=subjobs)
+            except OrchestratorError as exc:
+                results.append((job, None, exc))
+            else:
+                results.append((job, status, None))
+    return results
+
+
+def _iter_statuses(jobs, subjobs=False, timeout=None):
+    """Query the status of `jobs`, a resource at a time.
+
+    The resources are queried concurrently, and the results are yielded as
+    (job, status, exception) tuples as soon as those for a resource are in.
+    """
+    # Don't leave it to the threads to create the manager.
+    get_manager()
+    by_resource = {}
+    for job in jobs:
+        by_resource.setdefault(job["resource_id"], []).append(job)
+    if timeout is None:
+        timeout = cfg.get_as_dtype("resources", "timeout", float, default=60)
+    for group, results, exc in iter_concurrently(
+        partial(_query_resource_jobs, subjobs=subjobs),
+        by_resource.values(),
+        max_workers=cfg.get_as_dtype("resources", "max workers", int, default=8),
+        timeout=timeout,
+    ):
+        if exc:
+            if isinstance(exc, TimeoutError):
+                lgr.error(
+                    "Querying resource %s timed out after %s seconds",
+                    group[0]["resource_name"],
+                    timeout,
+                )
+                continue
+            # Unexpected error
+            raise exc
+        for result in results:
+            yield result
+
+
 # Action functions
 
 
-def show_oneline(job, status=False):
-    """Display `job` as a single summary line."""
+def show_oneline(job, status=None):
+    """Display `job` as a single summary line.
+
+    `status` is either the status returned by `_query_status` or True to
+    query it.
+    """
     fmt = "{status}{j[_jobid]} on {j[resource_name]} via {j[submitter]}$ {cmd}"
     if status:
-        orc = _resurrect_orc(job)
-        orc_status = orc.status
-        _, queried_status = orc.submitter.status
+        if status is True:
+            status = _query_status(job)
+        orc_status = status["orchestrator"]
+        queried_status = status["queried"]
         if orc_status == queried_status:
             # Drop repeated status (e.g., our and condor's "running").
             queried_status = None
         stat = "[status: {}{}] ".format(orc_status, ", " + queried_status if queried_status else "")
+        LREG.set_status(job["_jobid"], orc_status)
     else:
         stat = ""
     try:
@@ -111,16 +222,17 @@ def show_oneline(job, status=False):
         lgr.warning("Skipping following job record missing %s: %s", exc, job)
 
 
-def show(job, status=False):
-    """Display detailed information about `job`."""
+def show(job, status=None):
+    """Display detailed information about `job`.
+
+    `status` is either the status returned by `_query_status` (with subjob
+    counts) or True to query it.
+    """
     if status:
-        orc = _resurrect_orc(job)
-        queried_normalized, queried = orc.submitter.status
-        job["status"] = {
-            "orchestrator": orc.status,
-            "queried": queried,
-            "queried_normalized": queried_normalized,
-        }
+        if status is True:
+            status = _query_status(job, subjobs=True)
+        job["status"] = status
+        LREG.set_status(job["_jobid"], status["orchestrator"])
     print(yaml.safe_dump(job))
 
 
@@ -170,24 +282,37 @@ class Jobs(Interface):
             doc="""Query the resource for status information when listing or
             showing jobs""",
         ),
-        # TODO: Add ability to restrict to resource.
+        resref=Parameter(
+            args=("-r", "--resource"),
+            dest="resref",
+            metavar="RESOURCE",
+            doc="""Restrict to jobs submitted to this resource (name or ID).""",
+        ),
+        submitter=Parameter(
+            args=("--submitter",),
+            metavar="NAME",
+            doc="""Restrict to jobs submitted with this submitter.""",
+        ),
+        timeout=resource_timeout_opt,
     )
 
     @staticmethod
-    def __call__(queries, action="auto", all_=False, status=False):
-        job_files = LREG.find_job_files()
+    def __call__(
+        queries, action="auto", all_=False, status=False, resref=None, submitter=None, timeout=None
+    ):
+        known = LREG.find_jobs(resource=resref, submitter=submitter)
 
-        if not job_files:
+        if not known:
             lgr.info("No jobs found")
             return
 
         if all_:
-            matched_ids = job_files.keys()
+            matched_ids = list(known)
         else:
             matched_ids = []
             for query in queries:
-                m = match(query, job_files)
-                if m:
+                m = LREG.match(query)
+                if m in known:
                     matched_ids.append(m)
                 else:
                     lgr.warning("No jobs matched query %s", query)
@@ -202,25 +327,28 @@ class Jobs(Interface):
             for i in matched_ids:
                 LREG.unregister(i)
         else:
-            jobs = [_load(job_files[i]) for i in matched_ids or job_files]
+            jobs = [known[i] for i in matched_ids or known]
 
             if action == "fetch" or (action == "auto" and matched_ids):
                 fn = fetch
             elif action == "list" or action == "auto":
-                fn = partial(show_oneline, status=status)
+                fn = show_oneline
             elif action == "show":
-                fn = partial(show, status=status)
+                fn = show
             else:
                 raise RuntimeError("Unknown action: {}".format(action))
 
-            for job in jobs:
-                try:
-                    fn(job)
-                except OrchestratorError as exc:
-                    lgr.error("job %s failed: %s", job["_jobid"], exc_str(exc))
-                except ResourceNotFoundError:
-                    lgr.error(
-                        "Resource %s (%s) no longer exists",
-                        job["resource_id"],
-                        job["resource_name"],
-                    )
+            if status and fn is not fetch:
+                # Jobs are displayed as the status for their resource comes
+                # in.
+                for job, job_status, exc in _iter_statuses(
+                    jobs, subjobs=fn is show, timeout=timeout
+                ):
+                    with _report_job_errors(job):
+                        if exc:
+                            raise exc
+                        fn(job, status=job_status)
+            else:
+                for job in jobs:
+                    with _report_job_errors(job):
+                        fn(job)
@@ -13,6 +13,7 @@ __docformat__ = "restructuredtext"
 from collections import OrderedDict
 
 from .base import Interface
+from .common_opts import resource_timeout_opt
 from .common_opts import resref_type_opt
 
 # import reproman.interface.base  # Needed for test patching
@@ -22,6 +23,8 @@ from ..ui import ui
 from ..support.exceptions import ResourceError
 from ..support.exceptions import ResourceNotFoundError
 from ..dochelpers import exc_str
+from ..utils import iter_concurrently
+from .. import cfg
 
 from logging import getLogger
 
@@ -58,10 +61,11 @@ class Ls(Interface):
             doc="Restrict the output to this resource name or ID",
         ),
         resref_type=resref_type_opt,
+        timeout=resource_timeout_opt,
     )
 
     @staticmethod
-    def __call__(resrefs=None, resref_type="auto", verbose=False, refresh=False):
+    def __call__(resrefs=None, resref_type="auto", verbose=False, refresh=False, timeout=None):
         id_length = 19  # todo: make it possible to output them long
         template = "{:<20} {:<20} {:<%(id_length)s} {!s:<10}" % locals()
         ui.message(template.format("RESOURCE NAME", "TYPE", "ID", "STATUS"))
@@ -73,25 +77,42 @@ class Ls(Interface):
             resrefs = (manager.inventory[n]["id"] for n in sorted(manager) if not n.startswith("_"))
 
         unknown_resrefs = []
+        resources = []
         for resref in resrefs:
             try:
-                resource = manager.get_resource(resref, resref_type)
-                name = resource.name
+                resources.append(manager.get_resource(resref, resref_type))
             except ResourceNotFoundError as e:
                 lgr.debug("Resource %s not found: %s", resref, exc_str(e))
                 unknown_resrefs.append(resref)
-                continue
             except ResourceError as e:
                 lgr.warning("Manager did not return a resource for %s: %s", resref, exc_str(e))
-                continue
 
+        def refresh_status(resource):
+            resource.connect()
+            if not resource.id:
+                resource.status = "NOT FOUND"
+
+        if refresh:
+            if timeout is None:
+                timeout = cfg.get_as_dtype("resources", "timeout", float, default=60)
+            # Report each resource as soon as it responds.
+            done = iter_concurrently(
+                refresh_status,
+                resources,
+                max_workers=cfg.get_as_dtype("resources", "max workers", int, default=8),
+                timeout=timeout,
+            )
+        else:
+            done = ((resource, None, None) for resource in resources)
+
+        for resource, _, exc in done:
+            name = resource.name
             if refresh:
-                try:
-                    resource.connect()
-                    if not resource.id:
-                        resource.status = "NOT FOUND"
-                except Exception as e:
-                    lgr.debug("%s resource query error: %s", name, exc_str(e))
+                if isinstance(exc, TimeoutError):
+                    lgr.debug("%s resource query timed out", name)
+                    resource.status = "TIMED OUT"
+                elif exc:
+                    lgr.debug("%s resource query error: %s", name, exc_str(exc))
                     resource.status = "CONNECTION ERROR"
 
                 manager.inventory[name].update({"status": resource.status})
@@ -8,16 +8,21 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Analyze existing spec or session file system to gather more detailed information"""
 
+import concurrent.futures
 from os.path import normpath
 import sys
 import time
 
+from reproman import cfg
 from reproman.resource.session import get_local_session
+from reproman.resource.session import PathStatCache
 from reproman.resource.session import Session
 from .common_opts import resref_opt
 from .common_opts import resref_type_opt
 from .base import Interface
+from ..support.constraints import EnsureInt
 from ..support.constraints import EnsureNone
+from ..support.constraints import EnsureRange
 from ..support.constraints import EnsureStr
 from ..support.exceptions import InsufficientArgumentsError
 from ..support.param import Parameter
@@ -81,12 +86,47 @@ class Retrace(Interface):
             constraints=EnsureStr() | EnsureNone(),
         ),
         resref_type=resref_type_opt,
+        no_cache=Parameter(
+            args=("--no-cache",),
+            action="store_true",
+            doc="""Do not use results of package queries cached by previous
+            runs (and do not cache the results of this run).  Results for the
+            local machine are cached only if the 'cache localhost' option in
+            the [retrace] section of the configuration is true.""",
+        ),
+        refresh_cache=Parameter(
+            args=("--refresh-cache",),
+            action="store_true",
+            doc="""Discard results of package queries cached by previous runs
+            for the resource before tracing.""",
+        ),
+        jobs=Parameter(
+            args=(
+                "-J",
+                "--jobs",
+            ),
+            metavar="NJOBS",
+            doc="""Number of tracers to run concurrently.  By default,
+            tracers run one after another.  Note that concurrent tracers share
+            the session with the resource, which might not support concurrent
+            use.""",
+            constraints=EnsureInt() & EnsureRange(min=1),
+        ),
     )
 
     # TODO: add a session/resource so we could trace within
     # arbitrary sessions
     @staticmethod
-    def __call__(path=None, spec=None, output_file=None, resref=None, resref_type="auto"):
+    def __call__(
+        path=None,
+        spec=None,
+        output_file=None,
+        resref=None,
+        resref_type="auto",
+        no_cache=False,
+        refresh_cache=False,
+        jobs=1,
+    ):
         # heavy import -- should be delayed until actually used
 
         if not (spec or path):
@@ -109,6 +149,11 @@ class Retrace(Interface):
         # The tracers assume normalized paths.
         paths = list(map(normpath, paths))
 
+        # ID to cache results of package queries under.  Sessions given by
+        # Python callers cannot be identified, so nothing is cached for them.
+        # Package databases on the local machine are cheap enough to query
+        # that caching results for it has to be enabled explicitly.
+        resource_id = None
         if isinstance(resref, Session):
             # TODO: Special case for Python callers.  Is this something we want
             # to handle more generally at the interface level?
@@ -116,14 +161,27 @@ class Retrace(Interface):
         elif resref:
             resource = get_manager().get_resource(resref, resref_type)
             session = resource.get_session()
+            resource_id = resource.id
         else:
             session = get_local_session()
+            if cfg.getboolean("retrace", "cache localhost", default=False):
+                resource_id = "localhost"
+
+        cache = None
+        if resource_id and not no_cache:
+            from reproman.distributions.cache import TracerCache
+
+            cache = TracerCache(resource_id)
+            if refresh_cache:
+                cache.clear()
 
         # TODO: at the moment assumes just a single distribution etc.
         #       Generalize
         # TODO: RF so that only the above portion is reprozip specific.
         # If we are to reuse their layout largely -- the rest should stay as is
-        (distributions, files) = identify_distributions(paths, session=session)
+        (distributions, files) = identify_distributions(
+            paths, session=session, cache=cache, jobs=jobs
+        )
         from reproman.distributions.base import EnvironmentSpec
 
         spec = EnvironmentSpec(
@@ -145,13 +203,25 @@ class Retrace(Interface):
 # TODO: session should be with a state.  Idea is that if we want
 #  to trace while inheriting all custom PATHs which that run might have
 #  had
-def identify_distributions(files, session=None, tracer_classes=None):
+def identify_distributions(files, session=None, tracer_classes=None, cache=None, jobs=1):
     """Identify packages files belong to
 
+    Tracers claim files in the order of `tracer_classes`, each one getting
+    the files not claimed by the previous ones.  To not wait for them one
+    after another, all tracers can first run concurrently on the same files.
+    Their results are then taken in order, and a tracer which claimed files
+    already claimed by a previous one is run again on the remaining files,
+    so the result does not depend on the concurrency.
+
     Parameters
     ----------
     files : iterable
       Files to consider
+    cache : TracerCache, optional
+      Persistent cache for the results of package queries done by tracers
+    jobs : int, optional
+      Number of tracers to run concurrently.  By default, tracers run one
+      after another.  `session` has to support concurrent use for more.
 
     Returns
     -------
@@ -176,62 +246,97 @@ def identify_distributions(files, session=None, tracer_classes=None):
     files_processed = set()
     files_to_trace = files_to_consider
 
+    # Query status of all the files at once and share it across the tracers
+    stat_cache = PathStatCache(session)
+    stat_cache.prefetch(files_to_consider)
+
+    def get_files_to_trace(Tracer, files_to_consider):
+        # Pull out directories if the tracer can't handle them
+        if Tracer.HANDLES_DIRS:
+            return files_to_consider
+        return {f for f in files_to_consider if not stat_cache.isdir(f)}
+
+    def trace(Tracer, files_to_trace):
+        lgr.debug("Tracing using %s", Tracer.__name__)
+        tracer = Tracer(session=session, stat_cache=stat_cache, cache=cache)
+        begin = time.time()
+        envs = []
+        remaining_files_to_trace = files_to_trace
+        # yoh things the idea was that tracer might trace even without
+        #     files, so we should not just 'continue' the loop if there is no
+        #     files_to_trace
+        if files_to_trace:
+            for env, remaining_files_to_trace in tracer.identify_distributions(files_to_trace):
+                envs.append(env)
+        lgr.debug("Assigning files to packages by %s took %f seconds", tracer, time.time() - begin)
+        return envs, remaining_files_to_trace
+
+    executor = None
+    if jobs > 1 and len(tracer_classes) > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(jobs, len(tracer_classes)), thread_name_prefix="reproman-tracer"
+        )
+
     niter = 0
     max_niter = 10
-    while True:
-        niter += 1
-        nfiles_processed = len(files_processed)
-        nfiles_to_trace = len(files_to_trace)
-        lgr.info("Entering iteration #%d over Tracers", niter)
-        if niter > max_niter:
-            lgr.error("We did %s iterations already, something is not right" % max_niter)
-            break
-
-        for Tracer in tracer_classes:
-            lgr.debug("Tracing using %s", Tracer.__name__)
-            # TODO: memoize across all loops
-            # Identify directories from the files_to_consider
-            dirs = set(filter(session.isdir, files_to_trace))
-
-            # Pull out directories if the tracer can't handle them
-            if Tracer.HANDLES_DIRS:
-                files_to_trace = files_to_consider
-                files_skipped = set()
-            else:
-                files_to_trace = files_to_consider - dirs
+    try:
+        while True:
+            niter += 1
+            nfiles_processed = len(files_processed)
+            nfiles_to_trace = len(files_to_trace)
+            lgr.info("Entering iteration #%d over Tracers", niter)
+            if niter > max_niter:
+                lgr.error("We did %s iterations already, something is not right" % max_niter)
+                break
+
+            futures = {}
+            if executor:
+                for Tracer in tracer_classes:
+                    guessed_files = get_files_to_trace(Tracer, files_to_consider)
+                    futures[Tracer] = (guessed_files, executor.submit(trace, Tracer, guessed_files))
+
+            for Tracer in tracer_classes:
+                files_to_trace = get_files_to_trace(Tracer, files_to_consider)
                 files_skipped = files_to_consider - files_to_trace
 
-            tracer = Tracer(session=session)
-            begin = time.time()
-            # yoh things the idea was that tracer might trace even without
-            #     files, so we should not just 'continue' the loop if there is no
-            #     files_to_trace
-            if files_to_trace:
-                remaining_files_to_trace = files_to_trace
-                nenvs = 0
-                for env, remaining_files_to_trace in tracer.identify_distributions(files_to_trace):
-                    distributions.append(env)
-                    nenvs += 1
-                files_processed |= files_to_trace - remaining_files_to_trace
-                files_to_trace = remaining_files_to_trace
-                lgr.info(
-                    "%s: %d envs with %d other files remaining",
-                    Tracer.__name__,
-                    nenvs,
-                    len(files_to_trace),
-                )
-
-            # Re-combine any files that were skipped
-            files_to_consider = files_to_trace | files_skipped
-
-            lgr.debug(
-                "Assigning files to packages by %s took %f seconds", tracer, time.time() - begin
-            )
-        if len(files_to_trace) == 0 or (
-            nfiles_processed == len(files_processed) and nfiles_to_trace == len(files_to_trace)
-        ):
-            lgr.info("No more changes or files to track.  Exiting the loop")
-            break
+                if Tracer in futures:
+                    guessed_files, future = futures[Tracer]
+                    envs, remaining_files_to_trace = future.result()
+                    # Files claimed by the previous tracers in this iteration
+                    taken_files = guessed_files - files_to_trace
+                    if taken_files - remaining_files_to_trace:
+                        lgr.debug(
+                            "%s claimed files claimed by previous tracers, rerunning it",
+                            Tracer.__name__,
+                        )
+                        envs, remaining_files_to_trace = trace(Tracer, files_to_trace)
+                    else:
+                        remaining_files_to_trace = remaining_files_to_trace - taken_files
+                else:
+                    envs, remaining_files_to_trace = trace(Tracer, files_to_trace)
+
+                distributions.extend(envs)
+                if files_to_trace:
+                    files_processed |= files_to_trace - remaining_files_to_trace
+                    files_to_trace = remaining_files_to_trace
+                    lgr.info(
+                        "%s: %d envs with %d other files remaining",
+                        Tracer.__name__,
+                        len(envs),
+                        len(files_to_trace),
+                    )
+
+                # Re-combine any files that were skipped
+                files_to_consider = files_to_trace | files_skipped
+
+            if len(files_to_trace) == 0 or (
+                nfiles_processed == len(files_processed) and nfiles_to_trace == len(files_to_trace)
+            ):
+                lgr.info("No more changes or files to track.  Exiting the loop")
+                break
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
     return distributions, files_to_consider
 
@@ -204,9 +204,36 @@ JOB_PARAMETERS = collections.OrderedDict(
          only for DataLad run orchestrators.""",
         ),
         # TODO: Add more information for the rest of these.
-        ("memory, num_processes", """Supported by Condor and PBS submitters."""),
+        (
+            "memory, num_processes",
+            """Supported by Condor and PBS submitters. The local-pool submitter
+        supports memory, limiting the address space of each subjob (in MB).""",
+        ),
+        (
+            "max_workers, cpu_affinity",
+            """Maximum number of subjobs to run at once and CPUs (e.g., '0-3,6')
+        to run them on. Supported by local-pool submitter.""",
+        ),
         ("num_nodes, walltime", """Supported by PBS submitter."""),
         ("queue", """Supported by Slurm submitter."""),
+        (
+            "pack_size, pack_workers",
+            """Number of subjobs to run in each task submitted to the batch
+        system and how many of them to run at once within a task. Packing many
+        short subjobs into a task avoids the overhead of scheduling each of
+        them. Subjobs keep their own status and log files. Not supported with
+        Launcher or by the local-pool submitter, which doesn't have that
+        overhead.""",
+        ),
+        (
+            "status_log",
+            """If set to "true", subjobs record their status in a single
+        append-only file rather than in a file per subjob (and another one
+        for each failed subjob), which is easier on file systems for jobs with
+        many subjobs. Each line is appended while holding the lock that
+        subjobs also take to count finished subjobs, so lines don't get lost
+        or mixed up on network file systems such as NFS or Lustre.""",
+        ),
         (
             "launcher",
             """If set to "true", the job will be run using Launcher, rather than 
@@ -7,6 +7,8 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
 import contextlib
+import threading
+from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
@@ -96,3 +98,31 @@ def test_ls_unknown(resource_manager):
     with patch("reproman.interface.ls.get_manager", return_value=resource_manager):
         with pytest.raises(ResourceNotFoundError):
             ls(resrefs=["unknown"], resref_type="name")
+
+
+def test_ls_refresh_timeout():
+    manager = ResourceManager()
+    manager.inventory = {
+        name: {"name": name, "type": "shell", "id": name + "-id", "status": "available"}
+        for name in ["fast", "slow"]
+    }
+    manager.save_inventory = MagicMock()
+    release = threading.Event()
+
+    def connect(self):
+        if self.name == "slow":
+            release.wait(5)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patch("reproman.interface.ls.get_manager", return_value=manager))
+        stack.enter_context(patch("reproman.resource.shell.Shell.connect", connect))
+        try:
+            results = ls(refresh=True, timeout=0.2)
+        finally:
+            release.set()
+    # Results come in as resources respond.
+    assert list(results) == ["fast-id", "slow-id"]
+    assert results["fast-id"][-1] == "available"
+    assert results["slow-id"][-1] == "TIMED OUT"
+    assert manager.inventory["slow"]["status"] == "TIMED OUT"
+    manager.save_inventory.assert_called_once_with()
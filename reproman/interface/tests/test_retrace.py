@@ -8,8 +8,13 @@
 
 from reproman.cmdline.main import main
 from reproman.formats import Provenance
+from reproman.resource.session import PathStat
 
 import logging
+import os
+import pytest
+import threading
+import time
 
 from reproman.utils import swallow_logs, swallow_outputs, make_tempfile
 from reproman.tests.utils import (
@@ -20,6 +25,8 @@ from reproman.tests.skip import mark
 
 from ..retrace import identify_distributions
 
+lgr = logging.getLogger("reproman.tests.retrace")
+
 
 def test_retrace(reprozip_spec2):
     """
@@ -54,15 +61,22 @@ def test_retrace_normalize_paths():
         assert "name: debian" in cm.out
 
 
+@pytest.mark.parametrize("jobs", ["0", "-1", "many"])
+def test_retrace_invalid_jobs(jobs):
+    with swallow_outputs(), pytest.raises(SystemExit):
+        main(["retrace", "-J", jobs, COMMON_SYSTEM_PATH])
+
+
 def get_tracer_session(protocols):
     class FakeSession(object):
         """A fake session attributes and methods of which should not
-        actually be used only but isdir.
+        actually be used only but stat_batch.
         If anything else is accessed, it means that we have some assumptions
         """
 
-        def isdir(self, _):
-            return False  # TODO: make it parametric
+        def stat_batch(self, paths):
+            # TODO: make it parametric
+            return {p: PathStat(path=p, type="file") for p in paths}
 
     tracer_classes = []
     for itracer, protocol in enumerate(protocols):
@@ -71,7 +85,7 @@ def get_tracer_session(protocols):
             _protocol = protocol[:]
             HANDLES_DIRS = False  # ???
 
-            def __init__(self, session):
+            def __init__(self, session, stat_cache=None, cache=None):
                 assert session
                 assert self._protocol, "No more protocols to go through, but were were asked to"
                 self._current_protocol = self._protocol.pop(0)
@@ -87,7 +101,11 @@ def get_tracer_session(protocols):
 
 def _check_loop_protocol(protocols, files, tenvs, tfiles):
     tracer_classes, session = get_tracer_session(protocols)
-    dists, unknown_files = identify_distributions(files, session, tracer_classes=tracer_classes)
+    # The protocols do not depend on the files given to the tracers, so run
+    # them one after another
+    dists, unknown_files = identify_distributions(
+        files, session, tracer_classes=tracer_classes, jobs=1
+    )
     assert not any(t._protocol for t in tracer_classes), "we exhausted the protocol"
     assert dists == tenvs
     assert unknown_files == tfiles
@@ -139,3 +157,122 @@ def test_retrace_loop_over_tracers():
         tenvs=["Env1", "Env2", "Env2.1", "Env3"],
         tfiles={"file3"},
     )
+
+
+def test_identify_distributions_stats_once():
+    class CountingSession(object):
+        def __init__(self):
+            self.queried = []
+
+        def stat_batch(self, paths):
+            paths = list(paths)
+            self.queried.append(paths)
+            return {p: PathStat(path=p, type="directory" if p == "dir" else "file") for p in paths}
+
+    tracer_classes, _ = get_tracer_session([[[("Env1", {"file2"})]], [[("Env2", set())]]])
+    session = CountingSession()
+    identify_distributions(
+        ["file1", "file2", "dir"], session, tracer_classes=tracer_classes, jobs=1
+    )
+    # Status of all files was queried in a single batch and then reused
+    assert len(session.queried) == 1
+    assert sorted(session.queried[0]) == ["dir", "file1", "file2"]
+
+
+def test_identify_distributions_concurrently():
+    class Session(object):
+        def stat_batch(self, paths):
+            return {p: PathStat(path=p, type="file") for p in paths}
+
+    def get_tracer_classes(barrier):
+        calls = []
+
+        def make_tracer(name, prefixes):
+            class PrefixTracer(object):
+                HANDLES_DIRS = False
+
+                def __init__(self, session, stat_cache=None, cache=None):
+                    pass
+
+                def identify_distributions(self, files):
+                    calls.append((name, sorted(files)))
+                    if barrier and len(calls) <= 2:
+                        # Both tracers must be running at the same time
+                        barrier.wait()
+                    claimed = {f for f in files if f.startswith(prefixes)}
+                    if claimed:
+                        yield (name, sorted(claimed)), files - claimed
+
+            return PrefixTracer
+
+        return [make_tracer("A", ("a",)), make_tracer("B", ("a1", "b"))], calls
+
+    files = ["a1", "a2", "b1", "c1"]
+    tracer_classes, calls = get_tracer_classes(None)
+    expected = identify_distributions(files, Session(), tracer_classes=tracer_classes, jobs=1)
+    assert expected == ([("A", ["a1", "a2"]), ("B", ["b1"])], {"c1"})
+
+    tracer_classes, calls = get_tracer_classes(threading.Barrier(2, timeout=10))
+    assert (
+        identify_distributions(files, Session(), tracer_classes=tracer_classes, jobs=2) == expected
+    )
+    # B also claimed a1, taken by A, so it was rerun on the files left by A
+    assert sorted(calls[:2]) == [("A", files), ("B", files)]
+    assert calls[2] == ("B", ["b1", "c1"])
+
+
+def _make_tree_files(tmpdir, count):
+    files = []
+    for i in range(count):
+        path = tmpdir.join("d{}".format(i), "f")
+        path.ensure()
+        files.append(str(path))
+    return files
+
+
+def test_identify_distributions_local_no_subprocess(tmpdir):
+    """A retrace in the local session queries files without running commands."""
+    import subprocess
+    from unittest.mock import patch
+
+    from reproman.distributions.conda import CondaTracer
+    from reproman.resource.shell import ShellSession
+
+    # Not in a conda environment, so the tracer checks every directory.
+    files = _make_tree_files(tmpdir, 20)
+    with patch.object(subprocess, "Popen", wraps=subprocess.Popen) as popen:
+        dists, unknown_files = identify_distributions(
+            files, session=ShellSession(), tracer_classes=[CondaTracer]
+        )
+    assert not dists
+    assert set(unknown_files) == set(files)
+    assert not popen.called
+
+
+@pytest.mark.skipif(
+    not os.getenv("REPROMAN_TESTS_BENCHMARK"),
+    reason="Benchmarks are run only if REPROMAN_TESTS_BENCHMARK is set",
+)
+def test_identify_distributions_local_benchmark(tmpdir):
+    """Time a local retrace against one that queries files by commands."""
+    from reproman.distributions.conda import CondaTracer
+    from reproman.resource.session import POSIXSession
+    from reproman.resource.shell import ShellSession
+
+    class CommandShellSession(ShellSession):
+        exists = POSIXSession.exists
+        isdir = POSIXSession.isdir
+        batch = POSIXSession.batch
+        stat_batch = POSIXSession.stat_batch
+
+    files = _make_tree_files(tmpdir, 200)
+    for name, session in [("commands", CommandShellSession()), ("native", ShellSession())]:
+        start = time.perf_counter()
+        dists, unknown_files = identify_distributions(
+            files, session=session, tracer_classes=[CondaTracer]
+        )
+        lgr.info(
+            "Retrace of %d files with %s: %.3f s", len(files), name, time.perf_counter() - start
+        )
+        assert not dists
+        assert set(unknown_files) == set(files)
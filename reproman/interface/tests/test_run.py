@@ -13,6 +13,7 @@ from unittest.mock import patch
 import os
 import os.path as op
 import shutil
+import threading
 import time
 
 import pytest
@@ -433,6 +434,52 @@ def test_jobs_ambig_id_match(context):
     assert "matches multiple jobs" in str(exc.value)
 
 
+def test_jobs_filter_resource(context):
+    run = context["run_fn"]
+    jobs = context["jobs_fn"]
+    resman = context["resource_manager"]
+
+    resman.create("other", resource_type="shell")
+    run(command=["doesntmatter0"], resref="other")
+    run(command=["doesntmatter1"], resref="myshell")
+
+    with swallow_outputs() as output:
+        jobs(queries=[], resref="other")
+        assert "doesntmatter0" in output.out
+        assert "doesntmatter1" not in output.out
+
+
+def test_jobs_status_timeout(context):
+    run = context["run_fn"]
+    jobs = context["jobs_fn"]
+    resman = context["resource_manager"]
+
+    resman.create("slow", resource_type="shell")
+    run(command=["doesntmatter0"], resref="slow")
+    run(command=["doesntmatter1"], resref="myshell")
+
+    from reproman.interface import jobs as jobs_mod
+
+    query_status = jobs_mod._query_status
+    release = threading.Event()
+
+    def hang_on_slow(job, *args, **kwargs):
+        if job["resource_name"] == "slow":
+            release.wait(5)
+        return query_status(job, *args, **kwargs)
+
+    with patch("reproman.interface.jobs._query_status", hang_on_slow):
+        with swallow_outputs() as output:
+            with swallow_logs(new_level=logging.ERROR) as log:
+                try:
+                    jobs(queries=[], status=True, timeout=0.5)
+                finally:
+                    release.set()
+                assert "Querying resource slow timed out" in log.out
+            assert "doesntmatter1" in output.out
+            assert "doesntmatter0" not in output.out
+
+
 def test_jobs_deleted_resource(context):
     run = context["run_fn"]
     jobs = context["jobs_fn"]
@@ -255,35 +255,80 @@ class DockerSession(POSIXSession):
 
         return (out, "")
 
+    @borrowdoc(Session)
+    def stream_command(self, command):
+        lgr.debug("Running command %r", command)
+        execute = self.client.exec_create(container=self.container, cmd=command)
+        err = b""
+        for out_chunk, err_chunk in self.client.exec_start(
+            exec_id=execute["Id"], stream=True, demux=True
+        ):
+            if out_chunk:
+                yield out_chunk
+            if err_chunk:
+                err += err_chunk
+        exit_code = self.client.exec_inspect(execute["Id"])["ExitCode"]
+        if exit_code not in [0, None]:
+            err = utils.to_unicode(err, "utf-8")
+            msg = "Failed to run %r. Exit code=%d. err=%s" % (command, exit_code, err)
+            raise CommandError(utils.command_as_string(command), msg, exit_code, "", err)
+
+    @borrowdoc(POSIXSession)
+    def _spawn_shell(self):
+        from docker.utils.socket import frames_iter
+
+        execute = self.client.exec_create(container=self.container, cmd="sh", stdin=True)
+        sock = self.client.exec_start(exec_id=execute["Id"], socket=True)
+        # Without a TTY, the output is multiplexed into frames for stdout and
+        # stderr.
+        chunks = (data for stream, data in frames_iter(sock, tty=False) if stream == 1)
+        stdin = getattr(sock, "_sock", sock).makefile("wb")
+        return stdin, io.BufferedReader(utils.ChunksReader(chunks)), sock.close
+
     # XXX should we start/stop on open/close or just assume that it is running already?
 
-    @borrowdoc(Session)
-    def put(self, src_path, dest_path, uid=-1, gid=-1):
+    def put(self, src_path, dest_path, uid=-1, gid=-1, progress_callback=None):
+        """Take file on the local file system and copy over into the container
+
+        See `Session.put` for the description of the other parameters.
+
+        Parameters
+        ----------
+        progress_callback : callable, optional
+            Called with the number of bytes of the archive sent so far.
+        """
         # To copy one or more files to the container, the API recommends
         # to do so with a tar archive. http://docker-py.readthedocs.io/en/1.5.0/api/#copy
         dest_path = self._prepare_dest_path(src_path, dest_path, local=False, absolute_only=True)
         dest_dir, dest_basename = os.path.split(dest_path)
-        tar_stream = io.BytesIO()
-        tar_file = tarfile.TarFile(fileobj=tar_stream, mode="w")
-        tar_file.add(src_path, arcname=dest_basename)
-        tar_file.close()
-        tar_stream.seek(0)
-        self.client.put_archive(container=self.container["Id"], path=dest_dir, data=tar_stream)
+        # The archive is streamed to the daemon as it is being created
+        data = utils.report_progress(
+            utils.iter_tar_chunks(src_path, arcname=dest_basename), progress_callback
+        )
+        self.client.put_archive(container=self.container["Id"], path=dest_dir, data=data)
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid)
 
-    @borrowdoc(Session)
-    def get(self, src_path, dest_path=None, uid=-1, gid=-1):
+    def get(self, src_path, dest_path=None, uid=-1, gid=-1, progress_callback=None):
+        """Take file on the container and copy over into the local system
+
+        See `Session.get` for the description of the other parameters.
+
+        Parameters
+        ----------
+        progress_callback : callable, optional
+            Called with the number of bytes of the archive received so far.
+        """
         src_dir, src_basename = os.path.split(src_path)
         dest_path = self._prepare_dest_path(src_path, dest_path)
         dest_dir = os.path.dirname(dest_path)
         stream, stat = self.client.get_archive(self.container, src_path)
         # get_archive() returns a generator with the content (in 2 MB chunks by
-        # default). Consider exposing those chunks as a stream rather than
-        # joining them.
-        tarball = tarfile.open(fileobj=io.BytesIO(b"".join(stream)))
-        tarball.extractall(path=dest_dir)
+        # default), which is extracted as the chunks come in
+        fileobj = utils.ChunksReader(utils.report_progress(stream, progress_callback))
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tarball:
+            tarball.extractall(path=dest_dir)
         os.rename(os.path.join(dest_dir, src_basename), dest_path)
 
         if uid > -1 or gid > -1:
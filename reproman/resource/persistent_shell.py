@@ -0,0 +1,133 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Long-lived shell on a resource to run commands with little overhead.
+
+Instead of a new process (or SSH channel, or Docker exec instance) for each
+command, a single `sh` is started on the resource and commands are sent to
+it one after the other.
+
+The shell is first given the definition of a function which runs a command
+in a subshell, with its stdout and stderr going to temporary files, and
+then writes a response made of a header line with a marker and the exit
+status, the output of `wc -c` for the stdout and stderr files (one line for
+each, and a line with the total), and the content of the files.  Each request
+is a call of that function with the marker and the command as a single
+quoted word.
+"""
+
+import logging
+from shlex import quote as shlex_quote
+import threading
+import uuid
+
+from reproman.support.exceptions import CommandError
+
+lgr = logging.getLogger("reproman.resource.persistent_shell")
+
+_SETUP = r"""
+__rm_dir=$(mktemp -d) || exit 1
+trap 'rm -rf "$__rm_dir"' EXIT
+__rm_run() {
+    ( eval "$2" ) </dev/null >"$__rm_dir/out" 2>"$__rm_dir/err"
+    __rm_status=$?
+    printf '%s %s\n' "$1" "$__rm_status"
+    wc -c "$__rm_dir/out" "$__rm_dir/err"
+    cat "$__rm_dir/out" "$__rm_dir/err"
+}
+"""
+
+
+class PersistentShell(object):
+    """Client side of a long-lived shell.
+
+    Parameters
+    ----------
+    stdin : file object
+        Binary stream writing to the standard input of `sh`.
+    stdout : file object
+        Binary stream reading from the standard output of `sh`.
+    close : callable, optional
+        Called to terminate the shell.
+    """
+
+    def __init__(self, stdin, stdout, close=None):
+        self._stdin = stdin
+        self._stdout = stdout
+        self._close = close
+        self._lock = threading.Lock()
+        self._send(_SETUP)
+
+    def _send(self, text):
+        self._stdin.write(text.encode("utf-8"))
+        self._stdin.flush()
+
+    def _read_response(self, marker):
+        while True:
+            line = self._stdout.readline()
+            if not line:
+                raise EOFError("Persistent shell exited")
+            fields = line.decode("utf-8", "replace").split()
+            if fields and fields[0] == marker:
+                break
+            # Output that does not come from a command we ran (e.g., a login
+            # message)
+            lgr.debug("Ignoring unexpected output of persistent shell: %r", line)
+        status = int(fields[1])
+        sizes = []
+        for _ in range(3):
+            line = self._stdout.readline()
+            if not line:
+                raise EOFError("Persistent shell exited")
+            sizes.append(int(line.split()[0]))
+        nout, nerr, _ = sizes
+        out = self._read_exactly(nout)
+        err = self._read_exactly(nerr)
+        return status, out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
+
+    def _read_exactly(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self._stdout.read(n - len(data))
+            if not chunk:
+                raise EOFError("Persistent shell exited")
+            data += chunk
+        return bytes(data)
+
+    def run(self, command):
+        """Run `command` (a string) in a subshell.
+
+        Returns
+        -------
+        (exit status, stdout, stderr)
+
+        Raises
+        ------
+        OSError or EOFError if the shell is gone.
+        """
+        marker = "__rm_" + uuid.uuid4().hex
+        with self._lock:
+            self._send("__rm_run {} {}\n".format(marker, shlex_quote(command)))
+            return self._read_response(marker)
+
+    def execute_command(self, command):
+        """Run `command` (a string), with the semantics of `Session._execute_command`."""
+        lgr.debug("Running command %r in persistent shell", command)
+        status, out, err = self.run(command)
+        if status != 0:
+            msg = "Failed to run %r. Exit code=%d. out=%s err=%s" % (command, status, out, err)
+            raise CommandError(command, msg, status, out, err)
+        lgr.log(8, "Finished running %r with status %s", command, status)
+        return out, err
+
+    def close(self):
+        try:
+            self._stdin.close()
+        except OSError:
+            pass
+        if self._close:
+            self._close()
@@ -13,26 +13,96 @@ lgr = logging.getLogger("reproman.resource.session")
 
 import attr
 from functools import partial
+import hashlib
+import json
 import os
 import os.path as op
 import re
 from shlex import quote as shlex_quote
+import stat
 import subprocess
 from tempfile import NamedTemporaryFile
+import uuid
 
+from reproman import cfg
 from reproman.cmd import Runner
 from reproman.dochelpers import exc_str, borrowdoc
 from reproman.support.exceptions import (
     CommandError,
     SessionRuntimeError,
 )
-from reproman.utils import updated, to_unicode
+from reproman.utils import attrib, command_as_string, get_cmd_batch_len, updated, to_unicode
 
 import logging
 
 lgr = logging.getLogger("reproman.session")
 
 
+@attr.s(frozen=True)
+class PathStat(object):
+    """Status of a path within a session, as returned by `Session.stat_batch`
+
+    `type` describes the path itself (symlinks are not followed) and is one of
+    "file", "directory", "symlink", or "other".  For symlinks, `target`
+    holds the link content and `target_type` the type of the path it points
+    to (None if the link is dangling).  `mode` holds only the permission bits.
+    Fields which a session cannot determine are left as None.
+    """
+
+    path = attrib(default=attr.NOTHING)
+    type = attrib(default=attr.NOTHING)
+    mode = attrib()
+    size = attrib()
+    mtime = attrib()
+    target = attrib()
+    target_type = attrib()
+
+    @property
+    def isdir(self):
+        """Whether the path is a directory, following symlinks"""
+        return "directory" in (self.type, self.target_type)
+
+
+def _get_path_type(mode):
+    """Map the `st_mode` of a stat result to a `PathStat.type`"""
+    if stat.S_ISREG(mode):
+        return "file"
+    if stat.S_ISDIR(mode):
+        return "directory"
+    if stat.S_ISLNK(mode):
+        return "symlink"
+    return "other"
+
+
+class PathStatCache(object):
+    """Memoize `Session.stat_batch` results
+
+    Meant to be used for the duration of a single (read-only) walk over a
+    session's file system, e.g. a retrace, so that status of every path is
+    queried at most once and in as few batched calls as possible.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._stats = {}
+
+    def prefetch(self, paths):
+        """Query status of all not yet known `paths` in one batch"""
+        missing = [p for p in dict.fromkeys(paths) if p not in self._stats]
+        if missing:
+            self._stats.update(self._session.stat_batch(missing))
+
+    def stat(self, path):
+        """Return `PathStat` for `path`, or None if it does not exist"""
+        if path not in self._stats:
+            self.prefetch([path])
+        return self._stats[path]
+
+    def isdir(self, path):
+        st = self.stat(path)
+        return bool(st and st.isdir)
+
+
 @attr.s
 class Session(object):
     """Interface for Resources to provide interaction within that environment"""
@@ -233,6 +303,30 @@ class Session(object):
         """
         raise NotImplementedError
 
+    def stream_command(self, command):
+        """Run `command` in the environment, yielding its output as it comes.
+
+        Unlike with `execute_command`, the output is not held in memory as a
+        whole (e.g., for an archive to extract locally).
+
+        Parameters
+        ----------
+        command : list of str
+
+        Yields
+        ------
+        bytes
+            Chunks of the standard output of the command.
+
+        Raises
+        ------
+        CommandError
+           if the command fails, once its output has been consumed.
+        NotImplementedError
+           if the session cannot stream the output of commands.
+        """
+        raise NotImplementedError
+
     #
     # Files query and manipulation
     # TODO:  should be in subspace (.path) may be? This would allow for
@@ -285,6 +379,97 @@ class Session(object):
         """
         raise NotImplementedError
 
+    def stat_batch(self, paths):
+        """Query status of multiple paths at once.
+
+        Sessions which execute commands remotely should override this to
+        query all `paths` in as few round-trips as possible.  This generic
+        implementation falls back to `isdir` and `exists` for each path, so
+        only `PathStat.type` gets known.
+
+        Parameters
+        ----------
+        paths : iterable of str
+            Paths in the resource environment.
+
+        Returns
+        -------
+        dict
+            Maps each path to a `PathStat`, or to None if it does not exist.
+        """
+        stats = {}
+        for path in paths:
+            if self.isdir(path):
+                stats[path] = PathStat(path=path, type="directory")
+            elif self.exists(path):
+                stats[path] = PathStat(path=path, type="file")
+            else:
+                stats[path] = None
+        return stats
+
+    def batch(self, operations):
+        """Run multiple operations on the resource at once.
+
+        Sessions which execute commands remotely should override this to
+        run all `operations` in as few round-trips as possible.  This
+        generic implementation runs them one at a time.
+
+        Parameters
+        ----------
+        operations : iterable of dict
+            Each has an "op" and its parameters, one of
+
+            - "stat" (path): `PathStat`, or None if the path does not exist
+            - "exists" (path), "isdir" (path): bool
+            - "mtime" (path): modification time of the path, as a float
+            - "read" (path): content of the file
+            - "hash" (path, algorithm="md5"): hex digest of the file content
+            - "list" (path): sorted names of the entries of the directory
+            - "run" (args): (stdout, stderr, exit status) of the command,
+              e.g., a query of the package manager
+
+        Returns
+        -------
+        list of (result, error)
+            For each operation, its result and None, or None and an error
+            message if it failed.
+        """
+        return [self._run_operation(operation) for operation in operations]
+
+    def _run_operation(self, operation):
+        operation = dict(operation)
+        name = operation.pop("op", None)
+        try:
+            if name == "stat":
+                path = operation["path"]
+                result = self.stat_batch([path])[path]
+            elif name == "exists":
+                result = self.exists(operation["path"])
+            elif name == "isdir":
+                result = self.isdir(operation["path"])
+            elif name == "mtime":
+                result = float(self.get_mtime(operation["path"]))
+            elif name == "read":
+                result = self.read(operation["path"])
+            elif name == "hash":
+                algorithm = operation.get("algorithm", "md5")
+                out, _ = self.execute_command([algorithm + "sum", operation["path"]])
+                result = out.split()[0]
+            elif name == "list":
+                out, _ = self.execute_command(["ls", "-A", operation["path"]])
+                result = sorted(out.splitlines())
+            elif name == "run":
+                try:
+                    out, err = self.execute_command(operation["args"])
+                    result = (out, err, 0)
+                except CommandError as exc:
+                    result = (exc.stdout or "", exc.stderr or "", exc.code)
+            else:
+                return None, "Unknown operation: {}".format(name)
+        except Exception as exc:
+            return None, exc_str(exc)
+        return result, None
+
     def _prepare_dest_path(self, src_path, dest_path, local=True, absolute_only=False):
         """Do common handling for the destination target of `get` and `put`.
 
@@ -551,11 +736,114 @@ class Session(object):
 class POSIXSession(Session):
     """A Session which relies on commands present in any POSIX-compliant env"""
 
+    # GNU find reports all we need about a path in a single -printf.  Fields
+    # are NUL separated, with the free-form ones (target and path) last.
+    _STAT_FIELDS = 7
+    _STAT_BATCH_SCRIPT = (
+        r'find "$@" -maxdepth 0 -printf "%y\0%Y\0%m\0%s\0%T@\0%l\0%p\0" 2>/dev/null; exit 0'
+    )
+    _STAT_TYPES = {"f": "file", "d": "directory", "l": "symlink"}
+
     # -0 is not provided by busybox's env command.  So if we decide to make it
     # even more portable - something to be done
     _GET_ENVIRON_CMD = ["env", "-0"]
     _ALT_GET_ENVIRON_CMD = ["perl", "-e", r'foreach (keys %ENV) {print "$_=$ENV{$_}\0";}']
 
+    def __attrs_post_init__(self):
+        super(POSIXSession, self).__attrs_post_init__()
+        # Whether to run commands in a persistent shell (see
+        # reproman.resource.persistent_shell).  If None, the "persistent
+        # shell" option of the [session] configuration section decides.
+        self.persistent_shell = None
+        self._shell = None
+        # Path of the helper used by `batch` on the resource, or False if it
+        # can't be used.
+        self._helper = None
+
+    def _spawn_shell(self):
+        """Start `sh` in the environment, for use as a persistent shell.
+
+        Returns
+        -------
+        (stdin, stdout, close) : the binary streams to write to the standard
+        input of the shell and read from its standard output, and a callable
+        to terminate it (or None).
+
+        Raises
+        ------
+        NotImplementedError if the session does not support it.
+        """
+        raise NotImplementedError
+
+    def _get_shell(self):
+        """Return the persistent shell, or None if not used."""
+        enabled = self.persistent_shell
+        if enabled is None:
+            enabled = cfg.getboolean("session", "persistent shell", default=False)
+        if not enabled:
+            return None
+        if self._shell is None:
+            from reproman.resource.persistent_shell import PersistentShell
+
+            try:
+                self._shell = PersistentShell(*self._spawn_shell())
+            except NotImplementedError:
+                lgr.debug("%s does not support a persistent shell", self.__class__.__name__)
+                self.persistent_shell = False
+            except Exception as exc:
+                lgr.warning("Not using a persistent shell: %s", exc_str(exc))
+                self.persistent_shell = False
+        return self._shell
+
+    def _get_retry_command(self, command, stderr):
+        """Return the command to run again after `command` failed.
+
+        Parameters
+        ----------
+        command : str
+            The failed command, without any env or cwd prefix.
+        stderr : str
+            Its standard error.
+
+        Returns
+        -------
+        str, or None if the failure is final (the default).
+        """
+        return None
+
+    @borrowdoc(Session)
+    def execute_command(self, command, env=None, cwd=None, with_shell=False):
+        shell = self._get_shell()
+        if shell is None:
+            return super(POSIXSession, self).execute_command(
+                command, env=env, cwd=cwd, with_shell=with_shell
+            )
+        command = command_as_string(command)
+        env = dict(self._env, **(env or {}))
+        prefixed = self._prefix_command(command, env=env, cwd=cwd, with_shell=with_shell)
+        try:
+            try:
+                return shell.execute_command(prefixed)
+            except CommandError as exc:
+                retry_command = self._get_retry_command(command, exc.stderr)
+                if retry_command is None:
+                    raise
+            return shell.execute_command(
+                self._prefix_command(retry_command, env=env, cwd=cwd, with_shell=with_shell)
+            )
+        except (OSError, EOFError) as exc:
+            # Start a new one for the next command.
+            self._shell = None
+            shell.close()
+            raise CommandError(prefixed, "Persistent shell failed: {}".format(exc_str(exc)))
+
+    @borrowdoc(Session)
+    def close(self):
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+        super(POSIXSession, self).close()
+
     @borrowdoc(Session)
     def query_envvars(self):
         try:
@@ -720,6 +1008,151 @@ class POSIXSession(Session):
         command = ["test", "-e", shlex_quote(path), "&&", "echo", "Found"]
         return ["bash", "-c", " ".join(command)]
 
+    def _stat_batch_supported(self):
+        supported = getattr(self, "_stat_batch_support", None)
+        if supported is None:
+            try:
+                out, _ = self.execute_command(["find", "/", "-maxdepth", "0", "-printf", "ok"])
+                supported = out == "ok"
+            except CommandError as exc:
+                lgr.debug("find -printf is not available: %s", exc_str(exc))
+                supported = False
+            if not supported:
+                lgr.debug("Will stat paths one at a time in %s", self)
+            self._stat_batch_support = supported
+        return supported
+
+    @borrowdoc(Session)
+    def stat_batch(self, paths):
+        paths = list(paths)
+        if not paths:
+            return {}
+        if not self._stat_batch_supported():
+            if self._get_helper():
+                results = self.batch({"op": "stat", "path": p} for p in paths)
+                if not any(error for _, error in results):
+                    return {p: st for p, (st, _) in zip(paths, results)}
+            return super(POSIXSession, self).stat_batch(paths)
+        # Make sure that find would not take a path for an expression
+        args = {(p if p.startswith(("/", "./")) else "./" + p): p for p in paths}
+        command = ["sh", "-c", self._STAT_BATCH_SCRIPT, "sh"]
+        num_args = get_cmd_batch_len(args, sum(map(len, command)) + len(command))
+        arg_list = list(args)
+        stats = dict.fromkeys(paths)
+        while arg_list:
+            batch, arg_list = arg_list[:num_args], arg_list[num_args:]
+            out, _ = self.execute_command(command + batch)
+            fields = to_unicode(out, "utf-8").split("\0")[:-1]
+            if len(fields) % self._STAT_FIELDS:
+                raise SessionRuntimeError("Failed to parse output of find: %r" % out)
+            for i in range(0, len(fields), self._STAT_FIELDS):
+                ltype, ftype, mode, size, mtime, target, arg = fields[i : i + self._STAT_FIELDS]
+                path = args[arg]
+                ltype = self._STAT_TYPES.get(ltype, "other")
+                if ltype == "symlink":
+                    # find reports N and L for dangling links and loops
+                    target_type = self._STAT_TYPES.get(ftype) if ftype not in "NL" else None
+                else:
+                    target = target_type = None
+                stats[path] = PathStat(
+                    path=path,
+                    type=ltype,
+                    mode=int(mode, 8),
+                    size=int(size),
+                    mtime=float(mtime),
+                    target=target,
+                    target_type=target_type,
+                )
+        return stats
+
+    def _get_helper(self):
+        """Return the path of the helper on the resource, or None if not usable."""
+        if self._helper is None:
+            self._helper = self._install_helper() or False
+        return self._helper or None
+
+    def _install_helper(self):
+        """Upload the helper unless the resource already has this version.
+
+        Like the tracer of `reproman execute`, it is kept under
+        ~/.cache/reproman, in a directory named after its checksum.
+        """
+        from reproman.resource import session_helper
+
+        local_helper = op.splitext(session_helper.__file__)[0] + ".py"
+        with open(local_helper, "rb") as fh:
+            md5sum = hashlib.md5(fh.read()).hexdigest()
+        script = (
+            "command -v python3 >/dev/null || exit 0; "
+            'p="$HOME/.cache/reproman/helpers/{}/reproman_helper.py"; '
+            'echo "$p"; test -e "$p" && echo found; exit 0'.format(md5sum)
+        )
+        try:
+            out, _ = self.execute_command(["sh", "-c", script])
+        except CommandError as exc:
+            lgr.debug("Not using the session helper: %s", exc_str(exc))
+            return None
+        lines = out.splitlines()
+        if not lines:
+            lgr.debug("Not using the session helper: python3 is not available in %s", self)
+            return None
+        remote_helper = lines[0]
+        if lines[1:] != ["found"]:
+            lgr.debug("Uploading session helper to %s", remote_helper)
+            # Concurrent uploads must not expose a partial file.
+            tmp_helper = "{}.{}".format(remote_helper, uuid.uuid4().hex)
+            try:
+                self.mkdir(op.dirname(remote_helper), parents=True)
+                self.put(local_helper, tmp_helper)
+                self.execute_command(["mv", tmp_helper, remote_helper])
+            except Exception as exc:
+                lgr.warning("Failed to upload the session helper: %s", exc_str(exc))
+                return None
+        return remote_helper
+
+    @borrowdoc(Session)
+    def batch(self, operations):
+        operations = list(operations)
+        helper = self._get_helper() if operations else None
+        if helper is None:
+            return super(POSIXSession, self).batch(operations)
+        command = ["python3", helper]
+        args = [json.dumps(operation) for operation in operations]
+        num_args = get_cmd_batch_len(args, sum(map(len, command)) + len(command))
+        responses = []
+        try:
+            while args:
+                batch, args = args[:num_args], args[num_args:]
+                out, _ = self.execute_command(command + batch)
+                responses.extend(json.loads(out))
+        except (CommandError, ValueError) as exc:
+            lgr.warning("Session helper failed, not using it anymore: %s", exc_str(exc))
+            self._helper = False
+            return super(POSIXSession, self).batch(operations)
+
+        return [self._parse_helper_response(o, r) for o, r in zip(operations, responses)]
+
+    @staticmethod
+    def _parse_helper_response(operation, response):
+        """Convert a `response` of the helper to the (result, error) of `batch`."""
+        if "error" in response:
+            return None, response["error"]
+        result = response["result"]
+        if operation["op"] == "stat" and result is not None:
+            ltype, mode, size, mtime, target, target_type = result
+            result = PathStat(
+                path=operation["path"],
+                type=ltype,
+                mode=mode,
+                size=size,
+                mtime=mtime,
+                target=target,
+                target_type=target_type,
+            )
+        elif operation["op"] == "run":
+            result = tuple(result)
+        return result, None
+
     # def lexists(self, path):
     #     """Return if file (or just a broken symlink) exists"""
     #     return os.path.lexists(path)
@@ -804,9 +1237,9 @@ class POSIXSession(Session):
         if uid > -1 and gid > -1:
             command += ["{}.{}".format(uid, gid)]
         elif uid > -1:
-            command += [uid]
+            command += [str(uid)]
         elif gid > -1:
-            command += [gid]
+            command += [str(gid)]
         else:
             raise CommandError(
                 cmd="chown",
@@ -0,0 +1,128 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Helper to run a batch of session operations on a resource.
+
+This file is uploaded as is to resources by `POSIXSession.batch` and run
+with their Python 3, so it must not import anything but the standard
+library.
+
+Each argument is an operation, a JSON object with an "op" and its
+parameters (see `OPERATIONS`).  The output is a JSON list with, for each
+operation, either {"result": ...} or {"error": "message"}.
+"""
+
+import hashlib
+import json
+import os
+import stat
+import subprocess
+import sys
+
+
+def _path_type(mode):
+    if stat.S_ISREG(mode):
+        return "file"
+    if stat.S_ISDIR(mode):
+        return "directory"
+    if stat.S_ISLNK(mode):
+        return "symlink"
+    return "other"
+
+
+def op_stat(path):
+    """Return [type, mode, size, mtime, target, target_type], or None."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    ltype = _path_type(st.st_mode)
+    target = target_type = None
+    if ltype == "symlink":
+        target = os.readlink(path)
+        try:
+            target_type = _path_type(os.stat(path).st_mode)
+        except OSError:
+            pass
+    return [ltype, stat.S_IMODE(st.st_mode), st.st_size, st.st_mtime, target, target_type]
+
+
+def op_exists(path):
+    return os.path.exists(path)
+
+
+def op_isdir(path):
+    return os.path.isdir(path)
+
+
+def op_mtime(path):
+    return os.path.getmtime(path)
+
+
+def op_read(path):
+    with open(path, "rb") as fh:
+        return fh.read().decode("utf-8", "replace")
+
+
+def op_hash(path, algorithm="md5"):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def op_list(path):
+    return sorted(os.listdir(path))
+
+
+def op_run(args):
+    """Return [stdout, stderr, exit status] of the command `args`.
+
+    For the queries of package managers (dpkg-query, rpm, pip, ...).
+    """
+    try:
+        proc = subprocess.Popen(
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except OSError as exc:
+        return ["", str(exc), 127]
+    out, err = proc.communicate()
+    return [out.decode("utf-8", "replace"), err.decode("utf-8", "replace"), proc.returncode]
+
+
+OPERATIONS = {
+    "stat": op_stat,
+    "exists": op_exists,
+    "isdir": op_isdir,
+    "mtime": op_mtime,
+    "read": op_read,
+    "hash": op_hash,
+    "list": op_list,
+    "run": op_run,
+}
+
+
+def run_operation(operation):
+    operation = dict(operation)
+    name = operation.pop("op", None)
+    if name not in OPERATIONS:
+        return {"error": "Unknown operation: {}".format(name)}
+    try:
+        return {"result": OPERATIONS[name](**operation)}
+    except Exception as exc:
+        return {"error": "{}: {}".format(type(exc).__name__, exc)}
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    results = [run_operation(json.loads(arg)) for arg in args]
+    sys.stdout.write(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
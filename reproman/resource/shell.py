@@ -9,21 +9,44 @@
 
 import attr
 import shutil
+import subprocess
 
 from .base import Resource
 from reproman.cmd import Runner
-from reproman.dochelpers import borrowdoc
+from reproman.dochelpers import borrowdoc, exc_str
 from reproman.resource.session import Session
 from reproman.support.exceptions import CommandError
 from reproman.utils import attrib
+from reproman.utils import command_as_string
+from reproman.utils import TAR_CHUNK_SIZE
 
 import logging
 
 lgr = logging.getLogger("reproman.resource.shell")
 
 import os
+import tempfile
 
-from .session import POSIXSession, get_updated_env
+from . import session_helper
+from .session import PathStat, POSIXSession, get_updated_env, _get_path_type
+
+
+def _command_error(cmd, exc):
+    """Return the CommandError for `exc` raised by a native implementation of `cmd`."""
+    return CommandError(cmd=cmd, msg=exc_str(exc), code=1, stderr=str(exc))
+
+
+def _raise(exc):
+    raise exc
+
+
+def _iter_tree(path, recursive):
+    """Yield `path` and, if `recursive`, the paths below it."""
+    yield path
+    if recursive and os.path.isdir(path):
+        for root, dirs, files in os.walk(path, onerror=_raise):
+            for name in dirs + files:
+                yield os.path.join(root, name)
 
 
 # For now just assuming that local shell is a POSIX shell
@@ -43,6 +66,14 @@ class ShellSession(POSIXSession):
     @borrowdoc(Session)
     def close(self):
         self._runner = None
+        super(ShellSession, self).close()
+
+    @borrowdoc(POSIXSession)
+    def _spawn_shell(self):
+        proc = subprocess.Popen(
+            ["sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        return proc.stdin, proc.stdout, proc.wait
 
     @borrowdoc(Session)
     def _execute_command(self, command, env=None, cwd=None, with_shell=False):
@@ -66,10 +97,125 @@ class ShellSession(POSIXSession):
             **run_kw,
         )  # , shell=True)
 
+    @borrowdoc(Session)
+    def stream_command(self, command):
+        with tempfile.TemporaryFile() as stderr:
+            env = get_updated_env(os.environ, self._env) if self._env else None
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, env=env)
+            try:
+                yield from iter(lambda: proc.stdout.read(TAR_CHUNK_SIZE), b"")
+            finally:
+                proc.stdout.close()
+                status = proc.wait()
+            if status:
+                stderr.seek(0)
+                err = stderr.read().decode(errors="replace")
+                msg = "Failed to run %r. Exit code=%d. err=%s" % (command, status, err)
+                raise CommandError(command_as_string(command), msg, status, "", err)
+
+    # File queries and manipulations are done in-process rather than with a
+    # command per call as in POSIXSession.  Failures raise CommandError, as
+    # the commands would.
+
+    @borrowdoc(Session)
+    def exists(self, path):
+        return os.path.exists(path)
+
     @borrowdoc(Session)
     def isdir(self, path):
         return os.path.isdir(path)
 
+    @borrowdoc(Session)
+    def get_mtime(self, path):
+        try:
+            return str(os.path.getmtime(path))
+        except OSError as exc:
+            raise _command_error("get_mtime", exc)
+
+    @borrowdoc(Session)
+    def read(self, path, mode="r"):
+        try:
+            with open(path, "rb") as fh:
+                return fh.read().decode()
+        except OSError as exc:
+            raise _command_error("cat", exc)
+
+    @borrowdoc(Session)
+    def mktmpdir(self):
+        # Like mktemp -d, honor a TMPDIR set in the session.
+        return tempfile.mkdtemp(dir=self._env.get("TMPDIR"))
+
+    @borrowdoc(Session)
+    def chmod(self, path, mode, recursive=False):
+        try:
+            mode_bits = int(mode, 8)
+        except (TypeError, ValueError):
+            # A symbolic mode (e.g., "u+x")
+            return super(ShellSession, self).chmod(path, mode, recursive=recursive)
+        try:
+            for p in _iter_tree(path, recursive):
+                # Like chmod -R, ignore symlinks within the tree.
+                if p == path or not os.path.islink(p):
+                    os.chmod(p, mode_bits)
+        except OSError as exc:
+            raise _command_error("chmod", exc)
+
+    @borrowdoc(Session)
+    def chown(self, path, uid=-1, gid=-1, recursive=False, remote=True):
+        uid = int(uid)  # Command line parameters getting passed as type str
+        gid = int(gid)
+        if uid == -1 and gid == -1:
+            raise CommandError(cmd="chown", msg="Invalid command parameters.")
+        try:
+            for p in _iter_tree(path, recursive):
+                # Like chown -R, don't follow symlinks within the tree.
+                if p != path and os.path.islink(p):
+                    os.lchown(p, uid, gid)
+                else:
+                    os.chown(p, uid, gid)
+        except OSError as exc:
+            raise _command_error("chown", exc)
+
+    @borrowdoc(Session)
+    def batch(self, operations):
+        results = []
+        for operation in operations:
+            if operation.get("op") == "run":
+                # Run with the environment of the session.
+                results.append(self._run_operation(operation))
+            else:
+                response = session_helper.run_operation(operation)
+                results.append(self._parse_helper_response(operation, response))
+        return results
+
+    @borrowdoc(Session)
+    def stat_batch(self, paths):
+        stats = {}
+        for path in paths:
+            try:
+                st = os.lstat(path)
+            except OSError:
+                stats[path] = None
+                continue
+            ltype = _get_path_type(st.st_mode)
+            target = target_type = None
+            if ltype == "symlink":
+                target = os.readlink(path)
+                try:
+                    target_type = _get_path_type(os.stat(path).st_mode)
+                except OSError:
+                    pass  # dangling symlink
+            stats[path] = PathStat(
+                path=path,
+                type=ltype,
+                mode=st.st_mode & 0o7777,
+                size=st.st_size,
+                mtime=st.st_mtime,
+                target=target,
+                target_type=target_type,
+            )
+        return stats
+
     @borrowdoc(Session)
     def mkdir(self, path, parents=False):
         if not os.path.exists(path):
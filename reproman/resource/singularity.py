@@ -9,6 +9,7 @@
 
 import os
 import logging
+import subprocess
 from shlex import quote as shlex_quote
 
 import attr
@@ -182,6 +183,16 @@ class SingularitySession(POSIXSession):
 
         return (stdout, stderr)
 
+    @borrowdoc(POSIXSession)
+    def _spawn_shell(self):
+        proc = subprocess.Popen(
+            ["singularity", "exec", "instance://{}".format(self.name), "sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return proc.stdin, proc.stdout, proc.wait
+
     def _put_file(self, src_path, dest_path):
         dest_path = self._prepare_dest_path(src_path, dest_path, local=False, absolute_only=True)
         cmd = "cat {} | singularity exec instance://{} tee {} > /dev/null"
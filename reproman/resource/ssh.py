@@ -11,7 +11,11 @@ import attr
 import os
 import stat
 import getpass
+import tarfile
+import threading
 import uuid
+import zlib
+from shlex import quote as shlex_quote
 from ..log import LoggerHelper
 
 # OPT: invoke, fabric and paramiko is imported at the point of use
@@ -24,10 +28,16 @@ if lgr.getEffectiveLevel() < logging.DEBUG:
     LoggerHelper("paramiko").get_initialized_logger()
 
 from .base import Resource
+from reproman import cfg
 from ..utils import attrib
 from ..utils import command_as_string
+from ..utils import iter_tar_chunks
+from ..utils import ChunksReader
+from ..utils import TAR_CHUNK_SIZE
 from reproman.dochelpers import borrowdoc
 from reproman.resource.session import Session
+from reproman.resource.ssh_mux import MuxError
+from reproman.resource.ssh_mux import get_client as get_mux_client
 from ..support.exceptions import CommandError
 
 # Silence CryptographyDeprecationWarning's.
@@ -38,6 +48,11 @@ import warnings
 
 warnings.filterwarnings(action="ignore", module=".*paramiko.*")
 
+# Open connections, shared by the SSH resources of this process with the same
+# host, user, port, and key file
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
 
 @attr.s
 class SSH(Resource):
@@ -58,6 +73,11 @@ class SSH(Resource):
     # Current instance properties, to be set by us, not augmented by user
     status = attrib()
     _connection = attrib()
+    _mux = attrib()
+
+    @property
+    def _connection_key(self):
+        return (self.host, self.user, self.port, self.key_filename)
 
     def _connection_open(self):
         try:
@@ -71,6 +91,11 @@ class SSH(Resource):
     def connect(self, password=None):
         """Open a connection to the environment resource.
 
+        An open connection to the same host, as the same user, is reused.
+        If the [ssh] "multiplex" option is set, commands are run through the
+        connections held by the multiplexing daemon (see
+        `reproman.resource.ssh_mux`) instead.
+
         Parameters
         ----------
         password : string
@@ -83,6 +108,18 @@ class SSH(Resource):
         from fabric import Connection
         from paramiko import AuthenticationException
 
+        key = self._connection_key
+        if password is None:
+            with _CONNECTIONS_LOCK:
+                connection = _CONNECTIONS.get(key)
+            if connection is not None and connection.is_connected:
+                lgr.debug("Reusing SSH connection to %s", self.host)
+                self._connection = connection
+                self.status = "ONLINE"
+                return
+            if self._connect_mux():
+                return
+
         connect_kwargs = {}
         if self.key_filename:
             connect_kwargs["key_filename"] = [self.key_filename]
@@ -115,6 +152,36 @@ class SSH(Resource):
                 self.host, user=self.user, port=self.port, connect_kwargs={"password": password}
             )
             self._connection_open()
+        with _CONNECTIONS_LOCK:
+            _CONNECTIONS[key] = self._connection
+
+    def _connect_mux(self):
+        """Connect through the multiplexing daemon, if enabled.
+
+        Returns
+        -------
+        True if connected.
+        """
+        from fabric import Connection
+
+        mux = get_mux_client()
+        if mux is None:
+            return False
+        try:
+            mux.request("connect", self._connection_key)
+        except (MuxError, OSError) as exc:
+            # The daemon can't ask for a password, for one.
+            lgr.debug("Not connecting to %s through multiplexing daemon: %s", self.host, exc)
+            return False
+        lgr.debug("Connected to %s through multiplexing daemon", self.host)
+        self._mux = mux
+        # Opened on first use (e.g., to transfer files)
+        connect_kwargs = {"key_filename": [self.key_filename]} if self.key_filename else {}
+        self._connection = Connection(
+            self.host, user=self.user, port=self.port, connect_kwargs=connect_kwargs
+        )
+        self.status = "ONLINE"
+        return True
 
     def create(self):
         """
@@ -138,6 +205,7 @@ class SSH(Resource):
 
     def delete(self):
         self._connection = None
+        self._mux = None
         return
 
     def start(self):
@@ -155,7 +223,11 @@ class SSH(Resource):
         if not self._connection:
             self.connect()
 
-        return (PTYSSHSession if pty else SSHSession)(connection=self._connection)
+        return (PTYSSHSession if pty else SSHSession)(
+            connection=self._connection,
+            mux=None if pty else self._mux,
+            mux_key=self._connection_key,
+        )
 
 
 # Alias SSH class so that it can be discovered by the ResourceManager.
@@ -170,6 +242,46 @@ from reproman.resource.session import POSIXSession
 @attr.s
 class SSHSession(POSIXSession):
     connection = attrib(default=attr.NOTHING)
+    # Client of the multiplexing daemon to run commands through, if any, and
+    # the key of the connection it should use
+    mux = attrib()
+    mux_key = attrib()
+
+    def _run(self, command):
+        """Run `command`, returning its stdout, stderr, and exit status."""
+        if self.mux:
+            try:
+                return self.mux.run(self.mux_key, command)
+            except (MuxError, OSError) as exc:
+                lgr.warning(
+                    "Running commands over a direct connection after the multiplexing "
+                    "daemon failed: %s",
+                    exc,
+                )
+                self.mux = None
+        result = self.connection.run(command, hide=True, warn=True)
+        return result.stdout, result.stderr, result.return_code
+
+    @borrowdoc(POSIXSession)
+    def _spawn_shell(self):
+        if self.mux:
+            # Commands already go over a connection kept open by the daemon.
+            raise NotImplementedError
+        channel = self._open_channel("sh")
+        return channel.makefile("wb"), channel.makefile("rb"), channel.close
+
+    @borrowdoc(POSIXSession)
+    def _get_retry_command(self, command, stderr):
+        if "permission denied" not in stderr.lower():
+            return None
+        # Issue warning once
+        if not getattr(self, "_use_sudo_warning", False):
+            lgr.warning(
+                "Permission is denied for %s. From now on will use 'sudo' " "in such cases",
+                command,
+            )
+            self._use_sudo_warning = True
+        return "sudo " + command
 
     @borrowdoc(Session)
     def _execute_command(
@@ -177,51 +289,42 @@ class SSHSession(POSIXSession):
     ):
         # TODO -- command_env is not used etc...
         # command_env = self.get_updated_env(env)
-        from invoke.exceptions import UnexpectedExit
-
         command = self._prefix_command(
             command_as_string(command), env=env, cwd=cwd, with_shell=with_shell
         )
-        try:
-            result = self.connection.run(command, hide=True)
-        except UnexpectedExit as e:
-            if "permission denied" in e.result.stderr.lower() and handle_permission_denied:
-                # Issue warning once
-                if not getattr(self, "_use_sudo_warning", False):
-                    lgr.warning(
-                        "Permission is denied for %s. From now on will use 'sudo' " "in such cases",
-                        command,
-                    )
-                    self._use_sudo_warning = True
+        stdout, stderr, return_code = self._run(command)
+        if return_code not in [0, None]:
+            retry_command = handle_permission_denied and self._get_retry_command(command, stderr)
+            if retry_command:
                 return self._execute_command(
-                    "sudo " + command,
+                    retry_command,
                     env=env,
                     cwd=cwd,
                     handle_permission_denied=False,  # there was command_as_string
                 )
-            else:
-                result = e.result
-
-        if result.return_code not in [0, None]:
             msg = "Failed to run %r. Exit code=%d. out=%s err=%s" % (
                 command,
-                result.return_code,
-                result.stdout,
-                result.stderr,
+                return_code,
+                stdout,
+                stderr,
             )
-            raise CommandError(str(command), msg, result.return_code, result.stdout, result.stderr)
+            raise CommandError(str(command), msg, return_code, stdout, stderr)
         else:
-            lgr.log(8, "Finished running %r with status %s", command, result.return_code)
+            lgr.log(8, "Finished running %r with status %s", command, return_code)
 
-        return (result.stdout, result.stderr)
+        return (stdout, stderr)
 
     @borrowdoc(Session)
     def put(self, src_path, dest_path, uid=-1, gid=-1):
         dest_path = self._prepare_dest_path(src_path, dest_path, local=False)
-        sftp = self.connection.sftp()
-        self.transfer_recursive(
-            src_path, dest_path, os.path.isdir, os.listdir, sftp.mkdir, self.connection.put
-        )
+        threshold = _get_archive_threshold()
+        if os.path.isdir(src_path) and _count_local_entries(src_path, threshold) > threshold:
+            self._put_archive(src_path, dest_path)
+        else:
+            sftp = self.connection.sftp()
+            self.transfer_recursive(
+                src_path, dest_path, os.path.isdir, os.listdir, sftp.mkdir, self.connection.put
+            )
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid, recursive=True)
@@ -230,18 +333,169 @@ class SSHSession(POSIXSession):
     def get(self, src_path, dest_path=None, uid=-1, gid=-1):
         dest_path = self._prepare_dest_path(src_path, dest_path)
         sftp = self.connection.sftp()
-        self.transfer_recursive(
-            src_path,
-            dest_path,
-            lambda f: stat.S_ISDIR(sftp.stat(f).st_mode),
-            sftp.listdir,
-            os.mkdir,
-            self.connection.get,
-        )
+        threshold = _get_archive_threshold()
+        if (
+            stat.S_ISDIR(sftp.stat(src_path).st_mode)
+            and self._count_remote_entries(src_path, threshold) > threshold
+        ):
+            self._get_archive(src_path, dest_path)
+        else:
+            self.transfer_recursive(
+                src_path,
+                dest_path,
+                lambda f: stat.S_ISDIR(sftp.stat(f).st_mode),
+                sftp.listdir,
+                os.mkdir,
+                self.connection.get,
+            )
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid, remote=False, recursive=True)
 
+    # Transfer of directories with many entries as a tar archive streamed
+    # over a single channel, instead of SFTP calls for each entry.  The
+    # archive can be compressed, as configured with [ssh] "archive
+    # compression" (gzip or zstd).
+
+    def _count_remote_entries(self, path, limit):
+        """Count entries under `path`, stopping past `limit`"""
+        out, _ = self.execute_command(
+            "find {} -mindepth 1 | head -n {} | wc -l".format(shlex_quote(path), limit + 1)
+        )
+        return int(out.strip())
+
+    def _open_channel(self, command):
+        self.connection.open()
+        channel = self.connection.client.get_transport().open_session()
+        lgr.debug("Running %r over a new channel", command)
+        channel.exec_command(command)
+        return channel
+
+    def _close_channel(self, channel, command):
+        status = channel.recv_exit_status()
+        err = channel.makefile_stderr("rb").read().decode(errors="replace")
+        channel.close()
+        if status != 0:
+            msg = "Failed to run %r. Exit code=%d. err=%s" % (command, status, err)
+            raise CommandError(command, msg, status, "", err)
+
+    @borrowdoc(Session)
+    def stream_command(self, command):
+        command = command_as_string(command)
+        channel = self._open_channel(command)
+        yield from iter(lambda: channel.recv(TAR_CHUNK_SIZE), b"")
+        self._close_channel(channel, command)
+
+    def _put_archive(self, src_path, dest_path):
+        compression = _get_archive_compression()
+        command = "mkdir -p {0} && {1}tar -xof - -C {0}".format(
+            shlex_quote(dest_path), _DECOMPRESS_COMMANDS[compression]
+        )
+        channel = self._open_channel(command)
+        lgr.debug("Putting %s to %s as an archive", src_path, dest_path)
+        try:
+            for chunk in _compress(iter_tar_chunks(src_path, arcname="."), compression):
+                channel.sendall(chunk)
+            channel.shutdown_write()
+        except OSError as exc:
+            # The remote end went away.  The exit status tells why.
+            lgr.debug("Failed to send the archive: %s", exc)
+        self._close_channel(channel, command)
+
+    def _get_archive(self, src_path, dest_path):
+        compression = _get_archive_compression()
+        command = "cd {} && tar -cf - .{}".format(
+            shlex_quote(src_path), _COMPRESS_COMMANDS[compression]
+        )
+        channel = self._open_channel(command)
+        lgr.debug("Getting %s to %s as an archive", src_path, dest_path)
+        chunks = iter(lambda: channel.recv(TAR_CHUNK_SIZE), b"")
+        os.makedirs(dest_path, exist_ok=True)
+        fileobj = ChunksReader(_decompress(chunks, compression))
+        with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+            tar.extractall(dest_path, members=_owned_by_us(tar))
+        # Consume whatever follows the end of the archive
+        for _ in chunks:
+            pass
+        self._close_channel(channel, command)
+
+
+# Shell pipelines to (de)compress archives on the remote end
+_COMPRESS_COMMANDS = {None: "", "gzip": " | gzip -c", "zstd": " | zstd -c"}
+_DECOMPRESS_COMMANDS = {None: "", "gzip": "gzip -dc | ", "zstd": "zstd -dc | "}
+
+
+def _get_archive_threshold():
+    """Number of entries in a directory past which it is transferred as an archive"""
+    return cfg.get_as_dtype("ssh", "archive threshold", int, default=100)
+
+
+def _get_archive_compression():
+    compression = cfg.get("ssh", "archive compression", default=None) or None
+    if compression not in _COMPRESS_COMMANDS:
+        raise ValueError(
+            "Unknown compression for SSH archive transfers: %s.  Known: gzip, zstd" % compression
+        )
+    return compression
+
+
+def _count_local_entries(path, limit):
+    """Count entries under `path`, stopping past `limit`"""
+    n = 0
+    for _, dirs, files in os.walk(path):
+        n += len(dirs) + len(files)
+        if n > limit:
+            break
+    return n
+
+
+def _compress(chunks, compression):
+    if compression is None:
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(wbits=31)
+    else:
+        import zstandard  # OPT
+
+        compressor = zstandard.ZstdCompressor().compressobj()
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _decompress(chunks, compression):
+    if compression is None:
+        yield from chunks
+        return
+    if compression == "gzip":
+        decompressor = zlib.decompressobj(wbits=31)
+    else:
+        import zstandard  # OPT
+
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    for chunk in chunks:
+        out = decompressor.decompress(chunk)
+        if out:
+            yield out
+    if compression == "gzip":
+        yield decompressor.flush()
+
+
+def _owned_by_us(tar):
+    """Pass through members of `tar`, dropping their ownership
+
+    As with files fetched via SFTP, extracted files should belong to the
+    local user even if it is root.
+    """
+    for member in tar:
+        member.uname = member.gname = ""
+        if hasattr(os, "getuid"):
+            member.uid, member.gid = os.getuid(), os.getgid()
+        yield member
+
 
 @attr.s
 class PTYSSHSession(SSHSession):
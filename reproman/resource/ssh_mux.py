@@ -0,0 +1,353 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Local daemon keeping SSH connections open across ReproMan invocations.
+
+Much like OpenSSH's ControlMaster, the daemon holds authenticated
+connections to SSH hosts and runs commands over them on behalf of its
+clients, which talk to it over a Unix socket.  Running a command then costs
+a round trip to the host instead of a new connection, key exchange, and
+authentication.
+
+It is enabled by setting the "multiplex" option of the [ssh] configuration
+section, and started on demand.  Connections unused for longer than the
+"multiplex ttl" option (in seconds, default: 600) are closed, and the
+daemon exits once it has none left.
+
+Requests and responses are JSON objects sent as single lines.  Requests have
+an "op" ("connect" or "run") and the "key" of the connection, a list of
+host, user, port, and key file.  "run" requests also have a "command".
+Responses to "run" requests have the "stdout", "stderr", and "status" of
+the command.  Failed requests get a response with an "error" message, and
+"auth" set to true if it was an authentication failure.
+"""
+
+import collections
+import json
+import logging
+import os
+import os.path as op
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+lgr = logging.getLogger("reproman.resource.ssh_mux")
+
+
+def get_socket_path():
+    from reproman import cfg
+
+    return op.join(cfg.dirs.user_cache_dir, "ssh-mux", "socket")
+
+
+def _open_connection(key):
+    # OPT: fabric is imported at the point of use
+    from fabric import Connection
+
+    host, user, port, key_filename = key
+    connect_kwargs = {"key_filename": [key_filename]} if key_filename else {}
+    connection = Connection(host, user=user, port=port, connect_kwargs=connect_kwargs)
+    connection.open()
+    return connection
+
+
+class MuxServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server side of the multiplexing daemon.
+
+    Parameters
+    ----------
+    path : str
+        Path of the socket to listen on.
+    ttl : float
+        Number of seconds after which an unused connection is closed.
+    open_connection : callable, optional
+        Given a key, return an open fabric Connection.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, ttl, open_connection=_open_connection):
+        self.ttl = ttl
+        self._open_connection = open_connection
+        self._connections = {}
+        self._key_locks = {}
+        # Number of commands running over each connection
+        self._busy = collections.Counter()
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        dirname = op.dirname(path)
+        os.makedirs(dirname, mode=0o700, exist_ok=True)
+        if op.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                # Left behind by a daemon that is gone.
+                os.unlink(path)
+            else:
+                raise OSError("A daemon is already listening on {}".format(path))
+            finally:
+                probe.close()
+        socketserver.UnixStreamServer.__init__(self, path, _MuxHandler)
+        os.chmod(path, 0o600)
+
+    def get_connection(self, key):
+        key = tuple(key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Connections to different hosts are opened concurrently.
+        with key_lock:
+            with self._lock:
+                connection, _ = self._connections.get(key, (None, None))
+            if connection is None or not connection.is_connected:
+                lgr.debug("Connecting to %s", key)
+                connection = self._open_connection(key)
+            with self._lock:
+                self._connections[key] = connection, time.monotonic()
+                self._last_used = time.monotonic()
+        return connection
+
+    def _run(self, key, connection, command):
+        key = tuple(key)
+        with self._lock:
+            self._busy[key] += 1
+        try:
+            return connection.run(command, hide=True, warn=True, in_stream=False)
+        finally:
+            with self._lock:
+                self._busy[key] -= 1
+                self._connections[key] = connection, time.monotonic()
+                self._last_used = time.monotonic()
+
+    def handle_request_data(self, request):
+        try:
+            connection = self.get_connection(request["key"])
+            if request["op"] == "connect":
+                return {}
+            elif request["op"] == "run":
+                result = self._run(request["key"], connection, request["command"])
+                return {
+                    "stdout": result.stdout,
+                    "stderr": result.stderr,
+                    "status": result.return_code,
+                }
+            return {"error": "Unknown operation: {}".format(request["op"])}
+        except Exception as exc:
+            from paramiko import AuthenticationException
+
+            return {"error": str(exc), "auth": isinstance(exc, AuthenticationException)}
+
+    def reap(self):
+        """Close connections unused for longer than the TTL.
+
+        Returns
+        -------
+        True if the server has been idle for longer than the TTL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, (connection, last_used) in list(self._connections.items()):
+                if now - last_used > self.ttl and not self._busy[key]:
+                    lgr.debug("Closing connection to %s unused for %.0f s", key, now - last_used)
+                    del self._connections[key]
+                    connection.close()
+            return not self._connections and now - self._last_used > self.ttl
+
+    def serve_until_idle(self):
+        """Serve requests until the server has been idle for longer than the TTL."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while not self.reap():
+                time.sleep(min(self.ttl, 30))
+        finally:
+            self.shutdown()
+            self.server_close()
+            if op.exists(self.server_address):
+                os.unlink(self.server_address)
+
+
+class _MuxHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.handle_request_data(json.loads(line.decode()))
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class MuxError(Exception):
+    """A request to the multiplexing daemon failed."""
+
+    def __init__(self, msg, auth=False):
+        super().__init__(msg)
+        self.auth = auth
+
+
+class MuxClient(object):
+    """Client of the multiplexing daemon.
+
+    A client keeps its connections to the daemon open, and can be used from
+    multiple threads.  Each request takes an idle connection (or opens a new
+    one) for its duration, so requests from different threads are served
+    concurrently.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Idle connections, as (socket, file) pairs
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open a new connection to the daemon and add it to the idle ones."""
+        self._release(self._open())
+
+    def _open(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile("rwb")
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    @staticmethod
+    def _close_connection(conn):
+        sock, fh = conn
+        fh.close()
+        sock.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close_connection(conn)
+
+    def request(self, op_, key, **kwds):
+        """Send a request to the daemon and return its response.
+
+        Raises
+        ------
+        MuxError if the request failed.  OSError if the daemon can't be
+        reached.
+        """
+        data = json.dumps(dict(kwds, op=op_, key=list(key))).encode() + b"\n"
+        for attempt in range(2):
+            conn = None
+            with self._lock:
+                # Retry over a new connection rather than another idle one.
+                if self._idle and not attempt:
+                    conn = self._idle.pop()
+            try:
+                if conn is None:
+                    conn = self._open()
+                _, fh = conn
+                fh.write(data)
+                fh.flush()
+                line = fh.readline()
+                if not line:
+                    raise ConnectionError("Multiplexing daemon closed the connection")
+            except OSError:
+                if conn:
+                    self._close_connection(conn)
+                # The daemon may have exited after being idle.
+                if attempt:
+                    raise
+            else:
+                self._release(conn)
+                break
+        response = json.loads(line.decode())
+        if "error" in response:
+            raise MuxError(response["error"], auth=response.get("auth", False))
+        return response
+
+    def run(self, key, command):
+        """Run `command` on the host of `key`.
+
+        Returns
+        -------
+        (stdout, stderr, exit status)
+        """
+        response = self.request("run", key, command=command)
+        return response["stdout"], response["stderr"], response["status"]
+
+
+def _start_daemon(client, ttl):
+    """Start the daemon and connect `client` to it."""
+    lgr.debug("Starting SSH multiplexing daemon listening on %s", client.path)
+    with open(os.devnull, "r+b") as devnull:
+        subprocess.Popen(
+            [sys.executable, "-m", "reproman.resource.ssh_mux", client.path, str(ttl)],
+            stdin=devnull,
+            stdout=devnull,
+            stderr=devnull,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            client._connect()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise OSError("SSH multiplexing daemon did not start")
+            time.sleep(0.05)
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client():
+    """Return a client of the multiplexing daemon, starting it if needed.
+
+    Returns
+    -------
+    MuxClient, or None if multiplexing is not enabled or the daemon could not
+    be started.
+    """
+    global _CLIENT
+    from reproman import cfg
+
+    if not cfg.getboolean("ssh", "multiplex", default=False):
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            client = MuxClient(get_socket_path())
+            try:
+                try:
+                    client._connect()
+                except OSError:
+                    ttl = cfg.get_as_dtype("ssh", "multiplex ttl", float, default=600)
+                    _start_daemon(client, ttl)
+            except OSError as exc:
+                lgr.warning("Not using SSH multiplexing daemon: %s", exc)
+                return None
+            _CLIENT = client
+    return _CLIENT
+
+
+def main(args=None):
+    path, ttl = args or sys.argv[1:]
+    try:
+        server = MuxServer(path, float(ttl))
+    except OSError as exc:
+        # Another daemon won the race.
+        lgr.debug("Not starting SSH multiplexing daemon: %s", exc)
+        return
+    server.serve_until_idle()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,17 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
 import datetime
+from functools import partial
 import logging
 import os
 from fabric import Connection
 from importlib import import_module
 import pytest
 import tempfile
+import time
 import uuid
 
-from ..session import get_updated_env, Session
+from ..session import get_updated_env, POSIXSession, Session
 from ...support.exceptions import CommandError
 from ...utils import chpwd, swallow_logs
 from ...tests.utils import create_tree
@@ -102,6 +104,118 @@ def test_get_updated_env():
     }
 
 
+@pytest.mark.parametrize("posix", [True, False], ids=["posix", "native"])
+def test_stat_batch(tmpdir, posix):
+    from reproman.resource.shell import ShellSession
+
+    tdir = str(tmpdir)
+    create_tree(tdir, {"f": "content", "d": {"sub": ""}, "-dash": ""})
+    os.chmod(os.path.join(tdir, "f"), 0o640)
+    os.symlink("d", os.path.join(tdir, "link"))
+    os.symlink("nowhere", os.path.join(tdir, "dangling"))
+    session = ShellSession()
+    stat_batch = partial(POSIXSession.stat_batch, session) if posix else session.stat_batch
+    with chpwd(tdir):
+        stats = stat_batch(["f", "d", "link", "dangling", "missing", "-dash", "d/sub"])
+    assert stats["missing"] is None
+    assert stats["f"].type == "file"
+    assert stats["f"].mode == 0o640
+    assert stats["f"].size == len("content")
+    assert stats["f"].mtime == pytest.approx(os.path.getmtime(os.path.join(tdir, "f")))
+    assert not stats["f"].isdir
+    assert stats["d"].type == "directory"
+    assert stats["d"].isdir
+    assert stats["link"].type == "symlink"
+    assert stats["link"].target == "d"
+    assert stats["link"].isdir
+    assert stats["dangling"].type == "symlink"
+    assert stats["dangling"].target == "nowhere"
+    assert stats["dangling"].target_type is None
+    assert stats["-dash"].type == "file"
+    assert stats["d/sub"].size == 0
+
+
+def test_stat_batch_fallback(tmpdir):
+    from reproman.resource.shell import ShellSession
+
+    tdir = str(tmpdir)
+    create_tree(tdir, {"f": "", "d": {}})
+    session = ShellSession()
+    # A find without -printf support (e.g. busybox) fails with an error
+    session._stat_batch_support = False
+    # and there is no python3 for the session helper
+    session._helper = False
+    stats = POSIXSession.stat_batch(session, [tdir + "/f", tdir + "/d", tdir + "/missing"])
+    assert stats[tdir + "/f"].type == "file"
+    assert stats[tdir + "/f"].mode is None
+    assert stats[tdir + "/d"].isdir
+    assert stats[tdir + "/missing"] is None
+
+
+@pytest.mark.parametrize("kind", ["helper", "fallback", "native"])
+def test_batch(tmpdir, monkeypatch, kind):
+    from reproman.resource.shell import ShellSession
+
+    monkeypatch.setenv("HOME", str(tmpdir.join("home")))
+    tdir = str(tmpdir.join("tree"))
+    create_tree(tdir, {"f": "content", "d": {"a": "", "b": ""}})
+    session = ShellSession()
+    if kind == "fallback":
+        session._helper = False
+    batch = session.batch if kind == "native" else partial(POSIXSession.batch, session)
+    f, d, missing = [os.path.join(tdir, p) for p in ["f", "d", "missing"]]
+    results = batch(
+        [
+            {"op": "stat", "path": f},
+            {"op": "stat", "path": missing},
+            {"op": "exists", "path": missing},
+            {"op": "isdir", "path": d},
+            {"op": "mtime", "path": f},
+            {"op": "read", "path": f},
+            {"op": "hash", "path": f},
+            {"op": "list", "path": d},
+            {"op": "run", "args": ["sh", "-c", "echo out; exit 3"]},
+            {"op": "read", "path": missing},
+            {"op": "nonsense"},
+        ]
+    )
+    values = [value for value, _ in results]
+    assert values[0].type == "file"
+    assert values[0].size == len("content")
+    assert values[1:4] == [None, False, True]
+    assert values[4] == pytest.approx(os.path.getmtime(f))
+    assert values[5:8] == ["content", "9a0364b9e99bb480dd25e1f0284c8555", ["a", "b"]]
+    assert values[8] == ("out\n", "", 3)
+    assert values[9:] == [None, None]
+    assert [bool(error) for _, error in results] == [False] * 9 + [True] * 2
+
+    helper_dir = tmpdir.join("home", ".cache", "reproman", "helpers")
+    assert helper_dir.check() == (kind == "helper")
+    if kind == "helper":
+        # The helper is uploaded once.
+        session = ShellSession()
+        with swallow_logs(new_level=logging.DEBUG) as log:
+            assert POSIXSession.batch(session, [{"op": "exists", "path": f}]) == [(True, None)]
+            assert "Uploading session helper" not in log.out
+        assert len(helper_dir.listdir()) == 1
+
+
+def test_stat_batch_helper(tmpdir, monkeypatch):
+    from reproman.resource.shell import ShellSession
+
+    monkeypatch.setenv("HOME", str(tmpdir))
+    tdir = str(tmpdir)
+    create_tree(tdir, {"f": ""})
+    os.symlink("f", os.path.join(tdir, "link"))
+    session = ShellSession()
+    session._stat_batch_support = False
+    paths = [os.path.join(tdir, p) for p in ["f", "link", "missing"]]
+    stats = POSIXSession.stat_batch(session, paths)
+    # Unlike the generic fallback, the helper gets all the fields.
+    assert stats == session.stat_batch(paths)
+    assert session._helper
+
+
 def test_get_local_session():
     # get_local_session(env={'LC_ALL': 'C'}, pty=False, shared=None)
     return
@@ -256,6 +370,12 @@ def check_methods(resource_test_dir):
         result = session.isdir("/no/such/dir")
         assert not result
 
+        # Check stat_batch() method
+        stats = session.stat_batch(["/etc", "/etc/hosts", "/no/such/file"])
+        assert stats["/etc"].isdir
+        assert stats["/etc/hosts"].type == "file"
+        assert stats["/no/such/file"] is None
+
         # Create a temporary test file
         with tempfile.TemporaryDirectory(dir=resource_test_dir) as tdir:
             create_tree(
@@ -437,3 +557,194 @@ def test_session_container(location, testing_container, check_methods):
     container = next(c for c in client.containers() if "/testing-container" in c["Names"])
     assert container
     check_methods(location[1], cls(client, container))
+
+
+class LocalChannel(object):
+    """Paramiko-like channel running commands locally"""
+
+    def exec_command(self, command):
+        import subprocess
+
+        self._proc = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def sendall(self, data):
+        self._proc.stdin.write(data)
+
+    def shutdown_write(self):
+        self._proc.stdin.close()
+
+    def recv(self, nbytes):
+        return self._proc.stdout.read1(nbytes)
+
+    def recv_exit_status(self):
+        return self._proc.wait()
+
+    def makefile_stderr(self, mode):
+        return self._proc.stderr
+
+    def close(self):
+        self._proc.stdout.close()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_ssh_session_archive_transfer(tmpdir, compression):
+    from unittest import mock
+    from ..shell import ShellSession
+    from ..ssh import SSHSession
+
+    channels = []
+
+    def open_session():
+        channels.append(LocalChannel())
+        return channels[-1]
+
+    connection = mock.MagicMock()
+    connection.client.get_transport().open_session = open_session
+    # Commands (to count entries) and SFTP calls are run locally too
+    session = SSHSession(connection)
+    session._execute_command = ShellSession()._execute_command
+    connection.sftp().stat = os.stat
+
+    tree = {"d{}".format(i): {"f": "content {}".format(i)} for i in range(10)}
+    tree["top"] = "top"
+    create_tree(str(tmpdir.join("src")), tree)
+    src = str(tmpdir.join("src"))
+    with mock.patch("reproman.resource.ssh._get_archive_threshold", return_value=5):
+        with mock.patch("reproman.resource.ssh._get_archive_compression", return_value=compression):
+            session.put(src, str(tmpdir.join("put", "dest")))
+            session.get(str(tmpdir.join("put", "dest")), str(tmpdir.join("got")) + os.sep)
+    # Each direction went over a single channel rather than SFTP
+    assert len(channels) == 2
+    assert not connection.put.called
+    assert not connection.get.called
+    got = tmpdir.join("got", "dest")
+    assert sorted(os.listdir(str(got))) == sorted(tree)
+    assert got.join("top").read() == "top"
+    assert got.join("d3", "f").read() == "content 3"
+
+
+@pytest.fixture
+def persistent_shell_session():
+    from reproman.resource.shell import ShellSession
+
+    session = ShellSession()
+    session.persistent_shell = True
+    yield session
+    session.close()
+
+
+def test_persistent_shell(persistent_shell_session):
+    session = persistent_shell_session
+    shell = session._get_shell()
+    assert shell is not None
+
+    assert session.execute_command(["printf", "a\nb"]) == ("a\nb", "")
+    assert session.execute_command("echo out; echo err >&2") == ("out\n", "err\n")
+    assert session.execute_command(["echo", "it's $HOME"]) == ("it's $HOME\n", "")
+    out, _ = session.execute_command(["env"], env={"NEW_VAR": "NEW VALUE"})
+    assert "NEW_VAR=NEW VALUE" in out
+    assert session.execute_command(["pwd"], cwd="/var") == ("/var\n", "")
+    # Commands don't affect each other.
+    session.execute_command("cd /var; export LEAK=1; exit 0")
+    assert session.execute_command("echo $LEAK; pwd") == ("\n{}\n".format(os.getcwd()), "")
+    assert session.exists("/etc")
+    assert not session.exists("/no/such/file")
+
+    with pytest.raises(CommandError) as exc:
+        session.execute_command("echo out; echo err >&2; exit 3")
+    assert exc.value.code == 3
+    assert exc.value.stdout == "out\n"
+    assert exc.value.stderr == "err\n"
+
+    # All of the above ran in the same shell.
+    assert session._get_shell() is shell
+
+
+def test_persistent_shell_threads(persistent_shell_session):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(4) as executor:
+        outs = list(
+            executor.map(
+                lambda i: persistent_shell_session.execute_command(["echo", str(i)]), range(20)
+            )
+        )
+    assert outs == [("{}\n".format(i), "") for i in range(20)]
+
+
+def test_persistent_shell_restarted(persistent_shell_session):
+    session = persistent_shell_session
+    shell = session._get_shell()
+    # $$ is the shell, not the subshell running the command.
+    with pytest.raises(CommandError):
+        session.execute_command("kill $$")
+    assert session.execute_command(["echo", "back"]) == ("back\n", "")
+    assert session._get_shell() is not shell
+
+
+def test_persistent_shell_retry(persistent_shell_session, tmpdir):
+    from ..ssh import SSHSession
+
+    session = persistent_shell_session
+    # Retry as the SSH session does after "permission denied".
+    session._get_retry_command = partial(SSHSession._get_retry_command, session)
+    # A sudo which just marks the command as run by it.
+    create_tree(str(tmpdir), {"sudo": '#!/bin/sh\nSUDO_RUN=1 exec "$@"\n'})
+    os.chmod(str(tmpdir.join("sudo")), 0o755)
+    env = {"PATH": str(tmpdir) + os.pathsep + os.environ["PATH"]}
+    command = 'test -n "$SUDO_RUN" || { echo "Permission denied" >&2; exit 1; }; pwd'
+    with swallow_logs(new_level=logging.WARNING) as log:
+        out, _ = session.execute_command(["sh", "-c", command], env=env, cwd="/var")
+        assert "will use 'sudo'" in log.out
+    assert out == "/var\n"
+    # Other failures aren't retried.
+    with pytest.raises(CommandError) as exc:
+        session.execute_command("exit 3", env=env)
+    assert exc.value.code == 3
+
+
+def measure_command_latency(session, backend, n=20):
+    """Report the time it takes `session` to run a trivial command."""
+    latencies = {}
+    for persistent in [False, True]:
+        session.persistent_shell = persistent
+        session.execute_command(["true"])
+        start = time.perf_counter()
+        for _ in range(n):
+            session.execute_command(["test", "-e", "/"])
+        latencies[persistent] = (time.perf_counter() - start) / n * 1000
+    print(
+        "{}: {:.1f} ms per command, {:.1f} ms in a persistent shell".format(
+            backend, latencies[False], latencies[True]
+        )
+    )
+    return latencies
+
+
+def test_command_latency_shell():
+    from reproman.resource.shell import ShellSession
+
+    measure_command_latency(ShellSession(), "shell")
+
+
+@mark.skipif_no_singularity
+def test_command_latency_singularity(singularity_resource):
+    from reproman.resource.singularity import SingularitySession
+
+    measure_command_latency(SingularitySession(singularity_resource.name), "singularity")
+
+
+def test_command_latency_container(testing_container):
+    import docker
+
+    from reproman.resource.docker_container import DockerSession
+
+    client = docker.APIClient()
+    container = next(c for c in client.containers() if "/testing-container" in c["Names"])
+    measure_command_latency(DockerSession(client, container), "docker")
@@ -17,7 +17,9 @@ from unittest.mock import patch, call
 from ...utils import merge_dicts
 from ...utils import swallow_logs
 from ...tests.utils import assert_in
+from ...tests.utils import create_tree
 from ...cmd import Runner
+from ...support.exceptions import CommandError
 from ..shell import Shell, ShellSession
 from .test_session import check_session_passing_envvars
 
@@ -102,6 +104,68 @@ def test_exists():
     assert session.exists("/bin")
 
 
+@pytest.mark.parametrize("native", [True, False], ids=["native", "posix"])
+def test_file_methods(tmpdir, native):
+    from functools import partial
+
+    from ..session import POSIXSession
+
+    session = ShellSession()
+    if native:
+        method = partial(getattr, session)
+    else:
+        method = lambda name: partial(getattr(POSIXSession, name), session)
+
+    tdir = str(tmpdir)
+    create_tree(tdir, {"f": "content\r\nü", "d": {"sub": {"g": ""}}})
+    f = os.path.join(tdir, "f")
+    missing = os.path.join(tdir, "missing")
+    os.symlink(f, os.path.join(tdir, "d", "link"))
+
+    assert method("exists")(f)
+    assert not method("exists")(missing)
+    assert not method("exists")("")
+    assert float(method("get_mtime")(f)) == pytest.approx(os.path.getmtime(f))
+    assert method("read")(f) == "content\r\nü"
+    for name in ["get_mtime", "read"]:
+        with raises(CommandError):
+            method(name)(missing)
+
+    method("chmod")(os.path.join(tdir, "d"), "700", recursive=True)
+    for path in ["d", "d/sub", "d/sub/g"]:
+        assert os.stat(os.path.join(tdir, path)).st_mode & 0o777 == 0o700
+    # The target of the link is not changed.
+    assert os.stat(f).st_mode & 0o777 != 0o700
+    method("chmod")(f, "u+x")
+    assert os.stat(f).st_mode & 0o100
+    with raises(CommandError):
+        method("chmod")(missing, "644")
+
+    method("chown")(os.path.join(tdir, "d"), uid=os.getuid(), recursive=True)
+    method("chown")(f, gid=os.getgid())
+    with raises(CommandError):
+        method("chown")(f)
+    with raises(CommandError):
+        method("chown")(missing, uid=os.getuid())
+
+    tmp = method("mktmpdir")()
+    assert os.path.isdir(tmp)
+    os.rmdir(tmp)
+
+
+def test_stream_command():
+    session = ShellSession()
+    assert b"".join(session.stream_command(["echo", "out"])) == b"out\n"
+    session.set_envvar("LC_ALL", "C")
+    assert b"".join(session.stream_command(["sh", "-c", "echo $LC_ALL"])) == b"C\n"
+    chunks = session.stream_command(["sh", "-c", "echo partial; echo oops >&2; exit 3"])
+    assert next(chunks) == b"partial\n"
+    with raises(CommandError) as cm:
+        next(chunks)
+    assert cm.value.code == 3
+    assert "oops" in cm.value.stderr
+
+
 def test_source_file_param(resource_test_dir):
     temp_file = tempfile.NamedTemporaryFile(dir=resource_test_dir)
     with temp_file as f:
@@ -0,0 +1,169 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import os.path as op
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from ...support.exceptions import CommandError
+from .. import ssh
+from ..ssh import SSH
+from ..ssh import SSHSession
+from ..ssh_mux import MuxClient
+from ..ssh_mux import MuxError
+from ..ssh_mux import MuxServer
+from ..ssh_mux import _start_daemon
+from ...tests.skip import mark
+
+
+class FakeConnection(object):
+    barrier = None
+
+    def __init__(self, key):
+        self.key = key
+        self.is_connected = True
+        self.commands = []
+
+    def run(self, command, **kwargs):
+        self.commands.append(command)
+        if command == "wait":
+            self.barrier.wait()
+        if command == "fail":
+            return SimpleNamespace(stdout="", stderr="oops", return_code=3)
+        return SimpleNamespace(stdout="ran " + command, stderr="", return_code=0)
+
+    def close(self):
+        self.is_connected = False
+
+
+def open_fake_connection(key):
+    if key[0] == "denied":
+        from paramiko import AuthenticationException
+
+        raise AuthenticationException("no way")
+    return FakeConnection(key)
+
+
+@pytest.fixture
+def mux_server(tmpdir):
+    server = MuxServer(str(tmpdir.join("socket")), ttl=60, open_connection=open_fake_connection)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_ssh_connection_reused():
+    with patch.dict(ssh._CONNECTIONS, clear=True), patch("fabric.Connection") as Connection:
+        res0 = SSH(name="a", host="host", user="me")
+        res0.connect()
+        res1 = SSH(name="b", host="host", user="me")
+        res1.connect()
+        assert res1._connection is res0._connection
+        assert Connection.call_count == 1
+        # Another user gets its own connection.
+        SSH(name="c", host="host", user="you").connect()
+        assert Connection.call_count == 2
+
+
+@mark.skipif_on_windows
+def test_mux_run(mux_server):
+    client = MuxClient(mux_server.server_address)
+    key = ("host", "me", 22, None)
+    client.request("connect", key)
+    assert client.run(key, "ls") == ("ran ls", "", 0)
+    assert client.run(key, "fail") == ("", "oops", 3)
+    # The connection is kept.
+    ((connection, _),) = mux_server._connections.values()
+    assert connection.commands == ["ls", "fail"]
+
+    with pytest.raises(MuxError) as exc:
+        client.request("connect", ("denied", "me", 22, None))
+    assert exc.value.auth
+    client.close()
+
+
+@mark.skipif_on_windows
+def test_mux_concurrent_requests(mux_server):
+    client = MuxClient(mux_server.server_address)
+    key = ("host", "me", 22, None)
+    # Each request waits for the other one, so they only complete if they
+    # are in flight at the same time.
+    with patch.object(FakeConnection, "barrier", threading.Barrier(2, timeout=5)):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.run(key, "wait")))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert results == [("ran wait", "", 0)] * 2
+    # The connections are kept for later requests.
+    assert len(client._idle) == 2
+    client.run(key, "ls")
+    assert len(client._idle) == 2
+    client.close()
+    assert not client._idle
+
+
+@mark.skipif_on_windows
+def test_mux_reap(mux_server):
+    client = MuxClient(mux_server.server_address)
+    key = ("host", "me", 22, None)
+    client.run(key, "ls")
+    ((connection, _),) = mux_server._connections.values()
+    assert not mux_server.reap()
+    mux_server.ttl = 0
+    assert mux_server.reap()
+    assert not connection.is_connected
+    assert not mux_server._connections
+    # A closed connection is reopened.
+    client.run(key, "ls")
+    assert mux_server._connections
+    client.close()
+
+
+@mark.skipif_on_windows
+def test_ssh_session_mux(mux_server):
+    client = MuxClient(mux_server.server_address)
+    connection = MagicMock()
+    session = SSHSession(connection=connection, mux=client, mux_key=("host", "me", 22, None))
+    assert session.execute_command("ls") == ("ran ls", "")
+    with pytest.raises(CommandError) as exc:
+        session.execute_command("fail")
+    assert exc.value.stderr == "oops"
+    connection.run.assert_not_called()
+
+    # Commands are run over the direct connection if the daemon is gone.
+    client.close()
+    client.path = mux_server.server_address + "-gone"
+    connection.run.return_value = SimpleNamespace(stdout="direct", stderr="", return_code=0)
+    assert session.execute_command("ls") == ("direct", "")
+    assert session.mux is None
+
+
+@mark.skipif_on_windows
+def test_mux_daemon_exits_when_idle(tmpdir):
+    path = str(tmpdir.join("socket"))
+    client = MuxClient(path)
+    _start_daemon(client, ttl=0.5)
+    assert client._idle
+    client.close()
+    for _ in range(100):
+        if not op.exists(path):
+            break
+        time.sleep(0.05)
+    assert not op.exists(path)
@@ -10,8 +10,10 @@
 from __future__ import absolute_import
 
 import logging
+import posixpath
 import re
 import string
+from collections import defaultdict
 
 import attr
 
@@ -87,15 +89,6 @@ def parse_apt_cache_show_pkgs_output(output):
     """,
         flags=re.VERBOSE + re.MULTILINE,
     )
-    # RegExp to split source into source and version
-    re_source = re.compile(
-        r"""
-        ^(?P<source_name>[^ ]+)                # source name before any space
-        ([^(]*\((?P<source_version>[^)]+)\))?  # source version in parentheses
-    """,
-        flags=re.VERBOSE,
-    )
-
     # For each package entry, collect single line tag/value pairs into a
     # dictionary
     for entry in entries:
@@ -105,18 +98,194 @@ def parse_apt_cache_show_pkgs_output(output):
         }
         # Process the package if one was found
         if "package" in pkg:
-            # Parse source line to get source version (if present)
-            if "source" in pkg:
-                for match in re_source.finditer(pkg["source"]):
-                    pkg["source_name"] = match.group("source_name")
-                    pkg["source_version"] = match.group("source_version")
-            # Move md5sum to md5
-            pkg["md5"] = pkg.pop("md5sum", None)
+            _process_pkg_record(pkg)
             # Append package entry
             package_info.append(pkg)
     return package_info
 
 
+# RegExp to split source into source and version
+_re_source = re.compile(
+    r"""
+    ^(?P<source_name>[^ ]+)                # source name before any space
+    ([^(]*\((?P<source_version>[^)]+)\))?  # source version in parentheses
+""",
+    flags=re.VERBOSE,
+)
+
+
+def _process_pkg_record(pkg):
+    """Add source_name/source_version and md5 to the fields of a package"""
+    # Parse source line to get source version (if present)
+    if "source" in pkg:
+        for match in _re_source.finditer(pkg["source"]):
+            pkg["source_name"] = match.group("source_name")
+            pkg["source_version"] = match.group("source_version")
+    # Move md5sum to md5
+    pkg["md5"] = pkg.pop("md5sum", None)
+    return pkg
+
+
+def iter_deb822_paragraphs(lines):
+    """Yield fields of the paragraphs of deb822 formatted `lines`
+
+    Like `parse_apt_cache_show_pkgs_output`, only single line "tag: value"
+    pairs are collected, with tags lower-cased, but the content is consumed
+    line by line, so large files (e.g. APT lists) need not be read at once.
+    """
+    fields = {}
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            # End of a paragraph
+            if fields:
+                yield fields
+                fields = {}
+            continue
+        if not line[0].isalpha():
+            # Continuation of a multi-line value or a comment
+            continue
+        tag, sep, val = line.partition(":")
+        val = val.strip()
+        if sep and val:
+            fields[tag.lower()] = val
+    if fields:
+        yield fields
+
+
+class DpkgDatabase(object):
+    """Indexes over the dpkg database and APT package lists
+
+    The information typically obtained by running `dpkg-query -S`, `dpkg -s`,
+    `apt-cache show` and `apt-cache policy` is provided from the content of
+    /var/lib/dpkg/status, /var/lib/dpkg/info/*.list and
+    /var/lib/apt/lists/*_Packages, as passed to the `add_*` methods (or to
+    `read_dpkg_database`).
+    """
+
+    # Fields of package records we need to keep
+    _RECORD_FIELDS = (
+        "package",
+        "architecture",
+        "version",
+        "source_name",
+        "source_version",
+        "size",
+        "md5",
+        "sha1",
+        "sha256",
+    )
+
+    def __init__(self):
+        self._path_to_pkgs = defaultdict(list)  # path -> [name[:arch]]
+        self._list_mtimes = {}  # name[:arch] -> mtime of the .list file
+        self._installed = {}  # name and name:arch -> status record
+        self._available = defaultdict(list)  # name:arch -> [(record, list)]
+
+    def _add_record(self, fields):
+        _process_pkg_record(fields)
+        return {f: fields[f] for f in self._RECORD_FIELDS if f in fields}
+
+    def add_status(self, lines):
+        """Add installed packages from the content of /var/lib/dpkg/status"""
+        for fields in iter_deb822_paragraphs(lines):
+            if "package" not in fields or not fields.get("status", "").endswith(" installed"):
+                continue
+            rec = self._add_record(fields)
+            self._installed["%(package)s:%(architecture)s" % rec] = rec
+            self._installed.setdefault(rec["package"], rec)
+
+    def add_list(self, pkg, lines, mtime=None):
+        """Add files of the package `pkg` from its .list file
+
+        Parameters
+        ----------
+        pkg : str
+            Name of the package as in the name of the .list file, i.e.
+            "name" or "name:arch".
+        lines : iterable of str
+        mtime : float, optional
+            Modification time of the .list file, i.e. the install date.
+        """
+        for line in lines:
+            path = line.rstrip("\r\n")
+            if path:
+                self._path_to_pkgs[path].append(pkg)
+        if mtime is not None:
+            self._list_mtimes[pkg] = mtime
+
+    def add_packages_list(self, list_name, lines):
+        """Add available packages from an APT list of packages
+
+        Only records of installed packages are kept, so the status should be
+        added first.
+
+        Parameters
+        ----------
+        list_name : str
+            Name of the file under /var/lib/apt/lists.
+        lines : iterable of str
+        """
+        for fields in iter_deb822_paragraphs(lines):
+            if fields.get("package") not in self._installed:
+                continue
+            rec = self._add_record(fields)
+            self._available["%(package)s:%(architecture)s" % rec].append((rec, list_name))
+
+    def get_packages_for_file(self, path):
+        """Return names ("name" or "name:arch") of packages containing `path`"""
+        return self._path_to_pkgs.get(path, [])
+
+    def get_installed(self, name, architecture=None):
+        """Return the status record of an installed package (as `dpkg -s`)"""
+        if architecture:
+            return self._installed.get("%s:%s" % (name, architecture))
+        return self._installed.get(name)
+
+    def get_available(self, name, architecture):
+        """Return (record, list name) of the available versions of a package"""
+        return self._available.get("%s:%s" % (name, architecture), [])
+
+    def get_list_mtime(self, pkg):
+        """Return the modification time of the .list file of a package
+
+        Parameters
+        ----------
+        pkg : str
+            "name" or "name:arch", as for `add_list`.
+        """
+        return self._list_mtimes.get(pkg)
+
+
+def read_dpkg_database(files):
+    """Build a `DpkgDatabase` in a single pass over the files it is made of
+
+    Parameters
+    ----------
+    files : iterable of (path, mtime, lines)
+        /var/lib/dpkg/status, /var/lib/dpkg/info/*.list and
+        /var/lib/apt/lists/*_Packages files, where `lines` iterates over the
+        lines of the file.  Other files are ignored.  The status file must
+        come first.
+
+    Returns
+    -------
+    DpkgDatabase
+    """
+    db = DpkgDatabase()
+    for path, mtime, lines in files:
+        dirname, basename = posixpath.split(path)
+        if basename == "status" and dirname.endswith("var/lib/dpkg"):
+            db.add_status(lines)
+        elif basename.endswith(".list") and dirname.endswith("var/lib/dpkg/info"):
+            db.add_list(basename[: -len(".list")], lines, mtime)
+        elif basename.endswith("_Packages") and dirname.endswith("var/lib/apt/lists"):
+            db.add_packages_list(basename, lines)
+        else:
+            lgr.debug("Ignoring %s while reading dpkg database", path)
+    return db
+
+
 def parse_apt_cache_policy_pkgs_output(output):
     # findall wasn't greedy enough for some reason, so decided first to
     # split into entries (one per package)
@@ -247,11 +416,16 @@ def parse_apt_cache_policy_source_info(policy_output):
     return source_info
 
 
-def get_apt_release_file_names(url, url_suite):
+def _get_apt_list_prefix(url):
     url = url.strip("/")  # Remove any trailing /
     url = url.replace("http://", "")  # Remove leading http://
     url = url.replace("file:/", "_")  # file:/ is converted to single _
     url = url.replace("/", "_")  # Any other / becomes _
+    return url
+
+
+def get_apt_release_file_names(url, url_suite):
+    url = _get_apt_list_prefix(url)
     if url_suite:
         filename = url + "_dists_" + url_suite
     else:
@@ -262,6 +436,25 @@ def get_apt_release_file_names(url, url_suite):
     ]
 
 
+def get_apt_packages_file_name(source):
+    """Return the name of the APT list of packages for an apt-cache policy source
+
+    For example, for "http://deb.debian.org/debian bookworm/main amd64
+    Packages" it is "deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages".
+    None is returned for other sources (e.g. /var/lib/dpkg/status or flat
+    repositories).
+    """
+    parts = source.split()
+    if len(parts) != 4 or parts[3] != "Packages":
+        return None
+    url, suite, arch = parts[:3]
+    return "%s_dists_%s_binary-%s_Packages" % (
+        _get_apt_list_prefix(url),
+        suite.replace("/", "_"),
+        arch,
+    )
+
+
 def parse_dpkgquery_line(line):
     result_re = re.compile(
         "(?P<name>[^,:]+)(:(?P<architecture>[^,:]+))?(?P<pkgs_rest>,.*)?:" " (?P<path>.*)$"
@@ -10,6 +10,8 @@
 from ..debian import DebianReleaseSpec
 from ..debian import get_spec_from_release_file
 from ..debian import parse_dpkgquery_line
+from ..debian import get_apt_packages_file_name
+from ..debian import read_dpkg_database
 
 from reproman.tests.utils import eq_, assert_is_subset_recur
 
@@ -388,6 +390,68 @@ def test_get_apt_release_file_names():
     assert "/var/lib/apt/lists/_my_repo2_ubuntu_Release" in fn
 
 
+def test_get_apt_packages_file_name():
+    assert (
+        get_apt_packages_file_name("http://deb.debian.org/debian bookworm/main amd64 Packages")
+        == "deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages"
+    )
+    assert get_apt_packages_file_name("/var/lib/dpkg/status") is None
+
+
+def test_read_dpkg_database():
+    status = """\
+Package: zlib1g
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Source: zlib (1:1.2.13.dfsg-1)
+Version: 1:1.2.13.dfsg-1
+Description: compression library - runtime
+ zlib is a library implementing the deflate compression method found
+ in gzip and PKZIP.
+
+Package: removed
+Status: deinstall ok config-files
+Architecture: all
+Version: 1.0
+"""
+    packages = """\
+Package: zlib1g
+Source: zlib (1:1.2.13.dfsg-1)
+Version: 1:1.2.13.dfsg-1
+Architecture: amd64
+Size: 87088
+MD5sum: 1d1a6e0e2b2cb5ff2fd6c1b1f2bd6b7c
+
+Package: other
+Version: 1.0
+Architecture: amd64
+"""
+    lists = "deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages"
+    db = read_dpkg_database(
+        [
+            ("/var/lib/dpkg/status", 1.0, status.splitlines(True)),
+            ("/var/lib/dpkg/info/zlib1g:amd64.list", 2.0, ["/.\n", "/usr/lib/libz.so.1\n"]),
+            ("/var/lib/apt/lists/" + lists, 3.0, iter(packages.splitlines(True))),
+        ]
+    )
+    assert db.get_packages_for_file("/usr/lib/libz.so.1") == ["zlib1g:amd64"]
+    assert db.get_packages_for_file("/usr/lib/libz.so") == []
+    assert db.get_list_mtime("zlib1g:amd64") == 2.0
+    installed = db.get_installed("zlib1g")
+    assert installed == db.get_installed("zlib1g", "amd64")
+    assert installed["version"] == "1:1.2.13.dfsg-1"
+    assert installed["source_name"] == "zlib"
+    assert installed["md5"] is None
+    assert db.get_installed("removed") is None
+    [(available, list_name)] = db.get_available("zlib1g", "amd64")
+    assert list_name == lists
+    assert available["size"] == "87088"
+    assert available["md5"] == "1d1a6e0e2b2cb5ff2fd6c1b1f2bd6b7c"
+    # Only records of installed packages are kept
+    assert db.get_available("other", "amd64") == []
+
+
 def test_parse_dpkgquery_line():
     for line, expected in [
         (
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Put job inputs on a resource, transferring only what is not there yet."""
+
+from collections import defaultdict
+import json
+import logging
+import os
+import os.path as op
+import tempfile
+
+from reproman import cfg
+from reproman.support.digests import Digester
+from reproman.utils import execute_command_batch
+from reproman.utils import get_cmd_batch_len
+
+lgr = logging.getLogger("reproman.support.jobs.input_sync")
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows, where the manifest is then not locked.
+    fcntl = None
+
+# Copy pairs of source and destination paths, creating leading directories
+_COPY_PAIRS_SCRIPT = (
+    'while [ $# -gt 1 ]; do mkdir -p "$(dirname "$2")" && cp -p "$1" "$2" || exit 1; '
+    "shift 2; done"
+)
+
+# Merge the directory tree $2 into $3, and remove the temporary directory $1
+_MERGE_TREE_SCRIPT = 'mkdir -p "$3" && cp -pR "$2"/. "$3"; status=$?; rm -rf "$1"; exit $status'
+
+
+class InputManifest(object):
+    """Record of the input files put on a resource.
+
+    For each local file (keyed by its absolute path), the manifest holds its
+    size, modification time, and MD5 checksum, as well as the copies of it
+    on the resource along with their size and modification time right after
+    they were put there.  A copy which still has those is taken to be
+    intact.
+
+    Parameters
+    ----------
+    path : str or None
+        JSON file to store the manifest in.  If None, the manifest is not
+        stored.
+    """
+
+    # Maximum number of copies on the resource remembered for a file
+    max_copies = 5
+
+    def __init__(self, path):
+        self.path = path
+        self._records = None
+
+    @classmethod
+    def for_resource(cls, resource):
+        """Return the manifest for `resource`, stored in the user cache.
+
+        Resources which have not been created (and thus have no ID) get a
+        manifest which is not stored.
+        """
+        if not resource.id:
+            return cls(None)
+        return cls(op.join(cfg.dirs.user_cache_dir, "inputs", "{}.json".format(resource.id)))
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = self._load()
+        return self._records
+
+    def _load(self):
+        if self.path and op.exists(self.path):
+            try:
+                with open(self.path) as fh:
+                    return json.load(fh)
+            except ValueError as exc:
+                lgr.warning("Ignoring invalid input manifest %s: %s", self.path, exc)
+        return {}
+
+    def save(self, keys=None):
+        """Store the records.
+
+        Concurrent runs against the same resource share the manifest, so the
+        records are merged with what was stored since they were loaded.
+
+        Parameters
+        ----------
+        keys : iterable of str, optional
+            Local files whose records were updated.  Records of other files
+            are kept as stored.  By default, all records are stored.
+        """
+        if not self.path:
+            return
+        os.makedirs(op.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = self._load()
+            for key in self.records if keys is None else keys:
+                stored[key] = self._merge_record(stored.get(key), self.records[key])
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as fh:
+                json.dump(stored, fh)
+            os.replace(tmp_path, self.path)
+        self._records = stored
+
+    def _merge_record(self, stored, record):
+        if not stored or any(stored.get(k) != record[k] for k in ("size", "mtime", "md5")):
+            return record
+        # Both are about the same content, so all the copies are usable.
+        copies = {p: seen for p, seen in stored["copies"].items() if p not in record["copies"]}
+        copies.update(record["copies"])
+        while len(copies) > self.max_copies:
+            copies.pop(next(iter(copies)))
+        return dict(record, copies=copies)
+
+
+def _walk_input(path):
+    """Return the files and the empty directories of the input `path`.
+
+    Both are relative to `path`.  Symbolic links to directories are
+    followed, unless they lead back to a directory being walked.
+    """
+    if not op.isdir(path):
+        return ["."], []
+    files, empty_dirs = [], []
+    # Real paths of the directories a directory was reached through
+    chains = {path: ()}
+    for root, dirs, names in os.walk(path, followlinks=True):
+        chain = chains.pop(root) + (op.realpath(root),)
+        dirs[:] = [d for d in dirs if op.realpath(op.join(root, d)) not in chain]
+        for d in dirs:
+            chains[op.join(root, d)] = chain
+        rel_root = op.relpath(root, path)
+        if not (dirs or names):
+            empty_dirs.append(rel_root)
+        for name in names:
+            if op.exists(op.join(root, name)):
+                files.append(op.normpath(op.join(rel_root, name)))
+            else:
+                lgr.warning("Skipping broken symbolic link %s", op.join(root, name))
+    return files, empty_dirs
+
+
+def _md5(path):
+    return Digester(["md5"])(path)["md5"]
+
+
+def _get_remote_md5s(session, paths):
+    md5s = {}
+    for out, _, exc in execute_command_batch(session, ["md5sum", "--"], paths):
+        if exc:
+            out = exc.stdout or ""
+        for line in out.splitlines():
+            md5, _, path = line.partition("  ")
+            md5s[path] = md5
+    return md5s
+
+
+def _copy_remote(session, pairs):
+    args = [p for pair in pairs for p in pair]
+    command = ["sh", "-c", _COPY_PAIRS_SCRIPT, "sh"]
+    # Keep pairs together
+    batch_len = max(get_cmd_batch_len(args, len(" ".join(command))) // 2 * 2, 2)
+    for i in range(0, len(args), batch_len):
+        session.execute_command(command + args[i : i + batch_len])
+
+
+def _link_tree(src_dir, files, empty_dirs, dest_dir):
+    """Recreate `files` and `empty_dirs` of `src_dir` under `dest_dir` with hard links.
+
+    Returns False if the files cannot be linked (e.g., as they are on
+    another file system).
+    """
+    for rel_path in empty_dirs:
+        os.makedirs(op.join(dest_dir, rel_path), exist_ok=True)
+    for rel_path in files:
+        dest = op.join(dest_dir, rel_path)
+        os.makedirs(op.dirname(dest), exist_ok=True)
+        try:
+            os.link(op.join(src_dir, rel_path), dest)
+        except OSError as exc:
+            lgr.debug("Failed to link %s: %s", rel_path, exc)
+            return False
+    return True
+
+
+def _put_input(session, local_path, remote_path, files, empty_dirs, whole):
+    """Put `files` and `empty_dirs` of the input `local_path` at `remote_path`.
+
+    If not `whole`, only those of the input are transferred, in a single
+    `session.put` of a temporary tree of hard links to them.  The whole
+    input is put if there are no others, or the tree cannot be created.
+    """
+    if not whole:
+        os.makedirs(_get_staging_parent(), exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix="staging-", dir=_get_staging_parent()) as tmp:
+            staging = op.join(tmp, "input")
+            if _link_tree(local_path, files, empty_dirs, staging):
+                remote_tmp = session.mktmpdir()
+                session.put(staging, op.join(remote_tmp, "input"))
+                session.execute_command(
+                    ["sh", "-c", _MERGE_TREE_SCRIPT, "sh"]
+                    + [remote_tmp, op.join(remote_tmp, "input"), remote_path]
+                )
+                return
+        lgr.debug("Putting all of %s as the changed files could not be staged", local_path)
+    session.put(local_path, remote_path)
+
+
+def _get_staging_parent():
+    # Most likely on the same file system as the inputs
+    return op.join(cfg.dirs.user_cache_dir, "inputs")
+
+
+def sync_inputs(session, inputs, manifest):
+    """Put inputs on the resource of `session`, transferring only what is not there yet.
+
+    For each file of the inputs, the local file is
+
+      - skipped if its remote path is an intact copy of it,
+      - copied on the resource from another intact copy of it, if any,
+      - skipped if the remote file has the same MD5 checksum,
+      - put otherwise.
+
+    A local file is considered unchanged since it was recorded if it has the
+    same size and modification time, or the same size and checksum.  The
+    files to put are transferred with a single `Session.put` per input.
+
+    Parameters
+    ----------
+    session : Session
+    inputs : list of (str, str)
+        Paths of local files or directories and their destinations on the
+        resource.  Symbolic links to directories within directories are
+        followed.
+    manifest : InputManifest
+        Updated with the files placed on the resource, and saved.
+    """
+    # (local path, remote path, index of the input) for each file of the inputs
+    pairs = []
+    empty_dirs = []
+    for idx, (local_input, remote_input) in enumerate(inputs):
+        files, dirs = _walk_input(local_input)
+        empty_dirs.append(dirs)
+        pairs.extend(
+            (op.normpath(op.join(local_input, f)), op.normpath(op.join(remote_input, f)), idx)
+            for f in files
+        )
+
+    records = manifest.records
+    file_records = {}
+    for local_path, _, _ in pairs:
+        key = op.abspath(local_path)
+        if key in file_records:
+            continue
+        st = os.stat(local_path)
+        record = records.get(key)
+        if record and record["size"] == st.st_size and record["mtime"] != st.st_mtime:
+            # Touched, but possibly not modified
+            if record.get("md5") and _md5(local_path) == record["md5"]:
+                record["mtime"] = st.st_mtime
+            else:
+                record = None
+        elif record and record["size"] != st.st_size:
+            record = None
+        if record is None:
+            record = records[key] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "md5": None,
+                "copies": {},
+            }
+        file_records[key] = record
+
+    remote_paths = {remote_path for _, remote_path, _ in pairs}
+    remote_paths.update(remote_input for _, remote_input in inputs)
+    for (_, remote_input), dirs in zip(inputs, empty_dirs):
+        remote_paths.update(op.normpath(op.join(remote_input, d)) for d in dirs)
+    for record in file_records.values():
+        remote_paths.update(record["copies"])
+    stats = session.stat_batch(remote_paths)
+
+    def is_intact(remote_path, seen):
+        st = stats.get(remote_path)
+        return (
+            st is not None
+            and st.type == "file"
+            and st.mtime is not None
+            and [st.size, st.mtime] == seen
+        )
+
+    for record in file_records.values():
+        record["copies"] = {p: seen for p, seen in record["copies"].items() if is_intact(p, seen)}
+
+    to_copy, to_check, to_put = [], [], []
+    for local_path, remote_path, idx in pairs:
+        record = file_records[op.abspath(local_path)]
+        st = stats.get(remote_path)
+        if remote_path in record["copies"]:
+            lgr.debug("%s is already on the resource as %s", local_path, remote_path)
+        elif record["copies"]:
+            # The most recent copy
+            to_copy.append((list(record["copies"])[-1], remote_path))
+        elif st is not None and st.type == "file" and st.size == record["size"]:
+            to_check.append((local_path, remote_path, idx))
+        else:
+            to_put.append((local_path, idx))
+
+    if to_check:
+        remote_md5s = _get_remote_md5s(session, [r for _, r, _ in to_check])
+        for local_path, remote_path, idx in to_check:
+            record = file_records[op.abspath(local_path)]
+            if not record["md5"]:
+                record["md5"] = _md5(local_path)
+            if remote_md5s.get(remote_path) != record["md5"]:
+                to_put.append((local_path, idx))
+
+    lgr.info(
+        "Putting %d input files on the resource (%d copied there, %d already there)",
+        len(to_put),
+        len(to_copy),
+        len(pairs) - len(to_put) - len(to_copy),
+    )
+    if to_copy:
+        _copy_remote(session, to_copy)
+
+    files_to_put = defaultdict(list)
+    for local_path, idx in to_put:
+        files_to_put[idx].append(op.relpath(local_path, inputs[idx][0]))
+    nfiles = defaultdict(int)
+    for _, _, idx in pairs:
+        nfiles[idx] += 1
+    for idx, (local_input, remote_input) in enumerate(inputs):
+        files = files_to_put[idx]
+        dirs = [
+            d for d in empty_dirs[idx] if stats.get(op.normpath(op.join(remote_input, d))) is None
+        ]
+        if files or dirs:
+            whole = not op.isdir(local_input) or (
+                len(files) == nfiles[idx]
+                and len(dirs) == len(empty_dirs[idx])
+                and stats.get(remote_input) is None
+            )
+            _put_input(session, local_input, remote_input, files, dirs, whole)
+
+    # Remember what is on the resource now
+    stats = session.stat_batch(remote_path for _, remote_path, _ in pairs)
+    for local_path, remote_path, _ in pairs:
+        record = file_records[op.abspath(local_path)]
+        st = stats.get(remote_path)
+        if st is None or st.mtime is None:
+            continue
+        if not record["md5"]:
+            record["md5"] = _md5(local_path)
+        copies = record["copies"]
+        copies.pop(remote_path, None)
+        copies[remote_path] = [st.size, st.mtime]
+        while len(copies) > manifest.max_copies:
+            # Forget the oldest copy
+            copies.pop(next(iter(copies)))
+    manifest.save(file_records)
@@ -15,53 +15,152 @@ workdir={{ shlex_quote(working_directory) }}
 _reproman_cmd_idx=$(($subjob + 1))
 export _reproman_cmd_idx
 
-echo "submitted" >"$metadir/status.$subjob"
+# Files in the metadata directory that all subjobs write to (the status log
+# and the count of finished subjobs) are updated while holding a lock, taken
+# with flock if it works on the file system of the metadata directory.
+# Otherwise the lock is a directory (mkdir is atomic, including on NFS)
+# holding the host and PID of its holder.  It is broken if the holder is gone
+# or it is older than $lock_stale minutes.  Waiting for the lock ends after
+# $lock_wait seconds.
+lock_wait=600
+lock_stale=10
+
+take_lock () {
+    lock="$metadir/meta.lock"
+    start=$(date +%s)
+    method=mkdir
+    if command -v flock >/dev/null 2>&1
+    then
+        exec 9>>"$metadir/meta.flock"
+        method=flock
+    fi
+    while :
+    do
+        if test $method = flock
+        then
+            status=0
+            flock -n 9 2>/dev/null || status=$?
+            case $status in
+                0) return 0 ;;
+                1) ;;
+                # flock isn't supported (e.g., on Lustre mounted without it).
+                *) method=mkdir; continue ;;
+            esac
+        elif mkdir "$lock" 2>/dev/null
+        then
+            echo "$(uname -n) $$" >"$lock/holder"
+            return 0
+        elif lock_is_stale
+        then
+            # Move it away first so that only one subjob removes it.
+            mv "$lock" "$lock.stale.$$" 2>/dev/null && rm -rf "$lock.stale.$$"
+            continue
+        fi
+        if test $(($(date +%s) - $start)) -ge $lock_wait
+        then
+            echo "[ReproMan] timed out waiting for lock on $metadir" >&2
+            return 1
+        fi
+        sleep 0.1 2>/dev/null || sleep 1
+    done
+}
+
+release_lock () {
+    if test $method = flock
+    then
+        flock -u 9
+    else
+        rm -rf "$lock"
+    fi
+}
+
+lock_is_stale () {
+    set -- $(cat "$lock/holder" 2>/dev/null)
+    if test $# -eq 2 && test "$1" = "$(uname -n)" && ! kill -0 "$2" 2>/dev/null
+    then
+        return 0
+    fi
+    test -n "$(find "$lock" -prune -mmin +$lock_stale 2>/dev/null)"
+}
+
+{% if _status_log %}
+# Record status changes of all subjobs in a single file, one line per change.
+# Appends aren't atomic on network file systems (e.g., NFS), so a line is
+# appended while holding the lock.  If the lock can't be taken, the line is
+# appended anyway rather than losing the status.
+set_status () {
+    if take_lock
+    then
+        printf '%d %s\n' "$subjob" "$1" >>"$metadir/status.log"
+        release_lock
+    else
+        printf '%d %s\n' "$subjob" "$1" >>"$metadir/status.log"
+    fi
+}
+{% else %}
+set_status () {
+    echo "$1" >"$metadir/status.$subjob"
+}
+{% endif %}
+
+set_status "submitted"
 echo "[ReproMan] pre-command..."
 
 {% block pre_command %}
 cd "$workdir"
 {% endblock %}
 
+# Each line of the index has the same width and holds the offset and length
+# of a command in the array, so both can be read at their position.
 get_command () {
-    perl -n0e \
-         '$idx=$ENV{_reproman_cmd_idx}; print "$_" if $. == $idx;' \
-         "$metadir/command-array"
+    set -- $(tail -c +$(($subjob * {{ _command_index_width }} + 1)) \
+                  "$metadir/command-array.idx" | head -n 1)
+    test $# -eq 2 || return 0
+    tail -c +$(($1 + 1)) "$metadir/command-array" | head -c "$2"
 }
 
 cmd=$(get_command)
 if test -z "$cmd"
 then
     echo "[ReproMan] failed getting command at position $_reproman_cmd_idx" >&2
-    echo "pre-command failure" >"$metadir/status.$subjob"
+    set_status "pre-command failure"
     exit 1
 fi
 
-echo "running" >"$metadir/status.$subjob"
+set_status "running"
 echo "[ReproMan] executing command $cmd"
 echo "[ReproMan] ... within $PWD"
 {% block command %}
+{% if _status_log %}
+/bin/sh -c "$cmd" && \
+    set_status "succeeded" || \
+    set_status "failed: $?"
+{% else %}
 /bin/sh -c "$cmd" && \
-    echo "succeeded" >"$metadir/status.$subjob" || \
-    (echo "failed: $?" >"$metadir/status.$subjob";
+    set_status "succeeded" || \
+    (set_status "failed: $?";
      mkdir -p "$metadir/failed" && touch "$metadir/failed/$subjob")
+{% endif %}
 {% endblock %}
 
-if test $num_subjobs -eq $_reproman_cmd_idx
-then
-# Not all jobs should do the cleanup. Ideally none of them should and there
-# should be some post-job cleanup triggered through the batch system. But, at
-# least for now, below is a brittle solution were the last job waits until it
-# sees that all other jobs have exited and then runs the post-command stuff.
-nstatus () {
-    grep -E '^(succeed|fail)' "$metadir"/status.* | wc -l
+count_finished () {
+    take_lock || return 1
+    nfinished=$(cat "$metadir/finished" 2>/dev/null || echo 0)
+    nfinished=$(($nfinished + 1))
+    echo $nfinished >"$metadir/finished"
+    release_lock
+    echo $nfinished
 }
 
-echo "[ReproMan] waiting for all jobs to complete before running post-command..."
-while test $(nstatus) -lt $num_subjobs
-do
-    sleep 1
-done
-
+# The subjob that finishes last runs the post-command stuff, so no subjob has
+# to wait for the others.
+if ! nfinished=$(count_finished)
+then
+    echo "[ReproMan] failed counting finished subjobs" >&2
+    exit 1
+fi
+if test $nfinished -eq $num_subjobs
+then
 echo "[ReproMan] post-command..."
 
 {% block post_command %}
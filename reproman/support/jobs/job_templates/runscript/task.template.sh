@@ -0,0 +1,24 @@
+#!/bin/sh
+{#
+  Run a scheduler task, i.e. a contiguous slice of {{ _pack_size }} subjobs,
+  with up to {{ _pack_workers }} of them at a time.  Each subjob gets its own
+  status and log files, as if it had been submitted on its own.
+#}
+
+set -eu
+
+metadir={{ shlex_quote(_meta_directory) }}
+task=$1
+
+first=$(($task * {{ _pack_size }}))
+last=$(($first + {{ _pack_size - 1 }}))
+if test $last -ge {{ _num_subjobs }}
+then
+    last={{ _num_subjobs - 1 }}
+fi
+
+# A failed subjob is recorded in its status file, so go on with the others.
+seq $first $last |
+    xargs -P {{ _pack_workers }} -I{} \
+          sh -c '"$1/runscript" "$2" >"$1/stdout.$2" 2>"$1/stderr.$2" || true' \
+          sh "$metadir" {}
@@ -9,9 +9,13 @@
 """Registry of local jobs."""
 
 import collections
+import json
 import logging
 import os
 import os.path as op
+import sqlite3
+import threading
+import time
 
 import yaml
 
@@ -19,12 +23,128 @@ from reproman import cfg
 
 lgr = logging.getLogger("reproman.support.jobs.local_registry")
 
+# Time after which the mtime of the jobs directory is taken as settled.
+_MTIME_SETTLE_NS = 2 * 10**9
+
+
+def _submission_time(jobid, default):
+    """Return the submission time encoded at the start of `jobid`"""
+    try:
+        return time.mktime(time.strptime(jobid[:15], "%Y%m%d-%H%M%S"))
+    except ValueError:
+        return default
+
 
 class LocalRegistry(object):
-    """Registry of local jobs."""
+    """Registry of local jobs.
+
+    Each job is recorded in a YAML file under `directory`.  The files are
+    indexed in an SQLite database next to that directory so that jobs can be
+    looked up and queried without loading every file.  The index is brought
+    up to date with the files (e.g., ones registered by an older version of
+    ReproMan) whenever it is used.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory with the job files.  Defaults to "jobs" under the user data
+        directory.
+    """
 
     def __init__(self, directory=None):
         self._root = directory or op.join(cfg.dirs.user_data_dir, "jobs")
+        self._index_path = op.normpath(self._root) + ".sqlite"
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            dirname = op.dirname(self._index_path)
+            if dirname and not op.exists(dirname):
+                os.makedirs(dirname)
+            # Writes from concurrent invocations wait on each other.
+            self._conn = sqlite3.connect(self._index_path, timeout=30, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "jobid TEXT PRIMARY KEY, mtime REAL, submitted REAL, "
+                    "resource_id TEXT, resource_name TEXT, submitter TEXT, "
+                    "status TEXT, spec TEXT)"
+                )
+                self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+                for column in ["resource_id", "resource_name", "submitter", "submitted"]:
+                    self._conn.execute(
+                        "CREATE INDEX IF NOT EXISTS jobs_{0} ON jobs ({0})".format(column)
+                    )
+        return self._conn
+
+    def _row(self, jobid, spec, mtime, status=None):
+        return (
+            jobid,
+            mtime,
+            _submission_time(jobid, mtime),
+            spec.get("resource_id"),
+            spec.get("resource_name"),
+            spec.get("submitter"),
+            status,
+            # YAML values like dates aren't JSON serializable.
+            json.dumps(spec, default=str),
+        )
+
+    def _sync(self):
+        """Bring the index up to date with the job files.
+
+        Job files are only added and removed, which changes the mtime of the
+        directory, so the files are only scanned if it differs from the one
+        recorded at the last scan.
+        """
+        try:
+            dir_mtime = os.stat(self._root).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        with self._lock:
+            recorded = self._db.execute("SELECT value FROM meta WHERE key = 'mtime'").fetchone()
+            if dir_mtime is not None and recorded and recorded[0] == dir_mtime:
+                return
+        mtimes = {}
+        if dir_mtime is not None:
+            for entry in os.scandir(self._root):
+                if entry.is_file():
+                    mtimes[entry.name] = entry.stat().st_mtime
+        with self._lock:
+            indexed = dict(self._db.execute("SELECT jobid, mtime FROM jobs"))
+            stale = [(j,) for j in indexed if j not in mtimes]
+            rows = []
+            for jobid, mtime in mtimes.items():
+                if indexed.get(jobid) == mtime:
+                    continue
+                try:
+                    with open(op.join(self._root, jobid)) as jfh:
+                        spec = yaml.safe_load(jfh)
+                except (OSError, yaml.YAMLError) as exc:
+                    # Possibly removed or being written by another process.
+                    lgr.debug("Not indexing job file %s: %s", jobid, exc)
+                    continue
+                rows.append(self._row(jobid, spec if isinstance(spec, dict) else {}, mtime))
+            if stale or rows:
+                lgr.debug(
+                    "Updating job index %s: %d added, %d removed",
+                    self._index_path,
+                    len(rows),
+                    len(stale),
+                )
+                with self._db as db:
+                    db.executemany("DELETE FROM jobs WHERE jobid = ?", stale)
+                    db.executemany(
+                        "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+            # A directory changed within the mtime granularity of the file
+            # system could change again without its mtime changing, so don't
+            # trust it until the next scan.
+            if dir_mtime is not None and time.time_ns() - dir_mtime > _MTIME_SETTLE_NS:
+                with self._db as db:
+                    db.execute("INSERT OR REPLACE INTO meta VALUES ('mtime', ?)", (dir_mtime,))
 
     def find_job_files(self):
         """Return job files for all jobs that are registered locally.
@@ -36,6 +156,97 @@ class LocalRegistry(object):
         files = os.listdir(self._root) if op.exists(self._root) else []
         return collections.OrderedDict((f, op.join(self._root, f)) for f in sorted(files))
 
+    def find_jobs(
+        self, resource=None, submitter=None, status=None, since=None, until=None, prefix=None
+    ):
+        """Return the registered jobs matching all of the given criteria.
+
+        Parameters
+        ----------
+        resource : str, optional
+            Name or ID of the resource the job was submitted to.
+        submitter : str, optional
+            Name of the submitter (e.g., "slurm").
+        status : str, optional
+            Status of the job last recorded with `set_status`.
+        since, until : float, optional
+            Restrict to jobs submitted in this time range, given as seconds
+            since the epoch.
+        prefix : str, optional
+            Start of the job ID.
+
+        Returns
+        -------
+        OrderedDict mapping job ID to the job spec, sorted by ID.
+        """
+        conditions, params = [], []
+        if resource is not None:
+            conditions.append("(resource_id = ? OR resource_name = ?)")
+            params.extend([resource, resource])
+        for column, value in [("submitter", submitter), ("status", status)]:
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                params.append(value)
+        if since is not None:
+            conditions.append("submitted >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("submitted < ?")
+            params.append(until)
+        if prefix:
+            # Unlike LIKE, a range comparison can use the primary key index.
+            conditions.append("jobid >= ? AND jobid < ?")
+            params.extend([prefix, prefix + "\U0010ffff"])
+        self._sync()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT jobid, spec FROM jobs{} ORDER BY jobid".format(
+                    " WHERE " + " AND ".join(conditions) if conditions else ""
+                ),
+                params,
+            ).fetchall()
+        return collections.OrderedDict((jobid, json.loads(spec)) for jobid, spec in rows)
+
+    def match(self, query_id):
+        """Find the job ID matching `query_id`.
+
+        A full match is preferred over a match of the start of an ID, which is
+        in turn preferred over a match anywhere in an ID.
+
+        Returns
+        -------
+        Matched job ID (str) or None if there is no match.
+
+        Raises
+        ------
+        ValueError if there are multiple hits for `query_id`.
+        """
+        self._sync()
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM jobs WHERE jobid = ?", (query_id,)).fetchone():
+                return query_id
+            for condition, params in [
+                ("jobid >= ? AND jobid < ?", (query_id, query_id + "\U0010ffff")),
+                ("instr(jobid, ?) > 0", (query_id,)),
+            ]:
+                matches = [
+                    r[0]
+                    for r in self._db.execute(
+                        "SELECT jobid FROM jobs WHERE {} ORDER BY jobid".format(condition), params
+                    )
+                ]
+                if len(matches) == 1:
+                    return matches[0]
+                elif matches:
+                    raise ValueError(
+                        "ID {} matches multiple jobs: {}".format(query_id, ", ".join(matches))
+                    )
+
+    def set_status(self, jobid, status):
+        """Record `status` as the last known status of job `jobid`."""
+        with self._lock, self._db as db:
+            db.execute("UPDATE jobs SET status = ? WHERE jobid = ?", (status, jobid))
+
     def register(self, jobid, kwds):
         """Register a job.
 
@@ -47,14 +258,21 @@ class LocalRegistry(object):
             Values defined here will be dumped to the job file.
         """
         if not op.exists(self._root):
-            os.makedirs(self._root)
+            os.makedirs(self._root, exist_ok=True)
 
         job_file = op.join(self._root, jobid)
-        if op.exists(job_file):
-            raise ValueError("%s is already registered", jobid)
-
-        with open(job_file, "w") as jfh:
+        try:
+            # Exclusive creation guards against a concurrent registration.
+            jfh = open(job_file, "x")
+        except FileExistsError:
+            raise ValueError("{} is already registered".format(jobid))
+        with jfh:
             yaml.safe_dump(kwds, jfh)
+        with self._lock, self._db as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._row(jobid, kwds, os.stat(job_file).st_mtime),
+            )
         lgr.info("Registered job %s", jobid)
 
     def unregister(self, jobid):
@@ -69,3 +287,5 @@ class LocalRegistry(object):
         if op.exists(job_file):
             lgr.info("Unregistered job %s", jobid)
             os.unlink(job_file)
+        with self._lock, self._db as db:
+            db.execute("DELETE FROM jobs WHERE jobid = ?", (jobid,))
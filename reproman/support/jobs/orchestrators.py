@@ -23,9 +23,11 @@ import abc
 import collections
 from contextlib import contextmanager
 import json
+import locale
 import logging
 import os
 import os.path as op
+import tarfile
 import uuid
 import time
 import yaml
@@ -33,13 +35,17 @@ import yaml
 from shlex import quote as shlex_quote
 
 import reproman
+from reproman import cfg
 from reproman.dochelpers import borrowdoc
 from reproman.dochelpers import exc_str
 from reproman.utils import cached_property
 from reproman.utils import chpwd
+from reproman.utils import ChunksReader
 from reproman.utils import write_update
 from reproman.resource.shell import ShellSession
 from reproman.resource.ssh import SSHSession
+from reproman.support.jobs.input_sync import InputManifest
+from reproman.support.jobs.input_sync import sync_inputs
 from reproman.support.jobs.submitters import SUBMITTERS
 from reproman.support.jobs.template import Template
 from reproman.support.exceptions import CommandError
@@ -49,6 +55,44 @@ from reproman.support.external_versions import external_versions
 lgr = logging.getLogger("reproman.support.jobs.orchestrators")
 
 
+def _format_command_index(commands):
+    """Format an index of `commands` joined by NUL characters.
+
+    Each command gets a line with the byte offset and length of its entry in
+    the joined commands.  Lines have the same width so that the runscript can
+    find the line of a subjob without reading the index up to it.
+
+    Returns
+    -------
+    A tuple with the index and the width of its lines, including the newline.
+    """
+    # put_text() writes with the default encoding.
+    encoding = locale.getpreferredencoding(False)
+    lengths = [len(c.encode(encoding)) for c in commands]
+    offsets = [0]
+    for length in lengths[:-1]:
+        offsets.append(offsets[-1] + length + 1)
+    # Pad with spaces rather than zeros, which would make sh arithmetic
+    # treat the numbers as octal.
+    ndigits = len(str(max(offsets[-1], max(lengths))))
+    lines = ["{:>{n}} {:>{n}}\n".format(o, n, n=ndigits) for o, n in zip(offsets, lengths)]
+    return "".join(lines), 2 * ndigits + 2
+
+
+def _parse_status_log(text):
+    """Return a dict mapping subjobs to their last status in a status log."""
+    statuses = {}
+    for line in text.splitlines():
+        subjob, _, status = line.partition(" ")
+        if subjob.isdigit() and status:
+            statuses[int(subjob)] = status
+    return statuses
+
+
+def _get_failed_from_status_log(statuses):
+    return sorted(subjob for subjob, status in statuses.items() if status.startswith("failed"))
+
+
 # Abstract orchestrators
 
 
@@ -89,7 +133,7 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
 
         # TODO: Probe remote and try to infer.
         submitter_class = SUBMITTERS[submission_type or "local"]
-        self.submitter = submitter_class(self.session)
+        self.submitter = submitter_class(self.session, resource_id=resource.id)
 
         self.job_spec = job_spec or {}
 
@@ -208,14 +252,35 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
         # Note: This doesn't adjust the command. We currently don't support any
         # datalad-run-like command formatting.
 
+    def _get_packing(self):
+        """Return the number of subjobs per scheduler task and how many of
+        them to run at once.
+        """
+        values = []
+        for key in ["pack_size", "pack_workers"]:
+            value = self.job_spec.get(key) or 1
+            try:
+                value = int(value)
+            except ValueError:
+                value = 0
+            if value < 1:
+                raise OrchestratorError(
+                    "{} must be a positive integer, got {!r}".format(key, self.job_spec[key])
+                )
+            values.append(value)
+        return tuple(values)
+
     @abc.abstractmethod
     def prepare_remote(self):
         """Prepare remote for run."""
 
     def submit(self):
         """Submit the job with `submitter`."""
-        njobs = len(self.job_spec["_command_array"])
-        if njobs > 1 and self.submitter.name == "local":
+        commands = self.job_spec["_command_array"]
+        njobs = len(commands)
+        pack_size, pack_workers = self._get_packing()
+        ntasks = -(-njobs // pack_size)
+        if ntasks > 1 and self.submitter.name == "local":
             will_cite = op.join(self.home, ".parallel", "will-cite")
             if not self.session.exists(will_cite):
                 lgr.info(
@@ -225,11 +290,17 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
                     self.resource.name,
                 )
         lgr.info("Submitting %s", self.jobid)
+        command_index, command_index_width = _format_command_index(commands)
         templ = Template(
             **dict(
                 self.job_spec,
                 _jobid=self.jobid,
                 _num_subjobs=njobs,
+                _num_tasks=ntasks,
+                _pack_size=pack_size,
+                _pack_workers=pack_workers,
+                _status_log=self._uses_status_log,
+                _command_index_width=command_index_width,
                 root_directory=self.root_directory,
                 working_directory=self.working_directory,
                 _meta_directory=self.meta_directory,
@@ -242,6 +313,12 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
             op.join(self.meta_directory, "runscript"),
             executable=True,
         )
+        if pack_size > 1:
+            self.session.put_text(
+                templ.render_runscript("task.template.sh"),
+                op.join(self.meta_directory, "taskscript"),
+                executable=True,
+            )
 
         submission_file = op.join(self.meta_directory, "submit")
         self.session.put_text(
@@ -250,10 +327,8 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
             executable=True,
         )
 
-        self.session.put_text(
-            "\0".join(self.job_spec["_command_array"]),
-            op.join(self.meta_directory, "command-array"),
-        )
+        self.session.put_text("\0".join(commands), op.join(self.meta_directory, "command-array"))
+        self.session.put_text(command_index, op.join(self.meta_directory, "command-array.idx"))
 
         self.session.put_text(
             yaml.safe_dump(self.as_dict()), op.join(self.meta_directory, "spec.yaml")
@@ -270,13 +345,59 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
                 "echo {} >{}".format(subm_id, op.join(self.meta_directory, "idmap"))
             )
 
+    @property
+    def _uses_status_log(self):
+        """Whether subjobs record their status in a single log file.
+
+        Otherwise, each subjob has a status file and, if it failed, a file
+        in the "failed" directory.
+        """
+        return str(self.job_spec.get("status_log", "")).lower() == "true"
+
+    def _read_status_log(self):
+        """Return a dict mapping subjobs to their last status in the log."""
+        log_file = op.join(self.meta_directory, "status.log")
+        if self.session.exists(log_file):
+            return _parse_status_log(self.session.read(log_file))
+        return {}
+
     def get_status(self, subjob=0):
+        if self._uses_status_log:
+            return self._read_status_log().get(subjob, "unknown")
         status_file = op.join(self.meta_directory, "status.{:d}".format(subjob))
         status = "unknown"
         if self.session.exists(status_file):
             status = self.session.read(status_file).strip()
         return status
 
+    def get_status_counts(self):
+        """Return a dict mapping statuses to the number of subjobs with them.
+
+        Subjobs which haven't reported a status yet are not counted.
+        """
+        if self._uses_status_log:
+            statuses = self._read_status_log().values()
+        else:
+            try:
+                out, _ = self.session.execute_command(
+                    [
+                        "find",
+                        self.meta_directory,
+                        "-maxdepth",
+                        "1",
+                        "-name",
+                        "status.[0-9]*",
+                        "-exec",
+                        "cat",
+                        "{}",
+                        "+",
+                    ]
+                )
+            except CommandError as exc:
+                raise OrchestratorError(str(exc))
+            statuses = out.splitlines()
+        return dict(collections.Counter(statuses))
+
     @property
     def status(self):
         """Get information from job status file."""
@@ -290,6 +411,8 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
 
     def get_failed_subjobs(self):
         """List of failed subjobs (represented by index, starting with 0)."""
+        if self._uses_status_log:
+            return _get_failed_from_status_log(self._read_status_log())
         failed_dir = op.join(self.meta_directory, "failed")
         try:
             stdout, _ = self.session.execute_command(["ls", failed_dir])
@@ -500,7 +623,7 @@ class DataladOrchestrator(Orchestrator, metaclass=abc.ABCMeta):
 
         from datalad.api import Dataset
 
-        self.ds = Dataset(".")
+        self.ds = Dataset(self.local_directory)
         if not self.ds.id:
             raise OrchestratorError("orchestrator {} requires a local dataset".format(self.name))
 
@@ -570,6 +693,7 @@ class DataladOrchestrator(Orchestrator, metaclass=abc.ABCMeta):
                 "# Automatically created by ReproMan.\n"
                 "# Do not change manually.\n"
                 "status.[0-9]* annex.largefiles=nothing\n"
+                "status.log annex.largefiles=nothing\n"
                 "**/failed/* annex.largefiles=nothing\n"
                 "idmap annex.largefiles=nothing\n"
             ),
@@ -586,7 +710,9 @@ class PrepareRemotePlainMixin(object):
     def prepare_remote(self):
         """Prepare "plain" execution directory on remote.
 
-        Create directory and copy inputs to it.
+        Create directory and copy inputs to it.  Inputs already put on the
+        resource by previous jobs are copied there instead of transferred
+        again (see `sync_inputs`).
         """
         # TODO: Provide better handling of existing directories. This is
         # unlikely to happen with the default working directory but can easily
@@ -596,8 +722,12 @@ class PrepareRemotePlainMixin(object):
         if not session.exists(self.root_directory):
             session.mkdir(self.root_directory, parents=True)
 
-        for i in self.get_inputs():
-            session.put(i, op.join(self.working_directory, op.relpath(i, self.local_directory)))
+        inputs = [
+            (i, op.join(self.working_directory, op.relpath(i, self.local_directory)))
+            for i in self.get_inputs()
+        ]
+        if inputs:
+            sync_inputs(session, inputs, InputManifest.for_resource(self.resource))
 
 
 def _format_ssh_url(user, host, port, path):
@@ -645,28 +775,39 @@ class PrepareRemoteDataladMixin(object):
         if status == "unknown":
             # The local tree might be different because of another just. Check
             # the ref for the status.
+            # FIXME: How to handle subjobs?
+            status_file = "status.log" if self._uses_status_log else "status.0"
             try:
-                status_from_ref = self._execute_in_wdir(
-                    "git cat-file -p {}:{}".format(
-                        self.job_refname,
-                        # FIXME: How to handle subjobs?
-                        op.relpath(
-                            op.join(self.meta_directory, "status.0"), self.working_directory
-                        ),
-                    )
-                )
+                status_from_ref = self._read_meta_file_from_ref(status_file)
             except OrchestratorError as exc:
                 # Most likely the ref was never created because the runscript
                 # failed. Let follow() signal the error.
                 lgr.debug("Failed to get status from %s tree: %s", self.job_refname, exc_str(exc))
             else:
+                if self._uses_status_log:
+                    status_from_ref = _parse_status_log(status_from_ref).get(0, "")
                 status = status_from_ref.strip() or status
         return status
 
+    def _read_meta_file_from_ref(self, name):
+        return self._execute_in_wdir(
+            "git cat-file -p {}:{}".format(
+                self.job_refname,
+                op.relpath(op.join(self.meta_directory, name), self.working_directory),
+            )
+        )
+
     def get_failed_subjobs(self):
         """Like Orchestrator.get_failed_subjobs, but inspect the job's git ref if needed."""
         failed = super(DataladOrchestrator, self).get_failed_subjobs()
-        if not failed:
+        if not failed and self._uses_status_log:
+            try:
+                status_log = self._read_meta_file_from_ref("status.log")
+            except OrchestratorError as exc:
+                lgr.debug("Failed to get status from %s tree: %s", self.job_refname, exc_str(exc))
+            else:
+                failed = _get_failed_from_status_log(_parse_status_log(status_log))
+        elif not failed:
             meta_tree = "{}:{}".format(
                 self.job_refname, op.relpath(self.meta_directory, self.working_directory)
             )
@@ -872,11 +1013,43 @@ class PrepareRemoteDataladMixin(object):
             session.mkdir(self.meta_directory, parents=True)
 
 
+# Archive the status/stdout/stderr files in a directory (relative to the
+# working directory $1) followed by the given paths, written to stdout.
+# Remaining arguments are "-C DIR NAME" triples for the paths, so that they
+# are archived (and extracted) under their base name.
+_TAR_FETCH_SCRIPT = (
+    'cd "$1" && metadir="$2" && shift 2 && '
+    'find "./$metadir" -maxdepth 1 -type f '
+    '\\( -name "status.*" -o -name "stdout.*" -o -name "stderr.*" \\) '
+    '| tar -c%sf - -T - "$@"'
+)
+
+
+def _extract_tarball(tf, path):
+    """Extract the members of the (possibly streamed) archive `tf` under `path`"""
+    if hasattr(tarfile, "data_filter"):
+        tf.extractall(path, filter="data")
+        return
+
+    def checked_members():
+        for member in tf:
+            name = op.normpath(member.name)
+            if op.isabs(name) or name.split(os.sep)[0] == op.pardir:
+                raise OrchestratorError("Refusing to extract {} outside of {}".format(name, path))
+            yield member
+
+    tf.extractall(path, members=checked_members())
+
+
 class FetchPlainMixin(object):
 
     def fetch(self, on_remote_finish=None):
         """Get outputs from remote.
 
+        The outputs and the status, stdout, and stderr files of the subjobs
+        are transferred together as an archive streamed from the resource,
+        if the session supports it.
+
         Parameters
         ----------
         on_remote_finish : callable, optional
@@ -885,24 +1058,23 @@ class FetchPlainMixin(object):
             (list of ints).
         """
         lgr.info("Fetching results for %s", self.jobid)
-        for o in self.get_outputs():
-            self.session.get(
-                o if op.isabs(o) else op.join(self.working_directory, o),
-                # Make sure directory has trailing slash so that get doesn't
-                # treat it as the file.
-                op.join(self.local_directory, ""),
-            )
-
-        for idx in range(len(self.job_spec["_command_array"])):
-            for f in ["status", "stdout", "stderr"]:
+        outputs = [
+            o if op.isabs(o) else op.join(self.working_directory, o) for o in self.get_outputs()
+        ]
+        try:
+            self._fetch_archive(outputs)
+        except (NotImplementedError, CommandError, tarfile.TarError) as exc:
+            # Transfer the files one by one instead, which also fails for a
+            # missing output.
+            lgr.debug("Failed to fetch results as an archive: %s", exc_str(exc))
+            for o in outputs:
                 self.session.get(
-                    op.join(self.meta_directory, "{}.{:d}".format(f, idx)),
-                    op.join(
-                        self.local_directory,
-                        op.relpath(self.meta_directory, self.working_directory),
-                        "",
-                    ),
+                    o,
+                    # Make sure directory has trailing slash so that get doesn't
+                    # treat it as the file.
+                    op.join(self.local_directory, ""),
                 )
+            self._fetch_meta_files()
 
         failed = self.get_failed_subjobs()
         self.log_failed(failed)
@@ -911,6 +1083,48 @@ class FetchPlainMixin(object):
         if on_remote_finish:
             on_remote_finish(self.resource, failed)
 
+    def _fetch_archive(self, outputs):
+        """Transfer `outputs` and the subjob metadata files as an archive.
+
+        Like with `Session.get`, outputs are placed in the local directory
+        under their base name.
+
+        Parameters
+        ----------
+        outputs : list of str
+            Absolute paths on the resource.
+        """
+        compress = cfg.getboolean("jobs", "compress fetch", default=False)
+        command = ["sh", "-c", _TAR_FETCH_SCRIPT % ("z" if compress else ""), "sh"]
+        command += [self.working_directory, op.relpath(self.meta_directory, self.working_directory)]
+        for o in outputs:
+            dirname, basename = op.split(op.normpath(o))
+            command += ["-C", dirname, op.join(".", basename)]
+        chunks = self.session.stream_command(command)
+        try:
+            with tarfile.open(fileobj=ChunksReader(chunks), mode="r|*") as tf:
+                _extract_tarball(tf, self.local_directory)
+        finally:
+            # Consume whatever follows the end of the archive.  This raises
+            # CommandError if tar failed (e.g., for a missing output).
+            for _ in chunks:
+                pass
+
+    def _fetch_meta_files(self):
+        local_metadir = op.join(
+            self.local_directory, op.relpath(self.meta_directory, self.working_directory), ""
+        )
+        names = ["stdout", "stderr"]
+        if self._uses_status_log:
+            self.session.get(op.join(self.meta_directory, "status.log"), local_metadir)
+        else:
+            names.insert(0, "status")
+        for idx in range(len(self.job_spec["_command_array"])):
+            for f in names:
+                self.session.get(
+                    op.join(self.meta_directory, "{}.{:d}".format(f, idx)), local_metadir
+                )
+
 
 @contextmanager
 def head_at(dataset, commit):
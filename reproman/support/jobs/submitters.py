@@ -15,8 +15,10 @@ import json
 import logging
 import math
 import re
+import threading
 import time
 
+from reproman import cfg
 from reproman.cmd import CommandError
 from reproman.dochelpers import borrowdoc
 
@@ -37,16 +39,110 @@ def assert_submission_id(method):
     return wrapped
 
 
+class StatusPoller(object):
+    """Snapshot of the status of submitted jobs, shared by submitters.
+
+    The status of all the tracked jobs is queried at once, and the result is
+    reused until it is older than `ttl` seconds or a job which was not part
+    of the query is asked about.  Completed jobs are no longer queried.
+
+    Parameters
+    ----------
+    query : callable
+        Given a session and a list of submission IDs, return a dict mapping
+        (some of) them to a status tuple as described in `Submitter.status`.
+    ttl : float
+        Number of seconds to reuse a snapshot for.
+    """
+
+    def __init__(self, query, ttl):
+        self._query = query
+        self.ttl = ttl
+        self._ids = set()
+        self._queried = set()
+        self._snapshot = {}
+        self._completed = {}
+        self._time = None
+        self._lock = threading.Lock()
+
+    def track(self, submission_id):
+        """Include `submission_id` in the next query."""
+        with self._lock:
+            if submission_id not in self._completed:
+                self._ids.add(submission_id)
+
+    def get(self, submission_id, session):
+        """Return the status of `submission_id`, querying it in `session` if needed."""
+        with self._lock:
+            if submission_id in self._completed:
+                return self._completed[submission_id]
+            self._ids.add(submission_id)
+            if (
+                submission_id not in self._queried
+                or self._time is None
+                or time.time() - self._time >= self.ttl
+            ):
+                ids = sorted(self._ids)
+                lgr.debug("Querying status of %d job(s)", len(ids))
+                self._snapshot = self._query(session, ids)
+                self._queried = set(ids)
+                self._time = time.time()
+                for subm_id, status in self._snapshot.items():
+                    if status[0] == "completed":
+                        self._ids.discard(subm_id)
+                        self._completed[subm_id] = status
+            return self._snapshot.get(submission_id, ("unknown", None))
+
+
+# Pollers shared by the submitters of a resource, by submitter name and
+# resource ID.
+_POLLERS = {}
+_POLLERS_LOCK = threading.Lock()
+
+
 class Submitter(object, metaclass=abc.ABCMeta):
     """Base Submitter class.
 
     A submitter is responsible for submitting a command on a resource (e.g., to
     a batch system).
+
+    Parameters
+    ----------
+    session : Session
+    resource_id : str, optional
+        ID of the resource `session` is for.  If given, the status of jobs is
+        queried along with that of the other jobs submitted to the resource
+        with this kind of submitter (see `StatusPoller`).
     """
 
-    def __init__(self, session):
+    # Default number of seconds to reuse queried job statuses for.  Can be
+    # overridden with the "status ttl" option of the "jobs" section.
+    status_ttl = 5
+
+    def __init__(self, session, resource_id=None):
         self.session = session
-        self.submission_id = None
+        self._submission_id = None
+        ttl = cfg.get_as_dtype("jobs", "status ttl", float, default=self.status_ttl)
+        if resource_id is None:
+            self.poller = StatusPoller(self._query_status, ttl)
+        else:
+            with _POLLERS_LOCK:
+                key = (self.name, resource_id)
+                if key not in _POLLERS:
+                    # The query is not bound to this submitter, so the poller
+                    # can outlive it.
+                    _POLLERS[key] = StatusPoller(self._query_status, ttl)
+                self.poller = _POLLERS[key]
+
+    @property
+    def submission_id(self):
+        return self._submission_id
+
+    @submission_id.setter
+    def submission_id(self, value):
+        self._submission_id = value
+        if value:
+            self.poller.track(value)
 
     @abc.abstractproperty
     def submit_command(self):
@@ -70,10 +166,13 @@ class Submitter(object, metaclass=abc.ABCMeta):
         out, _ = self.session.execute_command((submit_command or self.submit_command) + [script])
         subm_id = out.rstrip()
         if subm_id:
-            self.submission_id = subm_id
+            # Subclasses may parse the actual ID out of this, so don't track
+            # it yet.
+            self._submission_id = subm_id
             return subm_id
 
-    @abc.abstractproperty
+    @property
+    @assert_submission_id
     def status(self):
         """Return the status of a submitted job.
 
@@ -84,6 +183,24 @@ class Submitter(object, metaclass=abc.ABCMeta):
         The second item should be the status as reported by the batch system or
         None if one could not be determined.
         """
+        return self.poller.get(self.submission_id, self.session)
+
+    @classmethod
+    @abc.abstractmethod
+    def _query_status(cls, session, submission_ids):
+        """Query the batch system for the status of jobs.
+
+        Parameters
+        ----------
+        session : Session
+            Session to query in.
+        submission_ids : list of str
+
+        Returns
+        -------
+        A dict mapping submission IDs to a status tuple (see `status`).  IDs
+        the status could not be determined for can be left out.
+        """
 
     def follow(self):
         """Follow submitted command, exiting once it is finished."""
@@ -121,18 +238,17 @@ class PbsSubmitter(Submitter):
 
     name = "pbs"
 
-    def __init__(self, session):
-        super(PbsSubmitter, self).__init__(session)
+    def __init__(self, session, resource_id=None):
+        super(PbsSubmitter, self).__init__(session, resource_id)
 
     @property
     @borrowdoc(Submitter)
     def submit_command(self):
         return ["qsub"]
 
-    @property
-    @assert_submission_id
+    @classmethod
     @borrowdoc(Submitter)
-    def status(self):
+    def _query_status(cls, session, submission_ids):
         # FIXME: One problem is that Torque PBS may not represent the array
         # consistently between versions (or perhaps configuration?). One system
         # I try has [] in the name and allows qstat querying of the commands as
@@ -145,23 +261,47 @@ class PbsSubmitter(Submitter):
         # FIXME: Is there a reliable, long-lived way to see a job after it's
         # completed?  (tracejob can fail with permission issues.)
         try:
-            stat_out, _ = self.session.execute_command("qstat -f {}".format(self.submission_id))
-        except CommandError:
-            return "unknown", None
+            stat_out, _ = session.execute_command("qstat -f {}".format(" ".join(submission_ids)))
+        except CommandError as exc:
+            # qstat fails if any of the jobs is unknown but still reports on
+            # the others.
+            stat_out = exc.stdout or ""
+
+        job_states = {}
+        for block in re.split(r"^Job Id: ", stat_out, flags=re.MULTILINE)[1:]:
+            job_id = block.split(None, 1)[0]
+            match = re.search(r"job_state = ([A-Z])", block)
+            if not match:
+                lgr.warning("No job status match found in %s", block)
+                continue
+            job_states[job_id] = match.group(1)
+
+        statuses = {}
+        for subm_id, job_state in _match_ids(submission_ids, job_states).items():
+            if job_state in ["R", "E", "H", "Q", "W"]:
+                our_state = "waiting"
+            elif job_state == "C":
+                our_state = "completed"
+            else:
+                our_state = "unknown"
+            statuses[subm_id] = our_state, job_state
+        return statuses
 
-        match = re.search(r"job_state = ([A-Z])", stat_out)
-        if not match:
-            lgr.warning("No job status match found in %s", stat_out)
-            return "unknown", None
 
-        job_state = match.group(1)
-        if job_state in ["R", "E", "H", "Q", "W"]:
-            our_state = "waiting"
-        elif job_state == "C":
-            our_state = "completed"
-        else:
-            our_state = "unknown"
-        return our_state, job_state
+def _match_ids(submission_ids, found):
+    """Map `submission_ids` to the values of `found` for their job.
+
+    IDs reported by the batch system may differ from the submission IDs by
+    their server part (e.g., "123.server" vs "123.server.domain").
+    """
+    matched = {}
+    by_number = {k.split(".")[0]: v for k, v in found.items()}
+    for subm_id in submission_ids:
+        if subm_id in found:
+            matched[subm_id] = found[subm_id]
+        elif subm_id.split(".")[0] in by_number:
+            matched[subm_id] = by_number[subm_id.split(".")[0]]
+    return matched
 
 
 class CondorSubmitter(Submitter):
@@ -169,9 +309,8 @@ class CondorSubmitter(Submitter):
 
     name = "condor"
 
-    def __init__(self, session):
-        super(CondorSubmitter, self).__init__(session)
-        self._status_method = self._status_json
+    def __init__(self, session, resource_id=None):
+        super(CondorSubmitter, self).__init__(session, resource_id)
 
     @property
     @borrowdoc(Submitter)
@@ -188,29 +327,28 @@ class CondorSubmitter(Submitter):
         self.submission_id = job_id
         return job_id
 
-    @property
-    @assert_submission_id
+    @classmethod
     @borrowdoc(Submitter)
-    def status(self):
+    def _query_status(cls, session, submission_ids):
         try:
-            st = self._status_method()
+            return cls._status_json(session, submission_ids)
         except CommandError:
-            if self._status_method.__name__ == "_status_json":
-                lgr.debug("condor_q -json failed. Trying another method.")
-                self._status_method = self._status_no_json
-                st = self._status_method()
-            else:
-                st = "unknown", None
-        return st
-
-    def _status_json(self):
-        stat_out, _ = self.session.execute_command("condor_q -json {}".format(self.submission_id))
+            lgr.debug("condor_q -json failed. Trying another method.")
+        statuses = {}
+        for subm_id in submission_ids:
+            try:
+                statuses[subm_id] = cls._status_no_json(session, subm_id)
+            except CommandError:
+                pass
+        return statuses
+
+    @staticmethod
+    def _status_json(session, submission_ids):
+        stat_out, _ = session.execute_command("condor_q -json {}".format(" ".join(submission_ids)))
 
         if not stat_out.strip():
-            lgr.debug("Status output for %s empty", self.submission_id)
-            return "unknown", None
-
-        stat_json = json.loads(stat_out)
+            lgr.debug("Status output for %s empty", ", ".join(submission_ids))
+            return {}
 
         # http://pages.cs.wisc.edu/~adesmet/status.html
         condor_states = {
@@ -223,23 +361,30 @@ class CondorSubmitter(Submitter):
             6: "submission error",
         }
 
-        codes = [sj.get("JobStatus") for sj in stat_json]
-        waiting_states = [0, 1, 2, 5]
-        if any(c in waiting_states for c in codes):
-            our_status = "waiting"
-        elif all(c == 4 for c in codes):
-            our_status = "completed"
-        else:
-            our_status = "unknown"
-        # FIXME: their status should represent all subjobs, but right now we're
-        # just taking the first code.
-        return our_status, condor_states.get(codes[0])
+        codes_by_id = collections.defaultdict(list)
+        for sj in json.loads(stat_out):
+            codes_by_id[str(sj.get("ClusterId"))].append(sj.get("JobStatus"))
 
-    def _status_no_json(self):
+        statuses = {}
+        waiting_states = [0, 1, 2, 5]
+        for subm_id, codes in codes_by_id.items():
+            if any(c in waiting_states for c in codes):
+                our_status = "waiting"
+            elif all(c == 4 for c in codes):
+                our_status = "completed"
+            else:
+                our_status = "unknown"
+            # FIXME: their status should represent all subjobs, but right now
+            # we're just taking the first code.
+            statuses[subm_id] = our_status, condor_states.get(codes[0])
+        return statuses
+
+    @staticmethod
+    def _status_no_json(session, submission_id):
         """Unclever status for older condor versions without 'condor_q -json'."""
         # Parse the trailing:
         # 0 jobs; 0 completed, 0 removed, 0 idle, 0 running, 0 held, 0 suspended
-        stat_out, _ = self.session.execute_command("condor_q {}".format(self.submission_id))
+        stat_out, _ = session.execute_command("condor_q {}".format(submission_id))
         last_line = stat_out.strip().splitlines()[-1]
 
         ours, theirs = "unknown", None
@@ -273,8 +418,8 @@ class SlurmSubmitter(Submitter):
 
     name = "slurm"
 
-    def __init__(self, session):
-        super(SlurmSubmitter, self).__init__(session)
+    def __init__(self, session, resource_id=None):
+        super(SlurmSubmitter, self).__init__(session, resource_id)
 
     @property
     @borrowdoc(Submitter)
@@ -289,23 +434,43 @@ class SlurmSubmitter(Submitter):
         self.submission_id = job_id
         return job_id
 
-    @property
-    @assert_submission_id
+    @classmethod
     @borrowdoc(Submitter)
-    def status(self):
+    def _query_status(cls, session, submission_ids):
         try:
-            stat_out, _ = self.session.execute_command(
-                "scontrol show jobid={}".format(self.submission_id)
+            # %F is the ID of the array for its subjobs.
+            stat_out, _ = session.execute_command(
+                "squeue --noheader --states=all --format='%F %T' --jobs={}".format(
+                    ",".join(submission_ids)
+                )
             )
         except CommandError:
-            return "unknown", None
-
-        # Running scontrol with our jobid will show an entry for each subjob.
-        matches = re.findall(r"JobState=([A-Z]+)\b", stat_out)
-        if not matches:
-            lgr.warning("No job status match found in %s", stat_out)
-            return "unknown", None
-
+            # squeue fails for a single job it no longer knows about.
+            # Fall back to querying the jobs one by one.
+            statuses = {}
+            for subm_id in submission_ids:
+                try:
+                    stat_out, _ = session.execute_command("scontrol show jobid={}".format(subm_id))
+                except CommandError:
+                    continue
+                # Running scontrol with our jobid will show an entry for each
+                # subjob.
+                matches = re.findall(r"JobState=([A-Z]+)\b", stat_out)
+                if not matches:
+                    lgr.warning("No job status match found in %s", stat_out)
+                    continue
+                statuses[subm_id] = cls._get_status(matches)
+            return statuses
+
+        matches = collections.defaultdict(list)
+        for line in stat_out.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                matches[parts[0]].append(parts[1])
+        return {subm_id: cls._get_status(matches[subm_id]) for subm_id in matches}
+
+    @staticmethod
+    def _get_status(matches):
         # https://github.com/SchedMD/slurm/blob/db82f4eb3d844501b53a72ea313a9166d7a421b2/src/common/slurm_protocol_defs.c#L2656
         waiting_states = ["PENDING", "RUNNING"]
         if any(m in waiting_states for m in matches):
@@ -323,9 +488,11 @@ class LocalSubmitter(Submitter):
     """Submit a local job."""
 
     name = "local"
+    # Querying processes is cheap, and waiting on a finished one isn't.
+    status_ttl = 0
 
-    def __init__(self, session):
-        super(LocalSubmitter, self).__init__(session)
+    def __init__(self, session, resource_id=None):
+        super(LocalSubmitter, self).__init__(session, resource_id)
 
     @property
     @borrowdoc(Submitter)
@@ -341,19 +508,75 @@ class LocalSubmitter(Submitter):
         self.submission_id = pid
         return pid
 
+    @classmethod
+    @borrowdoc(Submitter)
+    def _query_status(cls, session, submission_ids):
+        try:
+            out, _ = session.execute_command(["ps", "-o", "pid=", "-p", ",".join(submission_ids)])
+        except CommandError as exc:
+            # ps fails if none of the processes is running.
+            if exc.stderr or exc.stdout is None:
+                return {}
+            out = exc.stdout
+        running = set(out.split())
+        return {
+            pid: ("waiting", "running") if pid in running else ("completed", "completed")
+            for pid in submission_ids
+        }
+
+
+# Report the state of local-pool supervisors, given the paths of their state
+# files.  A running supervisor which no longer exists has died.
+_POOL_STATUS_SCRIPT = (
+    'for f; do { read -r state pid rest <"$f"; } 2>/dev/null || continue; '
+    'if [ "$state" = running ] && ! kill -0 "$pid" 2>/dev/null; then state=died; fi; '
+    'printf "%s %s\\n" "$state" "$f"; done'
+)
+
+
+class LocalPoolSubmitter(Submitter):
+    """Submit a local job run by a pool of workers.
+
+    Unlike the "local" submitter, this doesn't need GNU Parallel, but it
+    needs Python 3 on the resource. The subjobs are run by a detached Python
+    process with up to `max_workers` (default: number of CPUs) at a time.
+    Subjobs can be restricted to the CPUs in `cpu_affinity` (e.g., "0-3,6")
+    and to an address space of `memory` MB.
+    """
+
+    name = "local-pool"
+    status_ttl = 0
+
+    def __init__(self, session, resource_id=None):
+        super(LocalPoolSubmitter, self).__init__(session, resource_id)
+
     @property
-    @assert_submission_id
     @borrowdoc(Submitter)
-    def status(self):
+    def submit_command(self):
+        return ["python3"]
+
+    @borrowdoc(Submitter)
+    def submit(self, script, submit_command=None):
+        out = super(LocalPoolSubmitter, self).submit(script, submit_command)
+        # The path of the supervisor's state file.
+        self.submission_id = out
+        return out
+
+    @classmethod
+    @borrowdoc(Submitter)
+    def _query_status(cls, session, submission_ids):
         try:
-            out, _ = self.session.execute_command(["ps", "-o", "pid=", "-p", self.submission_id])
+            out, _ = session.execute_command(
+                ["sh", "-c", _POOL_STATUS_SCRIPT, "sh"] + submission_ids
+            )
         except CommandError:
-            return "unknown", None
-        if out.strip():
-            status = "waiting", "running"
-        else:
-            status = "completed", "completed"
-        return status
+            return {}
+        to_ours = {"running": "waiting", "completed": "completed"}
+        statuses = {}
+        for line in out.splitlines():
+            state, _, state_file = line.partition(" ")
+            statuses[state_file] = to_ours.get(state, "unknown"), state
+        return statuses
 
 
 class LSFSubmitter(Submitter):
@@ -361,8 +584,8 @@ class LSFSubmitter(Submitter):
 
     name = "lsf"
 
-    def __init__(self, session):
-        super(LSFSubmitter, self).__init__(session)
+    def __init__(self, session, resource_id=None):
+        super(LSFSubmitter, self).__init__(session, resource_id)
 
     @property
     @borrowdoc(Submitter)
@@ -392,23 +615,32 @@ class LSFSubmitter(Submitter):
             time.sleep(1)
         return self.submission_id
 
-    @property
-    @assert_submission_id
+    @classmethod
     @borrowdoc(Submitter)
-    def status(self):
-        out, _ = self.session.execute_command("bjobs -noheader {}".format(self.submission_id))
-        parts = out.split()
-        if not parts:
+    def _query_status(cls, session, submission_ids):
+        try:
+            out, _ = session.execute_command("bjobs -noheader {}".format(" ".join(submission_ids)))
+        except CommandError as exc:
+            # bjobs fails if any of the jobs is unknown but still reports on
+            # the others.
+            out = exc.stdout or ""
+        job_states = {}
+        for line in out.splitlines():
+            parts = line.split()
             # bjobs might not know about the job if it is still being queued
             # and it won't know about the job if some time has passed since
             # it terminated
-            return ("unknown", None)
-        assert parts[0] == self.submission_id
-        if parts[2] in ("PEND", "RUN"):
-            return ("waiting", parts[2])
-        if parts[2] in ("DONE", "EXIT"):
-            return ("completed", parts[2])
-        return ("unknown", parts[2])
+            if len(parts) > 2 and parts[0] in submission_ids:
+                job_states.setdefault(parts[0], parts[2])
+        statuses = {}
+        for subm_id, state in job_states.items():
+            if state in ("PEND", "RUN"):
+                statuses[subm_id] = "waiting", state
+            elif state in ("DONE", "EXIT"):
+                statuses[subm_id] = "completed", state
+            else:
+                statuses[subm_id] = "unknown", state
+        return statuses
 
 
 SUBMITTERS = collections.OrderedDict(
@@ -418,6 +650,7 @@ SUBMITTERS = collections.OrderedDict(
         CondorSubmitter,
         SlurmSubmitter,
         LocalSubmitter,
+        LocalPoolSubmitter,
         LSFSubmitter,
     ]
 )
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import json
+import os
+import os.path as op
+
+from unittest.mock import patch
+import pytest
+
+from reproman.resource.session import get_local_session
+from reproman.support.jobs import input_sync
+from reproman.support.jobs.input_sync import InputManifest
+from reproman.support.jobs.input_sync import sync_inputs
+from reproman.tests.utils import create_tree
+
+
+@pytest.fixture()
+def local_inputs(tmpdir):
+    local_dir = str(tmpdir.mkdir("local"))
+    create_tree(local_dir, {"a": "aaa", "d": {"b": "bbb"}})
+    return local_dir
+
+
+def _sync(local_dir, remote_dir, manifest, names=("a", "d")):
+    session = get_local_session()
+    inputs = [(op.join(local_dir, p), op.join(remote_dir, p)) for p in names]
+    with (
+        patch.object(input_sync, "_put_input", wraps=input_sync._put_input) as put,
+        patch.object(input_sync, "_copy_remote", wraps=input_sync._copy_remote) as copy_remote,
+    ):
+        sync_inputs(session, inputs, manifest)
+    for _, remote_path in inputs:
+        assert op.exists(remote_path)
+    copied = [pair for call in copy_remote.call_args_list for pair in call[0][1]]
+    # The inputs put, along with the files put if not the whole input
+    put = [(call[0][1], None if call[0][5] else sorted(call[0][3])) for call in put.call_args_list]
+    return put, copied
+
+
+def test_sync_inputs(tmpdir, local_inputs):
+    tmpdir = str(tmpdir)
+    manifest_file = op.join(tmpdir, "manifest.json")
+    manifest = InputManifest(manifest_file)
+    job0, job1, job2 = (op.join(tmpdir, "job" + str(i)) for i in range(3))
+
+    put, copied = _sync(local_inputs, job0, manifest)
+    assert put == [(op.join(local_inputs, "a"), None), (op.join(local_inputs, "d"), None)]
+    assert not copied
+    with open(manifest_file) as fh:
+        records = json.load(fh)
+    assert set(records[op.join(local_inputs, "a")]["copies"]) == {op.join(job0, "a")}
+
+    # Inputs of a new job are copied from the previous job.
+    put, copied = _sync(local_inputs, job1, InputManifest(manifest_file))
+    assert not put
+    assert sorted(copied) == [
+        (op.join(job0, "a"), op.join(job1, "a")),
+        (op.join(job0, "d", "b"), op.join(job1, "d", "b")),
+    ]
+    with open(op.join(job1, "d", "b")) as fh:
+        assert fh.read() == "bbb"
+
+    # Nothing to do for files already in place.
+    assert _sync(local_inputs, job1, InputManifest(manifest_file)) == ([], [])
+
+    # A modified input is put again, and a copy modified on the resource is
+    # not used.
+    with open(op.join(local_inputs, "a"), "w") as fh:
+        fh.write("new content")
+    with open(op.join(job1, "d", "b"), "w") as fh:
+        fh.write("modified")
+    os.utime(op.join(job1, "d", "b"), (0, 0))
+    put, copied = _sync(local_inputs, job2, InputManifest(manifest_file))
+    assert put == [(op.join(local_inputs, "a"), None)]
+    assert copied == [(op.join(job0, "d", "b"), op.join(job2, "d", "b"))]
+    with open(op.join(job2, "a")) as fh:
+        assert fh.read() == "new content"
+
+
+def test_sync_inputs_same_checksum(tmpdir, local_inputs):
+    # A remote file which was not recorded but matches is not put again.
+    remote_dir = str(tmpdir.mkdir("remote"))
+    create_tree(remote_dir, {"a": "aaa", "d": {"b": "xxx", "c": "ccc"}})
+    create_tree(local_inputs, {"d": {"c": "ccc", "e": {}}})
+    put, copied = _sync(local_inputs, remote_dir, InputManifest(None))
+    # Only the changed files of a directory are put, at once.
+    assert put == [(op.join(local_inputs, "d"), ["b"])]
+    assert not copied
+    with open(op.join(remote_dir, "d", "b")) as fh:
+        assert fh.read() == "bbb"
+    assert op.isdir(op.join(remote_dir, "d", "e"))
+
+
+def test_sync_inputs_symlinks(tmpdir):
+    local_dir = str(tmpdir.mkdir("local"))
+    create_tree(local_dir, {"data": {"f": "fff"}, "d": {"b": "bbb"}})
+    os.symlink(op.join(local_dir, "data"), op.join(local_dir, "d", "data"))
+    remote_dir = op.join(str(tmpdir), "remote")
+    manifest = InputManifest(None)
+    _sync(local_dir, remote_dir, manifest, names=["d"])
+    assert op.join(local_dir, "d", "data", "f") in manifest.records
+    with open(op.join(remote_dir, "d", "data", "f")) as fh:
+        assert fh.read() == "fff"
+
+
+def test_walk_input_loop(tmpdir):
+    create_tree(str(tmpdir), {"d": {"b": "bbb", "e": {}}})
+    # A link back to a directory being walked is not followed.
+    os.symlink(str(tmpdir.join("d")), str(tmpdir.join("d", "e", "loop")))
+    os.symlink(str(tmpdir.join("missing")), str(tmpdir.join("d", "broken")))
+    assert input_sync._walk_input(str(tmpdir.join("d"))) == (["b"], ["e"])
+
+
+def test_input_manifest_concurrent(tmpdir, local_inputs):
+    # Records saved by another run meanwhile are not lost.
+    manifest_file = str(tmpdir.join("manifest.json"))
+    manifest0, manifest1 = InputManifest(manifest_file), InputManifest(manifest_file)
+    manifest0.records
+    manifest1.records
+    _sync(local_inputs, str(tmpdir.join("job0")), manifest0, names=["a"])
+    _sync(local_inputs, str(tmpdir.join("job1")), manifest1, names=["a", "d"])
+    records = InputManifest(manifest_file).records
+    assert set(records[op.join(local_inputs, "a")]["copies"]) == {
+        str(tmpdir.join(job, "a")) for job in ["job0", "job1"]
+    }
+    assert op.join(local_inputs, "d", "b") in records
+
+
+def test_input_manifest_without_fcntl(tmpdir, local_inputs):
+    # On Windows, the manifest is saved without locking it.
+    manifest_file = str(tmpdir.join("manifest.json"))
+    with patch.object(input_sync, "fcntl", None):
+        _sync(local_inputs, str(tmpdir.join("job0")), InputManifest(manifest_file), names=["a"])
+    assert op.join(local_inputs, "a") in InputManifest(manifest_file).records
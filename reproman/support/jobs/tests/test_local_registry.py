@@ -7,7 +7,10 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import datetime
+import os
 import os.path as op
+import time
 
 import pytest
 import yaml
@@ -41,3 +44,84 @@ def test_local_registry(tmpdir):
     files = lreg.find_job_files()
     assert "jobid0" in files
     assert "jobid1" not in files
+
+
+def test_local_registry_find_jobs(tmpdir):
+    lreg = LocalRegistry(directory=op.join(str(tmpdir), "registry"))
+    lreg.register(
+        "20200101-000000-aaaa", {"resource_id": "r0", "resource_name": "a", "submitter": "pbs"}
+    )
+    lreg.register(
+        "20200102-000000-bbbb", {"resource_id": "r1", "resource_name": "b", "submitter": "pbs"}
+    )
+    lreg.register(
+        "20200102-120000-cccc", {"resource_id": "r1", "resource_name": "b", "submitter": "local"}
+    )
+
+    assert list(lreg.find_jobs(resource="a")) == ["20200101-000000-aaaa"]
+    assert list(lreg.find_jobs(resource="r1", submitter="pbs")) == ["20200102-000000-bbbb"]
+    assert list(lreg.find_jobs(prefix="20200102")) == [
+        "20200102-000000-bbbb",
+        "20200102-120000-cccc",
+    ]
+    since = time.mktime((2020, 1, 2, 6, 0, 0, 0, 0, -1))
+    assert list(lreg.find_jobs(since=since)) == ["20200102-120000-cccc"]
+    assert list(lreg.find_jobs(until=since)) == ["20200101-000000-aaaa", "20200102-000000-bbbb"]
+    assert lreg.find_jobs(resource="a")["20200101-000000-aaaa"]["submitter"] == "pbs"
+
+    assert not lreg.find_jobs(status="completed")
+    lreg.set_status("20200101-000000-aaaa", "completed")
+    assert list(lreg.find_jobs(status="completed")) == ["20200101-000000-aaaa"]
+
+
+def test_local_registry_match(tmpdir):
+    lreg = LocalRegistry(directory=op.join(str(tmpdir), "registry"))
+    for jobid in ["abc", "abcd", "xabx"]:
+        lreg.register(jobid, {})
+    assert lreg.match("abc") == "abc"
+    assert lreg.match("abcd") == "abcd"
+    assert lreg.match("x") == "xabx"
+    assert lreg.match("bx") == "xabx"
+    assert lreg.match("nope") is None
+    with pytest.raises(ValueError):
+        lreg.match("ab")
+    with pytest.raises(ValueError):
+        lreg.match("b")
+
+
+def test_local_registry_index_sync(tmpdir):
+    directory = op.join(str(tmpdir), "registry")
+    lreg = LocalRegistry(directory=directory)
+    lreg.register("jobid0", {"submitter": "pbs"})
+
+    # Job files written without the index (e.g., by an older version) are
+    # picked up, and removed ones are dropped.
+    os.makedirs(directory, exist_ok=True)
+    with open(op.join(directory, "jobid1"), "w") as fh:
+        yaml.safe_dump({"submitter": "local"}, fh)
+    os.unlink(op.join(directory, "jobid0"))
+    assert list(LocalRegistry(directory=directory).find_jobs()) == ["jobid1"]
+    assert list(lreg.find_jobs(submitter="local")) == ["jobid1"]
+
+    # The files aren't scanned again while the directory is unchanged...
+    os.utime(directory, (1000, 1000))
+    assert list(lreg.find_jobs()) == ["jobid1"]
+    with open(op.join(directory, "jobid1"), "w") as fh:
+        yaml.safe_dump({"submitter": "slurm"}, fh)
+    os.utime(op.join(directory, "jobid1"), (0, 0))
+    os.utime(directory, (1000, 1000))
+    assert not lreg.find_jobs(submitter="slurm")
+    # ... but updated job files are reindexed once it changes.
+    os.utime(directory, (2000, 2000))
+    assert list(lreg.find_jobs(submitter="slurm")) == ["jobid1"]
+
+
+def test_local_registry_date_values(tmpdir):
+    directory = op.join(str(tmpdir), "registry")
+    os.makedirs(directory)
+    with open(op.join(directory, "jobid0"), "w") as fh:
+        fh.write("submitter: pbs\ndate: 2020-01-02\n")
+    lreg = LocalRegistry(directory=directory)
+    assert lreg.find_jobs()["jobid0"] == {"submitter": "pbs", "date": "2020-01-02"}
+    lreg.register("jobid1", {"when": datetime.date(2020, 1, 3)})
+    assert lreg.find_jobs()["jobid1"] == {"when": "2020-01-03"}
@@ -10,6 +10,9 @@
 import logging
 import os
 import os.path as op
+import subprocess
+import sys
+import time
 import yaml
 
 from unittest.mock import MagicMock
@@ -24,6 +27,7 @@ from reproman.support.exceptions import MissingExternalDependency
 from reproman.support.exceptions import OrchestratorError
 from reproman.support.external_versions import external_versions
 from reproman.support.jobs import orchestrators as orcs
+from reproman.support.jobs.template import Template
 from reproman.tests.fixtures import get_docker_fixture
 from reproman.tests.skip import mark
 from reproman.tests.skip import skipif
@@ -97,6 +101,98 @@ def test_orc_root_directory_error(shell, value):
             orc.root_directory
 
 
+@pytest.mark.parametrize("ncommands", [1, 12])
+def test_runscript_command_lookup(tmpdir, ncommands):
+    tmpdir = str(tmpdir)
+    commands = ["echo {} é".format(i) for i in range(ncommands)]
+    commands[-1] = "printf '%s\\n' 'multi\nline'"
+    index, width = orcs._format_command_index(commands)
+    assert all(len(line) + 1 == width for line in index.splitlines())
+    metadir = op.join(tmpdir, "meta")
+    create_tree(
+        tmpdir,
+        {"meta": {"command-array": "\0".join(commands), "command-array.idx": index}},
+    )
+    runscript = Template(
+        _jobid="jid",
+        _num_subjobs=ncommands + 1,
+        _meta_directory=metadir,
+        _command_index_width=width,
+        _status_log=False,
+        root_directory=tmpdir,
+        working_directory=tmpdir,
+    ).render_runscript("base.template.sh")
+    expected = {0: "0 é", ncommands - 1: "multi\nline"}
+    for subjob, expected_out in expected.items():
+        out = subprocess.run(
+            ["sh", "-c", runscript, "runscript", str(subjob)],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        ).stdout
+        assert out.endswith(expected_out + "\n")
+        with open(op.join(metadir, "status.{}".format(subjob))) as fh:
+            assert fh.read() == "succeeded\n"
+    # There is no command beyond the array.
+    assert subprocess.run(["sh", "-c", runscript, "runscript", str(ncommands)]).returncode == 1
+
+
+@pytest.mark.parametrize("status_log", [False, True], ids=["status files", "status log"])
+@pytest.mark.parametrize("lock", ["flock", "mkdir"])
+def test_runscript_post_command_once(tmpdir, lock, status_log):
+    tmpdir = str(tmpdir)
+    commands = ["sleep 0.{}".format(i % 3) for i in range(6)]
+    index, width = orcs._format_command_index(commands)
+    metadir = op.join(tmpdir, "meta")
+    create_tree(
+        tmpdir,
+        {"meta": {"command-array": "\0".join(commands), "command-array.idx": index}},
+    )
+    env = dict(os.environ)
+    if lock == "mkdir":
+        # flock fails as on a file system which doesn't support it.
+        create_tree(tmpdir, {"bin": {"flock": "#!/bin/sh\nexit 2\n"}})
+        os.chmod(op.join(tmpdir, "bin", "flock"), 0o755)
+        env["PATH"] = op.join(tmpdir, "bin") + os.pathsep + env["PATH"]
+        # A lock left by a subjob that is gone is broken.
+        create_tree(metadir, {"meta.lock": {"holder": "{} 999999999\n".format(os.uname()[1])}})
+    runscript = Template(
+        _jobid="jid",
+        _num_subjobs=len(commands),
+        _meta_directory=metadir,
+        _command_index_width=width,
+        _status_log=status_log,
+        root_directory=tmpdir,
+        working_directory=tmpdir,
+    ).render_runscript("base.template.sh")
+    procs = [
+        subprocess.Popen(
+            ["sh", "-c", runscript, "runscript", str(i)],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            env=env,
+        )
+        for i in range(len(commands))
+    ]
+    outs = [p.communicate()[0] for p in procs]
+    assert [p.returncode for p in procs] == [0] * len(commands)
+    # Only the subjob which finished last ran the post-command.
+    assert sum("[ReproMan] post-command..." in out for out in outs) == 1
+    assert op.exists(op.join(tmpdir, "completed", "jid"))
+    with open(op.join(metadir, "finished")) as fh:
+        assert fh.read() == "{}\n".format(len(commands))
+    assert not op.exists(op.join(metadir, "meta.lock"))
+    if status_log:
+        # The lines of concurrent subjobs neither got lost nor mixed up.
+        with open(op.join(metadir, "status.log")) as fh:
+            lines = fh.read().splitlines()
+        assert sorted(lines) == sorted(
+            "{} {}".format(i, status)
+            for i in range(len(commands))
+            for status in ["submitted", "running", "succeeded"]
+        )
+
+
 @pytest.fixture()
 def job_spec(tmpdir):
     return {
@@ -344,6 +440,183 @@ def test_orc_plain_failure(tmpdir, job_spec, shell):
         assert op.exists(op.join(orc.meta_directory, fname + ".0"))
 
 
+@pytest.mark.parametrize("how", ["tar", "tar.gz", "fallback"])
+def test_orc_plain_fetch_archive(tmpdir, job_spec, shell, how):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    job_spec["outputs"] = ["out", "sub"]
+    job_spec["_resolved_command_str"] = 'bash -c "mkdir sub && cat d/in >out && echo x >sub/out"'
+    tar_script = "exit 1 # %s" if how == "fallback" else orcs._TAR_FETCH_SCRIPT
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        orc.follow()
+        with (
+            patch.object(orcs.cfg, "getboolean", return_value=how == "tar.gz"),
+            patch.object(orcs, "_TAR_FETCH_SCRIPT", tar_script),
+            patch.object(orc.session, "get", wraps=orc.session.get) as get,
+        ):
+            orc.fetch()
+    # Without the archive, the files are transferred one by one.
+    assert (get.call_count == 0) == (how != "fallback")
+    assert open(op.join(local_dir, "out")).read() == "content\n"
+    assert open(op.join(local_dir, "sub", "out")).read() == "x\n"
+    metadir_local = op.join(local_dir, op.relpath(orc.meta_directory, orc.working_directory))
+    for fname in "status", "stderr", "stdout":
+        assert op.exists(op.join(metadir_local, fname + ".0"))
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="no CPU affinity support")
+def test_orc_plain_local_pool(tmpdir, job_spec, shell):
+    job_spec.update(max_workers="2", cpu_affinity="0", memory="1024", inputs=[], outputs=[])
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local-pool", job_spec=job_spec)
+        orc.prepare_remote()
+        # Plain orchestrators run a single command, but the pool runs any
+        # number of subjobs.
+        orc.job_spec["_command_array"] = [
+            "grep Cpus_allowed_list /proc/self/status",
+            "sh -c 'ulimit -v'",
+            "exit 3",
+            "true",
+        ]
+        orc.submit()
+        orc.follow()
+    assert orc.submitter.status == ("completed", "completed")
+    meta = orc.meta_directory
+    assert orc.get_failed_subjobs() == [2]
+    with open(op.join(meta, "stdout.0")) as fh:
+        assert "Cpus_allowed_list:\t0" in fh.read().splitlines()
+    with open(op.join(meta, "stdout.1")) as fh:
+        assert str(1024 * 1024) in fh.read().splitlines()
+    for subjob, status in enumerate(["succeeded", "succeeded", "failed: 3", "succeeded"]):
+        with open(op.join(meta, "status.{}".format(subjob))) as fh:
+            assert fh.read().strip() == status
+
+
+def test_local_pool_no_subjobs(tmpdir):
+    metadir = str(tmpdir)
+    script = Template(_meta_directory=metadir, _num_subjobs=0).render_submission(
+        "local-pool.template"
+    )
+    create_tree(metadir, {"submit": script})
+    out = subprocess.run(
+        [sys.executable, op.join(metadir, "submit")],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    state_file = out.strip()
+    for _ in range(100):
+        with open(state_file) as fh:
+            state = fh.read().split()
+        if state[0] != "running":
+            break
+        time.sleep(0.1)
+    assert state[0] == "completed"
+    assert state[2:] == ["0", "0"]
+
+
+def test_orc_plain_packed(tmpdir, job_spec, shell):
+    job_spec.update(pack_size="5", pack_workers="2", inputs=[], outputs=[])
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        orc.prepare_remote()
+        orc.job_spec["_command_array"] = [
+            "echo {}; exit $(({} % 2))".format(i, i) for i in range(5)
+        ]
+        orc.submit()
+        orc.follow()
+    assert orc.get_failed_subjobs() == [1, 3]
+    for subjob in range(5):
+        with open(op.join(orc.meta_directory, "stdout.{}".format(subjob))) as fh:
+            assert str(subjob) in fh.read().splitlines()
+    assert op.exists(op.join(orc.meta_directory, "task-stdout.0"))
+
+
+@pytest.mark.parametrize("status_log", [False, True], ids=["status files", "status log"])
+def test_orc_plain_status(tmpdir, job_spec, shell, status_log):
+    job_spec.update(pack_size="6", status_log=str(status_log).lower(), inputs=[], outputs=[])
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        orc.prepare_remote()
+        orc.job_spec["_command_array"] = ["exit {}".format(i % 3) for i in range(6)]
+        del orc.job_spec["_outputs_array"]
+        orc.submit()
+        orc.follow()
+        assert orc.get_failed_subjobs() == [1, 2, 4, 5]
+        assert orc.get_status(3) == "succeeded"
+        assert orc.get_status(4) == "failed: 1"
+        assert orc.get_status_counts() == {"succeeded": 2, "failed: 1": 2, "failed: 2": 2}
+        meta = orc.meta_directory
+        assert op.exists(op.join(meta, "status.log")) == status_log
+        assert op.exists(op.join(meta, "status.0")) != status_log
+        assert op.exists(op.join(meta, "failed")) != status_log
+
+        orc.fetch()
+        local_meta = op.relpath(meta, orc.working_directory)
+        assert op.exists(op.join(local_meta, "status.log")) == status_log
+        assert op.exists(op.join(local_meta, "stdout.5"))
+
+
+@pytest.mark.parametrize("submitter", ["condor", "lsf", "pbs", "slurm", "local"])
+def test_orc_packed_submission(tmpdir, job_spec, shell, submitter):
+    job_spec.update(pack_size="2", inputs=[], outputs=[])
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type=submitter, job_spec=job_spec)
+        orc.job_spec["_command_array"] = ["true"] * 5
+        with (
+            patch.object(orc.submitter, "submit", return_value=None),
+            patch.object(orc.session, "put_text") as put_text,
+        ):
+            orc.submit()
+    scripts = {op.basename(c[0][1]): c[0][0] for c in put_text.call_args_list}
+    assert "taskscript" in scripts
+    submission = scripts["submit"]
+    assert "/taskscript" in submission
+    if submitter != "pbs":
+        assert "task-stdout." in submission
+    assert "/runscript" not in submission
+    # Five subjobs packed by two make three tasks.
+    assert any(n in submission for n in ["0-2", "1-3]", "queue 3", "num_tasks=3"])
+
+
+def test_orc_packing_invalid(tmpdir, job_spec, shell):
+    job_spec["pack_size"] = "0"
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        with pytest.raises(OrchestratorError, match="pack_size"):
+            orc.submit()
+
+
+def test_orc_plain_fetch_missing_output(tmpdir, job_spec, shell):
+    job_spec["outputs"] = ["out", "not-there"]
+    with chpwd(str(tmpdir)):
+        create_tree(str(tmpdir), {"d": {"in": "content\n"}})
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        orc.follow()
+        with pytest.raises(OSError):
+            orc.fetch()
+        assert op.exists("out")
+
+
+def test_orc_plain_fetch_basename(tmpdir, job_spec, shell):
+    # Outputs are placed under their base name, as with Session.get.
+    job_spec.update(inputs=[], outputs=["sub/out"])
+    job_spec["_resolved_command_str"] = 'sh -c "mkdir sub && echo x >sub/out"'
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local", job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        orc.follow()
+        orc.fetch()
+    assert open(str(tmpdir.join("out"))).read() == "x\n"
+    assert not tmpdir.join("sub").exists()
+
+
 @pytest.mark.integration
 def test_orc_datalad_run_failed(job_spec, dataset, ssh):
     job_spec["_resolved_command_str"] = "iwillfail"
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import json
+import os
+
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import pytest
+
+from reproman.resource.session import get_local_session
+from reproman.support.exceptions import CommandError
+from reproman.support.jobs import submitters as subm
+
+
+@pytest.fixture(autouse=True)
+def no_shared_pollers():
+    with patch.dict(subm._POLLERS, clear=True):
+        yield
+
+
+def _session(out=None, exc=None):
+    session = MagicMock()
+    if exc is not None:
+        session.execute_command.side_effect = exc
+    else:
+        session.execute_command.return_value = out, ""
+    return session
+
+
+def _submitters(cls, session, ids):
+    submitters = []
+    for subm_id in ids:
+        submitter = cls(session, resource_id="rid")
+        submitter.submission_id = subm_id
+        submitters.append(submitter)
+    return submitters
+
+
+def test_status_poller_shared():
+    session = _session("1 RUNNING\n1 PENDING\n2 COMPLETED\n")
+    s1, s2, s3 = _submitters(subm.SlurmSubmitter, session, ["1", "2", "3"])
+    assert s1.poller is s2.poller
+    assert s1.status == ("waiting", "RUNNING")
+    assert s2.status == ("completed", "COMPLETED")
+    assert s3.status == ("unknown", None)
+    # All jobs were queried at once.
+    session.execute_command.assert_called_once()
+    assert "--jobs=1,2,3" in session.execute_command.call_args[0][0]
+
+    # Another resource or submitter type has its own poller.
+    assert subm.SlurmSubmitter(session, resource_id="other").poller is not s1.poller
+    assert subm.PbsSubmitter(session, resource_id="rid").poller is not s1.poller
+    assert subm.SlurmSubmitter(session).poller is not s1.poller
+
+
+def test_status_poller_ttl():
+    query = MagicMock(return_value={"1": ("waiting", "running")})
+    poller = subm.StatusPoller(query, ttl=60)
+    poller.track("1")
+    assert poller.get("1", "session") == ("waiting", "running")
+    assert poller.get("1", "session") == ("waiting", "running")
+    assert query.call_count == 1
+    # A job not part of the last query triggers a new one.
+    assert poller.get("2", "session") == ("unknown", None)
+    assert query.call_count == 2
+    query.assert_called_with("session", ["1", "2"])
+
+    with patch("time.time", return_value=poller._time + 61):
+        poller.get("1", "session")
+    assert query.call_count == 3
+
+
+def test_status_poller_completed():
+    query = MagicMock(return_value={"1": ("completed", "done"), "2": ("waiting", "running")})
+    poller = subm.StatusPoller(query, ttl=0)
+    poller.track("1")
+    poller.track("2")
+    assert poller.get("1", "session") == ("completed", "done")
+    # Completed jobs are no longer queried.
+    query.return_value = {}
+    assert poller.get("2", "session") == ("unknown", None)
+    query.assert_called_with("session", ["2"])
+    assert poller.get("1", "session") == ("completed", "done")
+    assert query.call_count == 2
+
+
+def test_status_poller_session():
+    # Each submitter queries in its own session, even with a shared poller.
+    session1 = _session("1 RUNNING\n")
+    session2 = _session("2 RUNNING\n")
+    (s1,) = _submitters(subm.SlurmSubmitter, session1, ["1"])
+    (s2,) = _submitters(subm.SlurmSubmitter, session2, ["2"])
+    assert s1.poller is s2.poller
+    s1.status
+    session1.execute_command.assert_called_once()
+    with patch("time.time", return_value=s1.poller._time + 61):
+        s2.status
+    session1.execute_command.assert_called_once()
+    session2.execute_command.assert_called_once()
+
+
+def test_slurm_status_fallback():
+    def execute_command(cmd):
+        if cmd.startswith("squeue"):
+            raise CommandError(cmd=cmd)
+        if cmd.endswith("=1"):
+            return "JobId=1 JobState=COMPLETED\nJobId=2 JobState=COMPLETED\n", ""
+        raise CommandError(cmd=cmd)
+
+    session = MagicMock()
+    session.execute_command.side_effect = execute_command
+    s1, s2 = _submitters(subm.SlurmSubmitter, session, ["1", "2"])
+    assert s1.status == ("completed", "COMPLETED")
+    assert s2.status == ("unknown", None)
+
+
+def test_pbs_status():
+    out = (
+        "Job Id: 10.server.example.com\n    job_state = R\n"
+        "Job Id: 11.server.example.com\n    job_state = C\n"
+    )
+    session = _session(exc=CommandError(stdout=out))
+    s10, s11, s12 = _submitters(subm.PbsSubmitter, session, ["10.server", "11.server", "12.server"])
+    assert s10.status == ("waiting", "R")
+    assert s11.status == ("completed", "C")
+    assert s12.status == ("unknown", None)
+    session.execute_command.assert_called_once_with("qstat -f 10.server 11.server 12.server")
+
+
+def test_condor_status():
+    out = json.dumps(
+        [
+            {"ClusterId": 5, "ProcId": 0, "JobStatus": 4},
+            {"ClusterId": 5, "ProcId": 1, "JobStatus": 2},
+            {"ClusterId": 6, "ProcId": 0, "JobStatus": 4},
+        ]
+    )
+    session = _session(out)
+    s5, s6 = _submitters(subm.CondorSubmitter, session, ["5", "6"])
+    assert s5.status == ("waiting", "completed")
+    assert s6.status == ("completed", "completed")
+    session.execute_command.assert_called_once_with("condor_q -json 5 6")
+
+
+def test_lsf_status():
+    out = (
+        "7 user RUN normal host host name Jan 1 00:00\n"
+        "8 user DONE normal host host name Jan 1 00:00\n"
+    )
+    session = _session(out)
+    s7, s8 = _submitters(subm.LSFSubmitter, session, ["7", "8"])
+    assert s7.status == ("waiting", "RUN")
+    assert s8.status == ("completed", "DONE")
+
+
+def test_local_status():
+    session = get_local_session()
+    running, done = _submitters(subm.LocalSubmitter, session, [str(os.getpid()), "999999999"])
+    assert running.status == ("waiting", "running")
+    assert done.status == ("completed", "completed")
+
+
+def test_local_status_none_running():
+    (done,) = _submitters(subm.LocalSubmitter, get_local_session(), ["999999999"])
+    assert done.status == ("completed", "completed")
+
+
+def test_local_pool_status(tmpdir):
+    states = {
+        "running": "running {} 0 2\n".format(os.getpid()),
+        "completed": "completed 1 2 2\n",
+        # No such process
+        "died": "running 999999999 1 2\n",
+    }
+    paths = {}
+    for state, content in states.items():
+        paths[state] = str(tmpdir.join(state + " state"))
+        with open(paths[state], "w") as fh:
+            fh.write(content)
+    paths["missing"] = str(tmpdir.join("missing"))
+    submitters = _submitters(subm.LocalPoolSubmitter, get_local_session(), list(paths.values()))
+    assert [s.status for s in submitters] == [
+        ("waiting", "running"),
+        ("completed", "completed"),
+        ("unknown", "died"),
+        ("unknown", None),
+    ]
@@ -0,0 +1,95 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import logging
+import os
+import threading
+import time
+from unittest.mock import patch
+
+from reproman.support import version_check
+from reproman.utils import swallow_logs
+
+
+def test_check_available_version(tmpdir, monkeypatch):
+    monkeypatch.delenv("NO_ET", raising=False)
+    stamp = str(tmpdir.join("cache", "version-check"))
+    latest = {"version": "1.0", "bad_versions": []}
+
+    def check(version):
+        with swallow_logs(new_level=logging.WARNING) as cml:
+            thread = version_check.check_available_version(version)
+            if thread:
+                thread.join()
+            return thread, cml.out
+
+    def make_due():
+        day_ago = time.time() - version_check.CHECK_INTERVAL - 1
+        os.utime(stamp, (day_ago, day_ago))
+
+    with (
+        patch.object(version_check, "get_stamp_path", return_value=stamp),
+        patch.object(version_check, "_query_latest", side_effect=lambda: dict(latest)) as query,
+    ):
+        thread, out = check("1.0")
+        assert thread
+        assert query.call_count == 1
+        assert os.path.exists(stamp)
+        assert not out
+        # Checked at most once a day
+        assert check("1.0") == (None, "")
+
+        # A newer version found by a check is reported by the next due one.
+        make_due()
+        latest = {"version": "2.0", "bad_versions": ["1.0"]}
+        thread, out = check("1.0")
+        assert thread
+        assert not out
+        assert version_check._read_stamp(stamp)["version"] == "2.0"
+        make_due()
+        thread, out = check("1.0")
+        assert "A newer version (2.0)" in out
+        assert "critical bug" in out
+        assert query.call_count == 3
+
+        # A failed check keeps the recorded result, and is not retried.
+        make_due()
+        query.side_effect = OSError("offline")
+        thread, out = check("1.1")
+        assert "A newer version (2.0)" in out
+        assert "critical bug" not in out
+        assert version_check._read_stamp(stamp)["version"] == "2.0"
+        assert check("1.1") == (None, "")
+
+        make_due()
+        monkeypatch.setenv("NO_ET", "1")
+        assert check("1.0") == (None, "")
+        assert query.call_count == 4
+
+
+def test_check_not_recorded_until_done(tmpdir, monkeypatch):
+    monkeypatch.delenv("NO_ET", raising=False)
+    stamp = str(tmpdir.join("version-check"))
+    started, proceed = threading.Event(), threading.Event()
+
+    def query():
+        started.set()
+        proceed.wait()
+        return {"version": "2.0", "bad_versions": []}
+
+    with (
+        patch.object(version_check, "get_stamp_path", return_value=stamp),
+        patch.object(version_check, "_query_latest", side_effect=query),
+    ):
+        thread = version_check.check_available_version("1.0")
+        started.wait()
+        # Until the check completes, it would be started again.
+        assert not os.path.exists(stamp)
+        proceed.set()
+        thread.join()
+        assert version_check._read_stamp(stamp) == {"version": "2.0", "bad_versions": []}
@@ -0,0 +1,129 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Check whether a more recent version of ReproMan is available.
+
+The latest version is queried with etelemetry, which queries a web service,
+at most once a day.  The query runs in a background thread, so that it does
+not delay a command, and the result is recorded in the cache directory once
+it completes.  It is reported by the next command that is due for a check,
+as the command which started it may be done before it completes.  As with
+etelemetry itself, setting the NO_ET environment variable disables it.
+"""
+
+import atexit
+import json
+import logging
+import os
+import os.path as op
+import threading
+import time
+
+lgr = logging.getLogger("reproman.version_check")
+
+# Number of seconds between two checks
+CHECK_INTERVAL = 24 * 60 * 60
+# Number of seconds to wait at exit for a check to complete
+EXIT_TIMEOUT = 1
+
+
+def get_stamp_path():
+    from reproman import cfg
+
+    return op.join(cfg.dirs.user_cache_dir, "version-check")
+
+
+def _read_stamp(stamp):
+    """Return the latest version info recorded in `stamp` by the last check"""
+    try:
+        with open(stamp) as fh:
+            latest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return latest if isinstance(latest, dict) else {}
+
+
+def _query_latest():
+    # OPT: etelemetry imports requests, which is slow to import.
+    import etelemetry
+
+    project = etelemetry.get_project("repronim/reproman") or {}
+    return {"version": project.get("version"), "bad_versions": project.get("bad_versions") or []}
+
+
+def _check(stamp):
+    """Query the latest version and record it in `stamp`."""
+    try:
+        latest = _query_latest()
+    except Exception as exc:
+        lgr.debug("Failed to check for a more recent version available with etelemetry: %s", exc)
+        # Keep the result of the last successful check, but don't retry
+        # (e.g., when offline) with every command.
+        latest = _read_stamp(stamp)
+    try:
+        os.makedirs(op.dirname(stamp), exist_ok=True)
+        tmp = "{}.{}".format(stamp, os.getpid())
+        with open(tmp, "w") as fh:
+            json.dump(latest, fh)
+        os.replace(tmp, stamp)
+    except OSError as exc:
+        lgr.debug("Could not record the check for a more recent version: %s", exc)
+
+
+def _report(version, latest):
+    """Report if `latest`, a recorded check result, is more recent than `version`."""
+    from packaging.version import InvalidVersion
+    from packaging.version import Version
+
+    try:
+        current = Version(version)
+        newer = latest.get("version") and Version(latest["version"]) > current
+        bad = any(current == Version(v) for v in latest.get("bad_versions", []))
+    except (InvalidVersion, TypeError) as exc:
+        lgr.debug("Not reporting recorded version check %s: %s", latest, exc)
+        return
+    if newer:
+        lgr.warning(
+            "A newer version (%s) of ReproMan is available. You are using %s",
+            latest["version"],
+            version,
+        )
+    if bad:
+        lgr.warning(
+            "You are using a version of ReproMan with a critical bug. "
+            "Please use a different version."
+        )
+
+
+def _wait(thread):
+    thread.join(EXIT_TIMEOUT)
+
+
+def check_available_version(version):
+    """Start checking for a version more recent than `version`, if due.
+
+    The result of the previous check, if any, is reported right away.
+
+    Returns
+    -------
+    The thread doing the check, or None if it was not due.
+    """
+    if os.environ.get("NO_ET"):
+        return None
+    stamp = get_stamp_path()
+    try:
+        if time.time() - op.getmtime(stamp) < CHECK_INTERVAL:
+            return None
+    except OSError:
+        pass  # Never checked
+    _report(version, _read_stamp(stamp))
+    thread = threading.Thread(target=_check, args=(stamp,), daemon=True)
+    thread.start()
+    # Give a check started by a short command a chance to complete, instead
+    # of being retried by the next one.
+    atexit.register(_wait, thread)
+    return thread
@@ -80,12 +80,28 @@ def test_no_heavy_imports():
 
     # new modules brought by import of our .api
     modules = get_modules(", reproman.api").difference(modules0)
-    # TODO: add back whenever/if https://github.com/sensein/etelemetry-client/issues/29
-    # is properly addressed
-    # assert 'requests' not in modules
-    # assert len(modules) < 230  # currently 203
+    # etelemetry (and requests) are imported only by the command line interface
+    assert "requests" not in modules
+    assert "etelemetry" not in modules
+    # as are the interfaces, which get imported when used
+    assert not [m for m in modules if m.startswith("reproman.interface.")]
     assert "boto" not in modules
     assert "jinja2" not in modules
     assert "paramiko" not in modules
     # and catch it all!  Raise the boundary as needed
     assert len(modules) < 600  # currently could be 508 with requests due to etelemetry
+
+
+def test_import_time():
+    # Budget, in microseconds, for the import of reproman.api, as reported
+    # by -X importtime.  Currently about 100 ms on a developer machine.
+    budget = 1000000
+    out, err = Runner().run(
+        [sys.executable, "-X", "importtime", "-c", "import reproman.api"], expect_stderr=True
+    )
+    times = {}
+    for line in err.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    assert times["reproman"] + times["reproman.api"] < budget
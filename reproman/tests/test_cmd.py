@@ -161,6 +161,53 @@ def test_runner_log_stdout():
             eq_(cml.out, "")
 
 
+def test_runner_log_online():
+    runner = Runner()
+    # Lots of stderr while nothing comes on stdout must not block
+    cmd = [
+        sys.executable,
+        "-c",
+        "import sys; sys.stderr.write('e' * 1000000 + '\\n'); print('out1'); print('out2')",
+    ]
+    lines = []
+    with swallow_logs(new_level=logging.DEBUG) as cml:
+        out, err = runner.run(
+            cmd, log_online=True, expect_stderr=True, stdout_callback=lines.append
+        )
+        assert_in("stdout| out1", cml.lines)
+    eq_(out, "out1\nout2\n")
+    eq_(len(err), 1000001)
+    eq_(lines, ["out1\n", "out2\n"])
+
+
+def test_runner_log_online_max_output_size():
+    runner = Runner()
+    cmd = [sys.executable, "-c", "for i in range(1000): print(i)"]
+    out, err = runner.run(cmd, log_online=True, max_output_size=8)
+    eq_(out, "998\n999\n")
+    eq_(err, "")
+
+
+def test_runner_log_online_max_output_size_multibyte():
+    runner = Runner()
+    cmd = [sys.executable, "-c", 'print("\u00e9" * 10)']
+    # The last 4 bytes start within an encoded character, which is dropped.
+    out, _ = runner.run(cmd, log_online=True, max_output_size=4)
+    eq_(out, "\u00e9\n")
+
+
+def test_runner_log_online_long_line():
+    runner = Runner()
+    lines = []
+    cmd = [sys.executable, "-c", 'print("x" * 200000); print("end")']
+    out, _ = runner.run(cmd, log_online=True, max_output_size=10, stdout_callback=lines.append)
+    eq_(out, "xxxxx\nend\n")
+    # The long line is passed on in pieces rather than held whole.
+    assert len(lines) > 2
+    assert max(map(len, lines)) < 200000
+    eq_("".join(lines), "x" * 200000 + "\nend\n")
+
+
 @with_tempfile
 def test_link_file_load(tempfile=None):
     tempfile2 = tempfile + "_"
@@ -14,7 +14,9 @@ from unittest.mock import patch
 import pytest
 
 import reproman
+from ..cmdline.main import _get_requested_command
 from ..cmdline.main import main
+from ..cmdline.main import setup_parser
 from .utils import assert_equal, in_, ok_startswith
 
 
@@ -80,6 +82,32 @@ def test_help_np():
     )
 
 
+@pytest.mark.parametrize(
+    "args,command",
+    [
+        (["ls"], "ls"),
+        (["-l", "debug", "-C", "ls", "jobs", "ls"], "jobs"),
+        (["--log-level=debug", "jobs"], "jobs"),
+        (["--help", "ls"], None),
+        (["@args"], None),
+        (["nonsense"], None),
+        ([], None),
+    ],
+)
+def test_get_requested_command(args, command):
+    assert _get_requested_command(args, ["ls", "jobs"]) == command
+
+
+def test_setup_parser_requested_command():
+    parser = setup_parser(cmdlineargs=["ls"])
+    assert parser.parse_args(["ls"]).func
+    # Other commands are not known.
+    with patch("sys.stderr", new_callable=StringIO):
+        with pytest.raises(SystemExit):
+            parser.parse_args(["jobs"])
+    assert setup_parser().parse_args(["jobs"]).func
+
+
 # MJT - This test incorrectly tests how the create, ls, install, etc. commands
 # work as they now prompt for missing args rather than display a usage message.
 # def test_usage_on_insufficient_args():
@@ -55,6 +55,10 @@ from ..utils import parse_semantic_version
 from ..utils import merge_dicts
 from ..utils import write_update
 from ..utils import pycache_source
+from ..utils import iter_tar_chunks
+from ..utils import ChunksReader
+from ..utils import iter_concurrently
+from ..utils import report_progress
 
 from .utils import ok_, eq_, assert_false, assert_equal, assert_true
 
@@ -548,6 +552,14 @@ def test_pathroot():
     assert proot("/root/x/child_root") == "/root/x/child_root"
 
 
+def test_pathroot_candidates():
+    proot = PathRoot(lambda s: s.endswith("root"))
+    assert proot.candidates(["/a/b", "/a/c", "/d"]) == ["/a/b", "/a", "/a/c", "/d"]
+    assert proot("/a/b") is None
+    # Paths with a known root aren't candidates anymore.
+    assert proot.candidates(["/a/b/e", "/a/c"]) == ["/a/b/e", "/a/c"]
+
+
 def test_is_subpath(tmpdir):
     tmpdir = str(tmpdir)
 
@@ -674,6 +686,30 @@ def test_pycache_source(case):
     assert pycache_source(case["value"]) == case["expected"]
 
 
+def test_iter_tar_chunks(tmpdir):
+    import tarfile
+
+    src = tmpdir.mkdir("src")
+    src.join("small").write("small content")
+    src.mkdir("sub").join("big").write_binary(os.urandom(100000))
+    os.link(str(src.join("small")), str(src.join("sub", "link")))
+
+    chunks = list(iter_tar_chunks(str(src), arcname="dest", chunk_size=4096))
+    assert max(map(len, chunks)) <= 4096
+    assert sum(map(len, chunks)) % tarfile.BLOCKSIZE == 0
+
+    progress = []
+    reader = ChunksReader(report_progress(iter(chunks), progress.append))
+    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+        tar.extractall(str(tmpdir))
+    reader.read()
+    assert progress[-1] == sum(map(len, chunks))
+    dest = tmpdir.join("dest")
+    assert dest.join("small").read() == "small content"
+    assert dest.join("sub", "big").read_binary() == src.join("sub", "big").read_binary()
+    assert dest.join("sub", "link").read() == "small content"
+
+
 def test_line_profile():
     pytest.importorskip("line_profiler")
 
@@ -691,3 +727,35 @@ def test_line_profile():
 # NOTE: test_line_profile must be the last one in the file
 #       since line_profiler obscures the coverage reports.
 #       So add any new test above it
+
+
+def test_iter_concurrently():
+    def fn(x):
+        if x == 2:
+            raise ValueError(x)
+        return x * 10
+
+    results = sorted(iter_concurrently(fn, range(5), max_workers=2), key=itemgetter(0))
+    assert [(x, r) for x, r, _ in results] == [(0, 0), (1, 10), (2, None), (3, 30), (4, 40)]
+    assert isinstance(results[2][2], ValueError)
+    assert not list(iter_concurrently(fn, []))
+
+
+def test_iter_concurrently_timeout():
+    import threading
+
+    release = threading.Event()
+
+    def fn(x):
+        if x == "hang":
+            release.wait(5)
+        return x
+
+    try:
+        # The hanging call doesn't hold up the other items, even with a
+        # single worker.
+        results = list(iter_concurrently(fn, ["hang", "a", "b"], max_workers=1, timeout=0.2))
+    finally:
+        release.set()
+    assert [(x, r) for x, r, _ in results] == [("hang", None), ("a", "a"), ("b", "b")]
+    assert isinstance(results[0][2], TimeoutError)
@@ -40,6 +40,10 @@ import tempfile
 import platform
 import gc
 import glob
+import io
+import tarfile
+import queue
+import threading
 
 import attr
 from functools import wraps
@@ -1381,6 +1385,28 @@ class PathRoot(object):
             self._cache[pth] = root
         return root
 
+    def candidates(self, paths):
+        """Return the paths that the predicate may be called on to find roots.
+
+        Paths whose root is already known are excluded.  This allows to
+        prefetch whatever the predicate needs for all of `paths` at once.
+
+        Parameters
+        ----------
+        paths : iterable of str
+
+        Returns
+        -------
+        list of str
+        """
+        found = {}
+        for path in paths:
+            for pth in self._walk_up(path):
+                if pth in self._cache or pth in found:
+                    break
+                found[pth] = None
+        return list(found)
+
     @staticmethod
     def _walk_up(path):
         """Yield PATH, chopping off the right-most directory each iteration.
@@ -1549,4 +1575,176 @@ def pycache_source(path):
     return pyfile
 
 
+# Size of the chunks tar archives are streamed in
+TAR_CHUNK_SIZE = 2 * 1024 * 1024
+
+
+def iter_tar_chunks(path, arcname=None, chunk_size=TAR_CHUNK_SIZE):
+    """Generate a tar archive of `path` chunk by chunk
+
+    Unlike with `tarfile.TarFile.add`, the archive is never held in memory
+    as a whole: content of files is read only as the chunks are consumed.
+
+    Parameters
+    ----------
+    path : str
+        File or directory (added recursively) to archive.
+    arcname : str, optional
+        Name of `path` in the archive.  Defaults to the base name of `path`.
+    chunk_size : int, optional
+        Maximum size of the chunks files are read in.
+
+    Yields
+    ------
+    bytes
+    """
+    if arcname is None:
+        arcname = op.basename(op.normpath(path))
+    # Used only to create members, which also keeps track of hard links
+    tar = tarfile.TarFile(fileobj=io.BytesIO(), mode="w")
+
+    def add(name, arcname):
+        info = tar.gettarinfo(name, arcname)
+        if info is None:
+            lgr.warning("Not adding unsupported file type to the archive: %s", name)
+            return
+        yield info.tobuf(tar.format, tar.encoding, tar.errors)
+        if info.isreg():
+            size = 0
+            with open(name, "rb") as f:
+                while size < info.size:
+                    chunk = f.read(min(chunk_size, info.size - size))
+                    if not chunk:
+                        raise OSError("%s got truncated while being archived" % name)
+                    size += len(chunk)
+                    yield chunk
+            if size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+        elif info.isdir():
+            for f in sorted(os.listdir(name)):
+                yield from add(op.join(name, f), op.join(arcname, f))
+
+    yield from add(path, arcname)
+    # End of archive marker
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+class ChunksReader(io.RawIOBase):
+    """Read-only file object over an iterable of bytes chunks
+
+    It allows to consume a stream of chunks (e.g., from `iter_tar_chunks` or
+    an HTTP response) with code expecting a file object without joining them.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
+def report_progress(chunks, callback):
+    """Pass through `chunks`, calling `callback` with the number of bytes so far
+
+    If `callback` is None, `chunks` are returned as is.
+    """
+    if callback is None:
+        return chunks
+
+    def gen():
+        nbytes = 0
+        for chunk in chunks:
+            nbytes += len(chunk)
+            callback(nbytes)
+            yield chunk
+
+    return gen()
+
+
+def iter_concurrently(fn, items, max_workers=None, timeout=None):
+    """Call `fn` on each of `items` in threads, yielding results as they come
+
+    Parameters
+    ----------
+    fn : callable
+        Called with a single item.
+    items : iterable
+    max_workers : int, optional
+        Maximum number of calls running at once.  Defaults to the number of
+        items.
+    timeout : float, optional
+        Give up on a call that has been running for more than this many
+        seconds.  Its thread is left to finish in the background (without
+        preventing the process from exiting), and another one takes over the
+        remaining items.
+
+    Yields
+    ------
+    (item, result, exception) tuples in the order the calls finish.  For a
+    call that raised an exception (TimeoutError if it was given up on),
+    result is None.
+    """
+    items = list(items)
+    todo = queue.Queue()
+    for i, item in enumerate(items):
+        todo.put(i)
+    done = queue.Queue()
+    started = {}
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            try:
+                i = todo.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                started[i] = time.monotonic()
+            try:
+                done.put((i, fn(items[i]), None))
+            except Exception as exc:
+                done.put((i, None, exc))
+
+    def start_worker():
+        threading.Thread(target=work, daemon=True, name="reproman-worker").start()
+
+    for _ in range(min(max_workers or len(items), len(items))):
+        start_worker()
+
+    pending = set(range(len(items)))
+    while pending:
+        wait = None
+        if timeout is not None:
+            with lock:
+                starts = [started[i] for i in pending if i in started]
+            if starts:
+                wait = max(min(starts) + timeout - time.monotonic(), 0)
+        try:
+            i, result, exc = done.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            with lock:
+                expired = [i for i in pending if i in started and now - started[i] >= timeout]
+            for i in sorted(expired):
+                pending.discard(i)
+                start_worker()
+                yield items[i], None, TimeoutError("Timed out after {} seconds".format(timeout))
+            continue
+        if i in pending:
+            pending.discard(i)
+            yield items[i], result, exc
+
+
 lgr.log(5, "Done importing reproman.utils")